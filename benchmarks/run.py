@@ -0,0 +1,231 @@
+''' Benchmark of every route of the auth and prescriptions blueprints
+
+The app is built with create_app(test_config=...) over a local SQLite database seeded by flask seed with --patients
+patients and about --prescriptions prescriptions per patient (the database is kept between runs, use --reseed to build it
+again). Every scenario of benchmarks/scenarios.py sends --requests requests from --concurrency threads, and the
+report has the throughput, the p50/p95/p99 latency and the SQL statements per request.
+
+The requests go through the test client, in process: the numbers include the app and the database but not
+the HTTP server nor the network.
+
+    python -m benchmarks.run --patients 2000 --prescriptions 20 --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+With --compare the run is compared with a saved one, a scenario that is slower (p95) or has less throughput than
+--threshold, or that runs more SQL statements per request, is reported as a regression and the exit code is 1.
+'''
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.scenarios import DOMAIN, PASSWORD, SCENARIOS, Context
+from src import create_app
+from src.commands.seed import seed as seed_database
+from src.database import db
+from src.models.patient import Patient
+from src.models.prescription import Prescription
+from src.utils.sqltrace import OBSERVERS
+
+# Statements run by the thread of the current request
+_statements = threading.local()
+
+
+def _count_statement(statement, parameters, seconds):
+    _statements.count = getattr(_statements, 'count', 0) + 1
+
+
+def build_app(args):
+    """The app of the benchmark, without rate limits and with the query budgets enabled"""
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(args.database)}',
+        'JWT_SECRET_KEY': 'benchmark-secret-key-that-is-long-enough',
+        'SCHEMA_AUTO_UPGRADE': True,
+        'RATELIMIT_ENABLED': False,
+        'QUERY_BUDGET_ENABLED': True,
+        'PASSWORD_HASH_METHOD': args.hash_method,
+        'PASSWORD_POOL_QUEUE_DEPTH': 4 * args.concurrency,
+        'CHANGES_SETTLE_SECONDS': 0,
+    })
+
+
+def seed(app, args):
+    """Seed the database with flask seed (src/commands/seed.py) if it is empty
+
+    Returns:
+        tuple: The ids of the patients, their emails, the ids of the prescriptions by patient and the id of the administrator
+    """
+    with app.app_context():
+        if db.session.query(Patient.id).first() is None:
+            print(f'Seeding {args.patients} patients with ~{args.prescriptions} prescriptions each...', file=sys.stderr)
+            seed_database(args.patients, args.prescriptions, distribution='exponential', body_size=args.body_size,
+                          password=PASSWORD, prefix='patient', domain=DOMAIN, random_seed=args.seed,
+                          echo=lambda message: print(message, file=sys.stderr))
+
+        seeded = db.session.query(Patient.id, Patient.email).filter(Patient.email.like(f'%@{DOMAIN}'),
+                                                                   Patient.username.like('patient%')) \
+            .order_by(Patient.id).all()
+        patients = [row.id for row in seeded]
+        if not patients:
+            raise SystemExit(f'error: {args.database} has no seeded patients, run again with --reseed and --patients 1 or more')
+        emails = {row.id: row.email for row in seeded}
+        Patient.query.filter_by(id=patients[0]).update({'is_admin': True})
+        db.session.commit()
+        prescriptions = {}
+        for user_id, id in db.session.query(Prescription.user_id, Prescription.id).filter(Prescription.user_id.in_(patients[:200])):
+            prescriptions.setdefault(user_id, []).append(id)
+        return patients, emails, prescriptions, patients[0]
+
+
+def percentile(values:list, percent:float) -> float:
+    """Nearest rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    # The smallest value with at least percent % of the values at or below it
+    index = max(0, min(len(values) - 1, math.ceil(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def run_scenario(app, context, scenario, args) -> dict:
+    """Send the requests of a scenario from many threads and measure them"""
+    latencies, statements, errors = [], [], []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(index):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        _statements.count = 0
+        started = time.perf_counter()
+        try:
+            response = scenario(client, context, index)
+            if response is None:
+                return
+            # The body is read, the streamed responses are generated here
+            response.get_data()
+            status = response.status_code
+        except Exception as e:
+            status = repr(e)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statements.append(_statements.count)
+            # Every scenario expects a success, a 4xx is an error of the scenario or of the route
+            if not isinstance(status, int) or not 200 <= status < 300:
+                errors.append(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries': sum(statements) / len(statements) if statements else 0.0,
+        'first_error': str(errors[0]) if errors else None,
+    }
+
+
+def compare(results:dict, baseline:dict, threshold:float) -> list:
+    """The regressions of a run against a baseline
+
+    Returns:
+        list: A message per regression
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        # A couple of milliseconds is noise on a laptop
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold) and result['p95_ms'] - before['p95_ms'] > 2:
+            regressions.append(f'{name}: p95 {before["p95_ms"]:.1f} ms -> {result["p95_ms"]:.1f} ms')
+        if result['throughput'] < before['throughput'] * (1 - threshold):
+            regressions.append(f'{name}: throughput {before["throughput"]:.0f} -> {result["throughput"]:.0f} req/s')
+        # The number of statements does not depend on the machine, any increase is a change of the code
+        if result['queries'] > before['queries'] + 0.5:
+            regressions.append(f'{name}: queries per request {before["queries"]:.1f} -> {result["queries"]:.1f}')
+        if result['errors'] and not before['errors']:
+            regressions.append(f'{name}: {result["errors"]} errors, first one: {result["first_error"]}')
+    return regressions
+
+
+def print_report(results:dict):
+    print(f'{"scenario":<15} {"requests":>8} {"errors":>6} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8}')
+    for name, result in results.items():
+        print(f'{name:<15} {result["requests"]:>8} {result["errors"]:>6} {result["throughput"]:>9.1f} '
+              f'{result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} {result["p99_ms"]:>9.2f} {result["queries"]:>8.1f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the routes of the API')
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), 'prescription-benchmark.db'))
+    parser.add_argument('--reseed', action='store_true', help='Remove the database and seed it again')
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--prescriptions', type=int, default=20, help='Mean number of prescriptions per patient')
+    parser.add_argument('--body-size', type=int, default=200, help='Mean size of the bodies of the prescriptions')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random data')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--hash-method', default='pbkdf2:sha256', help='Password hash method of the app and the seed')
+    parser.add_argument('--only', nargs='*', help='Run only these scenarios')
+    parser.add_argument('--save', help='Save the results as json, to be used later with --compare')
+    parser.add_argument('--compare', help='Baseline saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative change reported as a regression')
+    parser.add_argument('--verbose', action='store_true', help='Show the warnings of the app (slow statements, N+1)')
+    args = parser.parse_args(argv)
+
+    if args.reseed:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+
+    app = build_app(args)
+    if not args.verbose:
+        app.logger.setLevel(logging.ERROR)
+    patients, emails, prescriptions, admin_id = seed(app, args)
+    context = Context(app, patients, emails, prescriptions, admin_id, args.requests)
+    if _count_statement not in OBSERVERS:
+        OBSERVERS.append(_count_statement)
+
+    covered = {endpoint for endpoint, _ in SCENARIOS.values()}
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.split('.')[0] in ('auth', 'prescriptions') and rule.endpoint not in covered:
+            print(f'warning: {rule.endpoint} has no scenario', file=sys.stderr)
+
+    results = {}
+    for name, (endpoint, scenario) in SCENARIOS.items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = run_scenario(app, context, scenario, args)
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
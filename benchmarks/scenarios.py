@@ -0,0 +1,190 @@
+''' The requests of the benchmark, at least one for every route of the auth and prescriptions blueprints
+
+Every scenario is a function (client, context, index) that sends one request and returns the response,
+index is the number of the request inside the scenario, so every request can use other patient or other row.
+'''
+import itertools
+import random
+import threading
+
+from flask_jwt_extended import create_access_token, create_refresh_token
+
+# The titles of the seeded prescriptions, the search looks for them
+from src.commands.seed import DRUGS
+
+# Password and domain of the emails of the seeded patients
+PASSWORD = 'benchmark1'
+DOMAIN = 'bench.test'
+
+
+class Context:
+    """What the scenarios need: tokens of the seeded patients and rows they can read, edit or delete
+
+    Args:
+        app (Flask): The application
+        patients (list): Ids of the seeded patients
+        emails (dict): patient id -> its email
+        prescriptions (dict): patient id -> ids of its prescriptions
+        admin_id (int): Id of a patient that is administrator
+        requests (int): Number of requests of every scenario, tokens and rows are prepared for all of them
+    """
+
+    def __init__(self, app, patients:list, emails:dict, prescriptions:dict, admin_id:int, requests:int):
+        self.app = app
+        self.patients = patients
+        self.prescriptions = prescriptions
+        self.emails = emails
+        self.run = random.randrange(1 << 30)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        # The patients used by the scenarios, the ones that have prescriptions
+        users = [patient for patient in patients if prescriptions.get(patient)][:max(1, min(200, requests))]
+        self.users = users
+        with app.test_request_context():
+            self.access = {user: create_access_token(identity=user) for user in users}
+            self.refresh = {user: create_refresh_token(identity=user) for user in users}
+            self.admin = create_access_token(identity=admin_id, additional_claims={'admin': True})
+            # logout revokes the token, so every request needs its own
+            self.disposable = [create_access_token(identity=users[index % len(users)]) for index in range(requests)]
+
+        # The rows deleted by the benchmark, one per request, never read by the other scenarios
+        self.deletable = []
+        for user in users:
+            ids = prescriptions[user]
+            if len(ids) > 1:
+                self.deletable.append((user, ids.pop()))
+
+    def user(self, index:int) -> int:
+        return self.users[index % len(self.users)]
+
+    def headers(self, user:int) -> dict:
+        return {'Authorization': f'Bearer {self.access[user]}'}
+
+    def prescription(self, index:int) -> tuple:
+        """A patient and one of its prescriptions"""
+        user = self.user(index)
+        ids = self.prescriptions[user]
+        return user, ids[index % len(ids)]
+
+    def unique(self) -> str:
+        """A value that is not repeated in this run, for usernames and emails"""
+        with self._lock:
+            return f'{self.run}x{next(self._counter)}'
+
+
+def register(client, context, index):
+    name = context.unique()
+    return client.post('/api/v1/auth/register',
+                       json={'username': f'b{name}', 'email': f'b{name}@bench.test', 'password': PASSWORD})
+
+
+def login(client, context, index):
+    return client.post('/api/v1/auth/login', json={'email': context.emails[context.user(index)], 'password': PASSWORD})
+
+
+def me(client, context, index):
+    return client.get('/api/v1/auth/me', headers=context.headers(context.user(index)))
+
+
+def refresh(client, context, index):
+    token = context.refresh[context.user(index)]
+    return client.get('/api/v1/auth/token/refresh', headers={'Authorization': f'Bearer {token}'})
+
+
+def logout(client, context, index):
+    token = context.disposable[index % len(context.disposable)]
+    return client.post('/api/v1/auth/logout', headers={'Authorization': f'Bearer {token}'})
+
+
+def revoke(client, context, index):
+    return client.post('/api/v1/auth/revoke', json={'jti': f'bench-{context.unique()}'},
+                       headers={'Authorization': f'Bearer {context.admin}'})
+
+
+def import_patients(client, context, index):
+    names = [context.unique() for _ in range(10)]
+    return client.post('/api/v1/auth/import',
+                       json={'patients': [{'username': f'i{name}', 'email': f'i{name}@bench.test', 'password': PASSWORD}
+                                          for name in names]},
+                       headers={'Authorization': f'Bearer {context.admin}'})
+
+
+def list_page(client, context, index):
+    # The first page, a later one is a 404 for the patients with few prescriptions
+    return client.get('/api/v1/prescription/?page=1&per_page=10', headers=context.headers(context.user(index)))
+
+
+def list_cursor(client, context, index):
+    return client.get('/api/v1/prescription/?limit=20&fields=id,title', headers=context.headers(context.user(index)))
+
+
+def list_filtered(client, context, index):
+    return client.get('/api/v1/prescription/?limit=20&sort=-expedition_date&expedition_from=2000-01-01',
+                      headers=context.headers(context.user(index)))
+
+
+def create(client, context, index):
+    return client.post('/api/v1/prescription/', json={'title': random.choice(DRUGS), 'body': 'cada 8 horas'},
+                       headers=context.headers(context.user(index)))
+
+
+def bulk(client, context, index):
+    user, id = context.prescription(index)
+    operations = [{'op': 'create', 'title': random.choice(DRUGS), 'body': 'bulk'} for _ in range(5)]
+    operations.append({'op': 'update', 'id': id, 'body': 'cada 12 horas'})
+    return client.post('/api/v1/prescription/bulk', json={'operations': operations}, headers=context.headers(user))
+
+
+def export(client, context, index):
+    return client.get('/api/v1/prescription/export?format=ndjson', headers=context.headers(context.user(index)))
+
+
+def search(client, context, index):
+    return client.get(f'/api/v1/prescription/search?q={DRUGS[index % len(DRUGS)][:5]}&limit=10',
+                      headers=context.headers(context.user(index)))
+
+
+def changes(client, context, index):
+    return client.get('/api/v1/prescription/changes?limit=50', headers=context.headers(context.user(index)))
+
+
+def get_prescription(client, context, index):
+    user, id = context.prescription(index)
+    return client.get(f'/api/v1/prescription/{id}', headers=context.headers(user))
+
+
+def edit(client, context, index):
+    user, id = context.prescription(index)
+    return client.put(f'/api/v1/prescription/{id}', json={'title': random.choice(DRUGS), 'body': 'editada'},
+                      headers=context.headers(user))
+
+
+def delete(client, context, index):
+    if index >= len(context.deletable):
+        return None
+    user, id = context.deletable[index]
+    return client.delete(f'/api/v1/prescription/{id}', headers=context.headers(user))
+
+
+# name -> (endpoint, scenario), the benchmark warns about the routes of the blueprints that have no scenario
+SCENARIOS = {
+    'register': ('auth.register', register),
+    'login': ('auth.login', login),
+    'me': ('auth.me', me),
+    'refresh': ('auth.refresh_users_token', refresh),
+    'logout': ('auth.logout', logout),
+    'revoke': ('auth.revoke_token', revoke),
+    'import': ('auth.import_patients', import_patients),
+    'list page': ('prescriptions.handle_prescriptions', list_page),
+    'list cursor': ('prescriptions.handle_prescriptions', list_cursor),
+    'list filtered': ('prescriptions.handle_prescriptions', list_filtered),
+    'create': ('prescriptions.handle_prescriptions', create),
+    'bulk': ('prescriptions.bulk_prescriptions', bulk),
+    'export': ('prescriptions.export_prescriptions', export),
+    'search': ('prescriptions.search_prescriptions', search),
+    'changes': ('prescriptions.prescription_changes', changes),
+    'get': ('prescriptions.get_prescription', get_prescription),
+    'edit': ('prescriptions.edit_prescription', edit),
+    'delete': ('prescriptions.delete_prescription', delete),
+}
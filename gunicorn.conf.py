@@ -0,0 +1,62 @@
+'''
+Configuration of gunicorn for production, every value can be changed with an environment variable:
+
+gunicorn -c gunicorn.conf.py
+
+GUNICORN_BIND                   address, 0.0.0.0:8000 by default
+GUNICORN_WORKERS                worker processes, 2 per CPU + 1 by default
+GUNICORN_THREADS                threads per worker, with more than 1 the workers are gthread
+GUNICORN_TIMEOUT                seconds a worker can spend in a request before it is killed
+GUNICORN_GRACEFUL_TIMEOUT       seconds the workers have to finish their requests on a reload or a stop
+GUNICORN_MAX_REQUESTS           requests after which a worker is replaced (0 = never), with a random jitter
+GUNICORN_PRELOAD                "1" (default) creates the app once in the master and forks it
+PROXY_FIX_X_FOR                 proxies in front of gunicorn whose X-Forwarded-For is trusted, 1 by default (a load
+                                balancer), 0 when the clients connect to gunicorn directly
+
+Reloads without dropping requests:
+    kill -HUP <master>      new workers are started and the old ones finish their requests (graceful_timeout).
+                            With the preload the code is not reloaded, the new workers are forks of the same app.
+    kill -USR2 <master>     starts a new master with the new code, then kill -TERM the old master.
+
+The app is preloaded in the master (src/wsgi.py closes its connections) and every worker forgets the
+connections of its parent after the fork, see post_fork.
+'''
+import multiprocessing
+import os
+
+wsgi_app = 'src.wsgi:app'
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# The requests wait on the database and on the password hashing, so there are more workers than CPUs
+workers = int(os.environ.get('GUNICORN_WORKERS', 2 * multiprocessing.cpu_count() + 1))
+# The app reads it (SERVER_WORKERS), for example the in-process cache is not shared by the workers
+os.environ['GUNICORN_WORKERS'] = str(workers)
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Workers are replaced from time to time, so a leak can not grow forever, the jitter avoids replacing all of them together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Behind a load balancer every request comes from its address, the app takes the client from X-Forwarded-For
+os.environ.setdefault('PROXY_FIX_X_FOR', '1')
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Every worker opens its own database connections"""
+    if not preload_app:
+        return
+    from src.database import dispose_engines
+    from src.wsgi import app
+    dispose_engines(app, close=False)
+    server.log.info('Worker %s: database pools reset after fork', worker.pid)
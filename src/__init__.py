@@ -2,27 +2,86 @@
 # Create a flask application
 
 # Any configuration, registration, and other setup the application needs will happen inside the function, then the application will be returned.
+# We measure the imports of the app, they are the first phase of the boot
+import time
+_IMPORTS_STARTED = time.perf_counter()
+
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # For handling routes in the system directory
 import os
 
-# Import JWT library
-from flask_jwt_extended import JWTManager
+# Import JWT library, with a cache of verified tokens and a blocklist for the revoked ones
+from src.utils.tokens import CachingJWTManager, blocklist
 from src.constants.http_status_code import HTTP_404_NOT_FOUND, HTTP_500_INTERNAL_SERVER_ERROR
 
 # Import blueprints
 # it is necessary for files from folders use the full path, example: src.routes.auth 
 from src.routes.auth import auth
 from src.routes.prescriptions import prescriptions
-from .database import db
-# We import the models here in order to allow sqlalchemy to create all tables when start the application.
+from src.routes.health import health
+from .database import db, verify_schema
+# Options of the engine and its pool
+from src.config.database import SQLITE_PRAGMAS, describe_engine, engine_options
+# Commands for the migrations, flask db upgrade
+from src.commands.database import db_cli
+# Commands for the administrators, flask admin grant
+from src.commands.admin import admin_cli
+# Command for generating data for the capacity tests, flask seed
+from src.commands.seed import seed_command
+# We import the models here in order to allow sqlalchemy to know all the tables when start the application.
 from src.models.patient import Patient
 from src.models.prescription import Prescription
+from src.models.revoked_token import RevokedToken
+from src.models.prescription_tombstone import PrescriptionTombstone
+
+# Read-through cache
+from src.utils.cache import cache
+
+# Fast JSON provider
+from src.utils.json_provider import make_json_provider
+
+# Compression of the responses
+from src.utils.compression import compress
+
+# Password hashing pool
+from src.utils.passwords import passwords
+
+# Rate limits
+from src.utils.ratelimit import limiter
+
+# Group commit of the inserts
+from src.utils.groupcommit import group_commit
+
+# Latency and SQL metrics, GET /metrics
+from src.utils.metrics import metrics
+
+# Max size of the request bodies
+from src.utils.payload import payload_limits
+
+# Query budgets and N+1 detection, for development and tests
+from src.utils.querybudget import query_budget
+
+# Reads of the safe requests go to the read replica
+from src.utils.replica import replica_router
+
+# Swagger docs, flasgger is imported only when the docs are used (see SWAGGER_MODE)
+from src.utils.docs import api_docs
+# Command for building the static spec, flask docs build
+from src.commands.docs import docs_cli
+
+# Time of the boot of the app by phase
+from src.utils.boot import BootTimer
 
-# Libraries required by swagger
-from flasgger import Swagger, swag_from
-from src.config.swagger import template,swagger_config
+IMPORT_SECONDS = time.perf_counter() - _IMPORTS_STARTED
+
+def _optional_int(value):
+    # Empty environment variables mean "not set"
+    return int(value) if value else None
+
+def _optional_float(value):
+    return float(value) if value else None
 
 # Creater the app, it needs a text_config by default and you can set it as None
 def create_app(test_config=None):
@@ -32,6 +91,7 @@ def create_app(test_config=None):
     # package and hold local data that shouldn’t be committed to version control, such as configuration secrets and the database file.
     app = Flask(__name__,
                 instance_relative_config=True)
+    boot = BootTimer(app, imports=IMPORT_SECONDS)
     
     # Set default config, like a secret_key that will be used in order to keep data safe
     # Also, we import the JWT_SECRET_KEY
@@ -41,11 +101,92 @@ def create_app(test_config=None):
         SQLALCHEMY_DATABASE_URI = os.environ.get("SQLALCHEMY_DB_URI"),
         SQLALCHEMY_TRACK_MODIFICATIONS = False,
         JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY'),
+        # Apply the pending migrations when the app starts, only for development and tests
+        SCHEMA_AUTO_UPGRADE = os.environ.get('SCHEMA_AUTO_UPGRADE','0') == '1',
+        # Connection pool of the engine, empty values keep the defaults of SQLAlchemy (see src/config/database.py)
+        DB_POOL_SIZE = _optional_int(os.environ.get('DB_POOL_SIZE')),
+        DB_MAX_OVERFLOW = _optional_int(os.environ.get('DB_MAX_OVERFLOW')),
+        DB_POOL_TIMEOUT = _optional_int(os.environ.get('DB_POOL_TIMEOUT')),
+        DB_POOL_RECYCLE = _optional_int(os.environ.get('DB_POOL_RECYCLE')),
+        DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING','1') == '1',
+        # Max milliseconds of a statement, for postgres and mysql (0 = no limit)
+        DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0)),
+        # Pragmas of every SQLite connection, WAL mode by default
+        SQLITE_PRAGMAS = dict(SQLITE_PRAGMAS),
+        # Optional read replica, and the seconds a client reads from the primary after its own writes
+        SQLALCHEMY_BINDS = {'replica': os.environ['DB_REPLICA_URI']} if os.environ.get('DB_REPLICA_URI') else None,
+        REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 5)),
+        # Request metrics in the Prometheus format
+        METRICS_ENABLED = os.environ.get('METRICS_ENABLED','1') == '1',
+        METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics'),
+        # Query budgets of the routes ("1"/"0", by default only in debug and testing), slow statements and N+1
+        QUERY_BUDGET_ENABLED = os.environ['QUERY_BUDGET_ENABLED'] == '1' if os.environ.get('QUERY_BUDGET_ENABLED') else None,
+        QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', 100)),
+        QUERY_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_N_PLUS_ONE_THRESHOLD', 5)),
+        # Max number of operations in POST /prescription/bulk and how many of them are committed together (0 = all)
+        BULK_MAX_BATCH_SIZE = int(os.environ.get('BULK_MAX_BATCH_SIZE', 1000)),
+        BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 0)),
+        # Number of rows fetched from the database at a time by the export
+        EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 500)),
+        # Sync of the clients: only changes older than these seconds are sent (by default the timeouts of a write,
+        # see src/utils/changes.py), and days the tombstones are kept
+        CHANGES_SETTLE_SECONDS = _optional_float(os.environ.get('CHANGES_SETTLE_SECONDS')),
+        CHANGES_TOMBSTONE_DAYS = float(os.environ.get('CHANGES_TOMBSTONE_DAYS', 30)),
+        # Group commit of new prescriptions and registrations: max milliseconds a request waits for others and max rows
+        GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT_ENABLED','0') == '1',
+        GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get('GROUP_COMMIT_MAX_DELAY_MS', 5)),
+        GROUP_COMMIT_MAX_ROWS = int(os.environ.get('GROUP_COMMIT_MAX_ROWS', 100)),
+        # Max bytes of a request body (for the routes without their own limit, see src/utils/payload.py),
+        # max bytes of the body of a prescription and the size from which it is stored compressed (0 = never)
+        REQUEST_MAX_BYTES = int(os.environ.get('REQUEST_MAX_BYTES', 1024 * 1024)),
+        PRESCRIPTION_BODY_MAX_BYTES = int(os.environ.get('PRESCRIPTION_BODY_MAX_BYTES', 64 * 1024)),
+        PRESCRIPTION_BODY_COMPRESS_MIN_BYTES = int(os.environ.get('PRESCRIPTION_BODY_COMPRESS_MIN_BYTES', 0)),
+        # Max number of patients in POST /auth/import
+        IMPORT_MAX_BATCH_SIZE = int(os.environ.get('IMPORT_MAX_BATCH_SIZE', 1000)),
+        # Verified tokens kept in memory (0 disables it) and the Bloom filter of the revoked ones
+        JWT_VERIFY_CACHE_SIZE = int(os.environ.get('JWT_VERIFY_CACHE_SIZE', 10000)),
+        REVOCATION_BLOOM_CAPACITY = int(os.environ.get('REVOCATION_BLOOM_CAPACITY', 100000)),
+        REVOCATION_BLOOM_ERROR_RATE = float(os.environ.get('REVOCATION_BLOOM_ERROR_RATE', 0.001)),
+        REVOCATION_SYNC_INTERVAL = float(os.environ.get('REVOCATION_SYNC_INTERVAL', 5)),
+        # Seconds of revocations read again on every sync, for the commits that finish out of order
+        REVOCATION_SYNC_OVERLAP = float(os.environ.get('REVOCATION_SYNC_OVERLAP', 60)),
+        # Cache for single prescriptions and /auth/me: "lru", "null" or "package.module:Class"
+        CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'lru'),
+        CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        CACHE_TTL = float(os.environ.get('CACHE_TTL', 30)),
+        # Max seconds of the in-process cache when the app runs in several worker processes, they do not share it
+        CACHE_LOCAL_TTL = float(os.environ.get('CACHE_LOCAL_TTL', 1)),
+        # Worker processes of the server running the app (gunicorn.conf.py sets it)
+        SERVER_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1)),
+        # "orjson" (when it is installed) or "default" for the json module of the standard library
+        JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson'),
+        # Compression of the responses (gzip, and br/zstd when brotli/zstandard are installed)
+        COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED','1') == '1',
+        COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+        COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6)),
+        COMPRESS_BROTLI_LEVEL = int(os.environ.get('COMPRESS_BROTLI_LEVEL', 4)),
+        COMPRESS_ZSTD_LEVEL = int(os.environ.get('COMPRESS_ZSTD_LEVEL', 3)),
+        # Password hashing: werkzeug method with its cost, and the pool where it runs
+        PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+        PASSWORD_POOL_EXECUTOR = os.environ.get('PASSWORD_POOL_EXECUTOR', 'thread'),
+        PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', os.cpu_count() or 1)),
+        PASSWORD_POOL_QUEUE_DEPTH = int(os.environ.get('PASSWORD_POOL_QUEUE_DEPTH', 4 * (os.cpu_count() or 1))),
+        PASSWORD_POOL_TIMEOUT = float(os.environ.get('PASSWORD_POOL_TIMEOUT', 10)),
+        # Rate limits, the limits of every route can be overridden in RATELIMIT_ROUTES (instance config)
+        RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED','1') == '1',
+        RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE', 'memory'),
+        RATELIMIT_MAX_KEYS = int(os.environ.get('RATELIMIT_MAX_KEYS', 100000)),
+        # Proxies (load balancers) in front of the app whose X-Forwarded-For is trusted, the address of the client
+        # used by the rate limits is taken from it (0 = the app is reached directly, the header is ignored)
+        PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0)),
         
         SWAGGER = {
             'title':'Prescription API',
             'uiversion':3
-        }
+        },
+        # "eager", "lazy" (built on the first request), "static" (built by flask docs build) or "disabled"
+        SWAGGER_MODE = os.environ.get('SWAGGER_MODE', 'lazy'),
+        SWAGGER_STATIC_FILE = os.environ.get('SWAGGER_STATIC_FILE'),
     )
     
     if test_config is None:
@@ -55,20 +196,72 @@ def create_app(test_config=None):
         # Load the test config if passed in
         app.config.from_mapping(test_config)
     
-    # Registre db handler
-    db.app=app
+    # The address of the client is the one seen by the trusted proxies, not the address of the last proxy
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
+    # Serialize the responses with orjson when it is available
+    app.json = make_json_provider(app)
+    boot.mark('config')
+    
+    # Metrics first, so the time of the other hooks is measured too
+    metrics.init_app(app)
+    
+    # The size of the bodies is checked before any other hook can read them
+    payload_limits.init_app(app)
+    
+    # Registre db handler, with the options of the engine and the pool built from the config
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
-    db.create_all()
+    with app.app_context():
+        app.logger.info('Database engine: %s', describe_engine(db.engine, app.config['SQLALCHEMY_ENGINE_OPTIONS']))
+        if app.config.get('SQLALCHEMY_BINDS'):
+            for bind in app.config['SQLALCHEMY_BINDS']:
+                app.logger.info('Database engine %s: %s', bind,
+                                describe_engine(db.get_engine(app, bind), app.config['SQLALCHEMY_ENGINE_OPTIONS']))
+    # The tables are created by the migrations (flask db upgrade), here we only check the version
+    verify_schema(app)
+    boot.mark('database')
+    app.cli.add_command(db_cli)
+    app.cli.add_command(admin_cli)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(docs_cli)
+    
+    # Cache for single prescriptions and patients
+    cache.init_app(app)
+    
+    # Pool for hashing and checking passwords
+    passwords.init_app(app)
+    
+    # Writer thread for the group commit
+    group_commit.init_app(app)
     
     # We implement JWTManager in app
-    JWTManager(app)
+    jwt = CachingJWTManager(app)
+    blocklist.init_app(app, jwt)
+    
+    # Rate limits of the routes
+    limiter.init_app(app)
+    
+    # Budgets of SQL statements of the routes
+    query_budget.init_app(app)
+    
+    # Send the reads of the safe requests to the replica
+    replica_router.init_app(app)
+    boot.mark('extensions')
     
     # Registre blueprints
     app.register_blueprint(auth)
     app.register_blueprint(prescriptions)
+    app.register_blueprint(health)
+    
+    # Compress the big responses
+    compress.init_app(app)
+    boot.mark('blueprints')
     
     # Set swagger
-    Swagger(app, config=swagger_config, template=template)
+    api_docs.init_app(app)
+    boot.mark('docs')
     
     # Configure error handling for not found error
     @app.errorhandler(HTTP_404_NOT_FOUND)
@@ -80,6 +273,7 @@ def create_app(test_config=None):
     def handle_500(e):
         return {'error':'Something went wrong, we are working on it'},HTTP_500_INTERNAL_SERVER_ERROR
     
+    boot.report()
     # Returns the app
     return app
     
\ No newline at end of file
@@ -18,11 +18,14 @@ flask run
 
 Access to the flask shell
 flask --app src shell
-Then, in order to create the models put in the shell:
-from src.database import db
-from src.models.patient import Patient
-from src.models.prescription import Prescription
-db.create_all()
+
+The tables are created and updated with the migrations in src/migrations/versions.py:
+flask db upgrade
+flask db current
+flask db history
+
+flask run is a single process server for development, in production use the WSGI entry point src/wsgi.py:
+gunicorn -c gunicorn.conf.py
 
 
 """
\ No newline at end of file
@@ -0,0 +1,37 @@
+''' Commands for managing the administrators
+
+flask admin grant EMAIL     make a patient administrator
+flask admin remove EMAIL    remove the administrator role of a patient
+'''
+import click
+from flask.cli import AppGroup
+
+from src.database import db
+from src.models.patient import Patient
+
+# The commands are grouped under "flask admin"
+admin_cli = AppGroup('admin', help='Manage the administrators.')
+
+
+def _set_admin(email:str, is_admin:bool):
+    patient = Patient.query.filter_by(email=email).first()
+    if patient is None:
+        raise click.ClickException(f'There is no patient with email {email}')
+    patient.is_admin = is_admin
+    db.session.commit()
+
+
+@admin_cli.command('grant')
+@click.argument('email')
+def grant_command(email):
+    """Make a patient administrator, it applies to the tokens created from now on."""
+    _set_admin(email, True)
+    click.echo(f'{email} is now an administrator')
+
+
+@admin_cli.command('remove')
+@click.argument('email')
+def remove_command(email):
+    """Remove the administrator role of a patient."""
+    _set_admin(email, False)
+    click.echo(f'{email} is not an administrator anymore')
@@ -0,0 +1,57 @@
+''' Commands for managing the database schema
+
+flask db upgrade    apply the pending migrations
+flask db current    show the version of the database
+flask db history    list all the migrations
+flask db prune-tombstones   remove the tombstones older than CHANGES_TOMBSTONE_DAYS
+'''
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from src.database import db
+from src.migrations.runner import current_version, head_version, upgrade
+from src.migrations.versions import MIGRATIONS
+from src.models.prescription_tombstone import PrescriptionTombstone
+
+# The commands are grouped under "flask db"
+db_cli = AppGroup('db', help='Manage the database schema.')
+
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Version to stop at, the last one by default.')
+def upgrade_command(target):
+    """Apply the pending migrations."""
+    applied = upgrade(db.engine, target=target, echo=click.echo)
+    if not applied:
+        click.echo('Database is already up to date')
+
+
+@db_cli.command('current')
+def current_command():
+    """Show the version of the database."""
+    with db.engine.connect() as connection:
+        current = current_version(connection)
+    click.echo(f'Current version: {current} (head: {head_version()})')
+
+
+@db_cli.command('history')
+def history_command():
+    """List all the migrations."""
+    with db.engine.connect() as connection:
+        current = current_version(connection)
+    for step in MIGRATIONS:
+        mark = 'x' if step.version <= current else ' '
+        click.echo(f'[{mark}] {step.version}: {step.description}')
+
+
+
+@db_cli.command('prune-tombstones')
+def prune_tombstones_command():
+    """Remove the tombstones older than CHANGES_TOMBSTONE_DAYS."""
+    limit = datetime.now() - timedelta(days=current_app.config['CHANGES_TOMBSTONE_DAYS'])
+    removed = PrescriptionTombstone.query.filter(PrescriptionTombstone.deleted_at < limit).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'Removed {removed} tombstones')
@@ -0,0 +1,28 @@
+''' Commands for the API docs
+
+flask docs build    write the OpenAPI spec to SWAGGER_STATIC_FILE, served by SWAGGER_MODE=static
+'''
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from src.utils.docs import build_spec
+
+# The commands are grouped under "flask docs"
+docs_cli = AppGroup('docs', help='Manage the API docs.')
+
+
+@docs_cli.command('build')
+@click.option('--output', default=None, help='File of the spec, SWAGGER_STATIC_FILE by default.')
+def build_command(output):
+    """Build the OpenAPI spec, to serve it with SWAGGER_MODE=static."""
+    output = output or current_app.config['SWAGGER_STATIC_FILE']
+    spec = build_spec(current_app._get_current_object())
+    directory = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory, exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(spec, file)
+    click.echo(f'Spec with {len(spec.get("paths", {}))} paths written to {output}')
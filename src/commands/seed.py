@@ -0,0 +1,153 @@
+''' Command for filling the database with generated data, for capacity and load tests
+
+flask seed --patients 100000 --prescriptions 20 --distribution exponential
+
+The rows are written with bulk inserts (executemany) and a commit every --chunk-size rows, and every patient
+gets the same password hash, computed once: creating them through /auth/register would hash every password and
+commit every row. The throughput of the inserts is printed after every commit.
+
+Patients are called {prefix}{number} with email {prefix}{number}@{domain}, the numbers continue after the last
+id so the command can be run many times over the same database.
+'''
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+
+from src.database import db
+from src.models.patient import Patient
+from src.models.prescription import Prescription
+
+# Distributions of the number of prescriptions of a patient and of the size of the bodies
+DISTRIBUTIONS = ('fixed', 'uniform', 'exponential')
+
+# Titles of the generated prescriptions
+DRUGS = ('amoxicilina', 'ibuprofeno', 'paracetamol', 'omeprazol', 'losartan', 'metformina', 'atorvastatina',
+         'salbutamol', 'loratadina', 'diclofenaco', 'azitromicina', 'enalapril', 'sertralina', 'levotiroxina')
+
+# Words of the generated bodies
+WORDS = DRUGS + ('tomar', 'cada', 'horas', 'dias', 'tableta', 'capsula', 'despues', 'comidas', 'con', 'agua', 'por', 'via',
+         'oral', 'suspender', 'si', 'hay', 'reaccion', 'alergica', 'control', 'en', 'una', 'semana', 'mg', 'dosis')
+
+
+def sample(rng:random.Random, distribution:str, mean:float) -> int:
+    """A random amount with the given mean
+
+    Args:
+        rng (Random): The random generator
+        distribution (str): "fixed" (always the mean), "uniform" (between 0 and twice the mean) or
+            "exponential" (most values are small and a few are very large, like real patients)
+        mean (float): The mean of the values
+
+    Returns:
+        int: The amount
+    """
+    if distribution == 'fixed':
+        return int(mean)
+    if distribution == 'uniform':
+        return int(rng.uniform(0, 2 * mean))
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def seed(patients:int, prescriptions:float, distribution:str='exponential', body_size:int=200,
+         body_distribution:str='uniform', days:int=365, password:str='seed-password', prefix:str='seed',
+         domain:str='seed.test', chunk_size:int=5000, random_seed:int=None, echo=None) -> tuple:
+    """Insert generated patients and prescriptions, it must run inside an app context
+
+    Args:
+        patients (int): Number of patients
+        prescriptions (float): Mean number of prescriptions per patient
+        distribution (str, optional): Distribution of the prescriptions per patient, one of DISTRIBUTIONS
+        body_size (int, optional): Mean size of the bodies in characters
+        body_distribution (str, optional): Distribution of the size of the bodies, one of DISTRIBUTIONS
+        days (int, optional): The prescriptions are created in the last days
+        password (str, optional): Password of every patient
+        prefix (str, optional): Prefix of the usernames and emails
+        domain (str, optional): Domain of the emails
+        chunk_size (int, optional): Rows inserted per commit
+        random_seed (int, optional): Seed of the random generator, to generate the same data again
+        echo (callable, optional): Called with the progress messages
+
+    Returns:
+        tuple: The numbers of patients and of prescriptions inserted
+    """
+    echo = echo or (lambda message: None)
+    rng = random.Random(random_seed)
+    pwd_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD'])
+    # The bodies are slices of a long text, generating every body word by word is slower than the inserts
+    text = ' '.join(rng.choice(WORDS) for _ in range(20000))
+    now = datetime.now()
+    patient_table, prescription_table = Patient.__table__, Prescription.__table__
+
+    inserted_patients = inserted_prescriptions = 0
+    started = time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - started
+        rows = inserted_patients + inserted_prescriptions
+        echo(f'{inserted_patients}/{patients} patients, {inserted_prescriptions} prescriptions, '
+             f'{rows / elapsed if elapsed else 0:.0f} rows/s')
+
+    pending = []
+    while inserted_patients < patients:
+        last_id = db.session.query(db.func.max(Patient.id)).scalar() or 0
+        count = min(chunk_size, patients - inserted_patients)
+        db.session.execute(patient_table.insert(), [
+            {'username': f'{prefix}{number}', 'email': f'{prefix}{number}@{domain}', 'password': pwd_hash,
+             'created_at': now}
+            for number in range(last_id + 1, last_id + count + 1)
+        ])
+        db.session.commit()
+        inserted_patients += count
+        report()
+
+        ids = [row.id for row in db.session.query(Patient.id).filter(Patient.id > last_id).order_by(Patient.id)]
+        for user_id in ids:
+            for _ in range(sample(rng, distribution, prescriptions)):
+                created_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+                size = max(1, sample(rng, body_distribution, body_size))
+                start = rng.randrange(len(text) - size) if size < len(text) else 0
+                pending.append({'title': rng.choice(DRUGS).capitalize(), 'body': text[start:start + size],
+                                'user_id': user_id, 'expedition_date': created_at, 'created_at': created_at})
+                if len(pending) >= chunk_size:
+                    db.session.execute(prescription_table.insert(), pending)
+                    db.session.commit()
+                    inserted_prescriptions += len(pending)
+                    pending = []
+                    report()
+
+    if pending:
+        db.session.execute(prescription_table.insert(), pending)
+        db.session.commit()
+        inserted_prescriptions += len(pending)
+        report()
+    return inserted_patients, inserted_prescriptions
+
+
+@click.command('seed')
+@click.option('--patients', type=int, default=1000, show_default=True, help='Number of patients.')
+@click.option('--prescriptions', type=float, default=10, show_default=True, help='Mean number of prescriptions per patient.')
+@click.option('--distribution', type=click.Choice(DISTRIBUTIONS), default='exponential', show_default=True,
+              help='Distribution of the prescriptions per patient.')
+@click.option('--body-size', type=int, default=200, show_default=True, help='Mean size of the bodies in characters.')
+@click.option('--body-distribution', type=click.Choice(DISTRIBUTIONS), default='uniform', show_default=True,
+              help='Distribution of the size of the bodies.')
+@click.option('--days', type=int, default=365, show_default=True, help='The prescriptions are created in the last days.')
+@click.option('--password', default='seed-password', show_default=True, help='Password of every patient.')
+@click.option('--prefix', default='seed', show_default=True, help='Prefix of the usernames and emails.')
+@click.option('--domain', default='seed.test', show_default=True, help='Domain of the emails.')
+@click.option('--chunk-size', type=click.IntRange(1), default=5000, show_default=True, help='Rows inserted per commit.')
+@click.option('--random-seed', type=int, default=None, help='Seed of the random generator.')
+@with_appcontext
+def seed_command(patients, prescriptions, distribution, body_size, body_distribution, days, password, prefix, domain,
+                 chunk_size, random_seed):
+    """Fill the database with generated patients and prescriptions."""
+    started = time.perf_counter()
+    inserted = seed(patients, prescriptions, distribution=distribution, body_size=body_size,
+                    body_distribution=body_distribution, days=days, password=password, prefix=prefix, domain=domain,
+                    chunk_size=chunk_size, random_seed=random_seed, echo=click.echo)
+    click.echo(f'Inserted {inserted[0]} patients and {inserted[1]} prescriptions in {time.perf_counter() - started:.1f} s')
@@ -0,0 +1,106 @@
+''' Options of the database engine and its connection pool
+
+The values come from the config keys below (and from the environment, see create_app), they end in
+SQLALCHEMY_ENGINE_OPTIONS, that Flask-SQLAlchemy passes to create_engine:
+
+    DB_POOL_SIZE            connections kept open in the pool
+    DB_MAX_OVERFLOW         connections that can be opened over the pool size
+    DB_POOL_TIMEOUT         seconds to wait for a free connection
+    DB_POOL_RECYCLE         seconds after which a connection is opened again
+    DB_POOL_PRE_PING        check the connection before using it
+    DB_STATEMENT_TIMEOUT_MS max milliseconds of a statement (postgres and mysql)
+    SQLITE_PRAGMAS          pragmas applied to every new SQLite connection
+
+Any key already set in SQLALCHEMY_ENGINE_OPTIONS wins over these ones.
+'''
+from sqlalchemy.pool import QueuePool
+
+# WAL lets the readers work while a writer commits, NORMAL is durable enough with WAL and much faster,
+# a negative cache_size is in KiB (64 MiB) and mmap_size is in bytes (256 MiB)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,
+}
+
+# Config key -> option of create_engine
+POOL_OPTIONS = (
+    ('DB_POOL_SIZE', 'pool_size'),
+    ('DB_MAX_OVERFLOW', 'max_overflow'),
+    ('DB_POOL_TIMEOUT', 'pool_timeout'),
+    ('DB_POOL_RECYCLE', 'pool_recycle'),
+)
+
+
+def engine_options(config) -> dict:
+    """Build the options of the engine from the config
+
+    Args:
+        config (Config): The config of the app
+
+    Returns:
+        dict: The options for SQLALCHEMY_ENGINE_OPTIONS
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    connect_args = dict(options.get('connect_args') or {})
+
+    if config.get('DB_POOL_PRE_PING') is not None:
+        options.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+
+    if uri.startswith('sqlite'):
+        # By default Flask-SQLAlchemy opens a new connection for every session (NullPool),
+        # with a pool size the connections are kept and shared between the threads
+        in_memory = uri in ('sqlite://', 'sqlite:///:memory:')
+        if config.get('DB_POOL_SIZE') and not in_memory:
+            options.setdefault('poolclass', QueuePool)
+            connect_args.setdefault('check_same_thread', False)
+            _set_pool_options(config, options)
+        options.setdefault('sqlite_pragmas', config.get('SQLITE_PRAGMAS', SQLITE_PRAGMAS))
+    else:
+        _set_pool_options(config, options)
+
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if timeout and uri.startswith('postgres'):
+        connect_args.setdefault('options', f'-c statement_timeout={int(timeout)}')
+    elif timeout and uri.startswith('mysql'):
+        options.setdefault('mysql_statement_timeout_ms', int(timeout))
+
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def _set_pool_options(config, options:dict):
+    for key, option in POOL_OPTIONS:
+        if config.get(key) is not None:
+            options.setdefault(option, config[key])
+
+
+def describe_engine(engine, options:dict) -> str:
+    """A line with the effective settings of the engine, for the startup log
+
+    Args:
+        engine (Engine): The engine
+        options (dict): The options used to create it
+
+    Returns:
+        str: The description
+    """
+    pool = engine.pool
+    settings = {'pool': type(pool).__name__, 'dialect': engine.dialect.name}
+    # Not every pool class has a size (NullPool, StaticPool)
+    for name, attribute in (('pool_size', 'size'), ('max_overflow', '_max_overflow'), ('pool_timeout', '_timeout')):
+        value = getattr(pool, attribute, None)
+        if value is not None:
+            settings[name] = value() if callable(value) else value
+    settings['pool_recycle'] = getattr(pool, '_recycle', None)
+    settings['pool_pre_ping'] = getattr(pool, '_pre_ping', None)
+    for name in ('sqlite_pragmas', 'mysql_statement_timeout_ms'):
+        if name in options:
+            settings[name] = options[name]
+    if 'options' in options.get('connect_args', {}):
+        settings['connect_options'] = options['connect_args']['options']
+    return ', '.join(f'{name}={value}' for name, value in settings.items())
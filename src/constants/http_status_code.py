@@ -59,24 +59,24 @@ HTTP_511_NETWORK_AUTHENTICATION_REQUIRED = 511
 
 def is_informational(status):
     # 1xx
-    pass
+    return 100 <= status <= 199
 
 
 def is_success(status):
     # 2xx
-    pass
+    return 200 <= status <= 299
 
 
 def is_redirect(status):
     # 3xx
-    pass
+    return 300 <= status <= 399
 
 
-def is_client_error():
+def is_client_error(status):
     # 4xx
-    pass
+    return 400 <= status <= 499
 
 
-def is_server_error():
+def is_server_error(status):
     # 5xx
-    pass
\ No newline at end of file
+    return 500 <= status <= 599
@@ -1,7 +1,139 @@
 '''
 We use Flask-SQLAlchemy extension, a flask exstension of SQLAlchemy wich is a common database abstraction layer and object relational mapper .
 '''
-from flask_sqlalchemy import SQLAlchemy
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy as BaseSQLAlchemy, get_state
+from sqlalchemy import event, orm
+
+from src.constants.http_status_code import HTTP_503_SERVICE_UNAVAILABLE
+from src.migrations.runner import head_version, is_schema_current, upgrade
+from src.models.types import decompress_text
+from src.utils.fts import owner_terms
+from src.utils.sqltrace import instrument
+
+
+# Key of the read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = 'replica'
+
+
+def register_sqlite_functions(dbapi_connection, connection_record=None):
+    """Add the functions used by the full-text index to a new SQLite connection
+
+    The index reads the compressed bodies as plain text (migration 8, src.models.types)
+    and with the words prefixed by their owner (migration 9, src.utils.fts).
+
+    Args:
+        dbapi_connection (Connection): The sqlite3 connection
+        connection_record (_ConnectionRecord, optional): Given by the connect event of the pool
+    """
+    dbapi_connection.create_function('decompress_text', 1, decompress_text, deterministic=True)
+    dbapi_connection.create_function('owner_terms', 2, owner_terms, deterministic=True)
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends the queries of the read-only requests to the replica bind
+
+    The request is marked by src.utils.replica (g.db_use_replica), any other query goes to the primary.
+    Once the session writes something it stays on the primary, so a request always reads its own changes.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing:
+            self.info['wrote'] = True
+        elif not self.info.get('wrote') and has_request_context() and g.get('db_use_replica'):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """Flask-SQLAlchemy with the extra engine options of src.config.database
+
+    Every engine is instrumented by src.utils.sqltrace, and every SQLite connection has the functions of the
+    full-text index (register_sqlite_functions).
+    The options sqlite_pragmas and mysql_statement_timeout_ms are not options of create_engine,
+    they are removed here and applied on every new connection of the pool.
+    """
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        statement_timeout = engine_opts.pop('mysql_statement_timeout_ms', None)
+        engine = super().create_engine(sa_url, engine_opts)
+        # Count and time the statements of every request
+        instrument(engine)
+
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', register_sqlite_functions)
+
+        if pragmas and engine.dialect.name == 'sqlite':
+            @event.listens_for(engine, 'connect')
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for name, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {name}={value}')
+                cursor.close()
+
+        if statement_timeout and engine.dialect.name == 'mysql':
+            @event.listens_for(engine, 'connect')
+            def set_mysql_statement_timeout(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f'SET SESSION max_execution_time={int(statement_timeout)}')
+                cursor.close()
+
+        return engine
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
 
 # Instance db object
 db = SQLAlchemy()
+
+
+def verify_schema(app):
+    """Check that the database schema is at the version expected by the code
+
+    The tables are not created here anymore, they are created by the migrations with `flask db upgrade`.
+    With SCHEMA_AUTO_UPGRADE the pending migrations are applied when the app starts, useful for development and tests.
+
+    If the schema is outdated the app still starts (so the flask db commands keep working) but every request
+    is answered with a 503 until the migrations are applied.
+
+    Args:
+        app (Flask): The application
+    """
+    with app.app_context():
+        if app.config.get('SCHEMA_AUTO_UPGRADE'):
+            upgrade(db.engine, echo=app.logger.info)
+        if is_schema_current(db.engine):
+            return
+
+    app.logger.error('Database schema is outdated, expected version %s. Run `flask db upgrade`', head_version())
+    state = {'current': False}
+
+    @app.before_request
+    def require_current_schema():
+        # Once the migrations are applied we stop checking, the liveness check answers anyway
+        if state['current'] or request.endpoint == 'health.healthz':
+            return None
+        state['current'] = is_schema_current(db.engine)
+        if not state['current']:
+            return {'error':'Database schema is outdated'},HTTP_503_SERVICE_UNAVAILABLE
+        current_app.logger.info('Database schema is now at version %s', head_version())
+        return None
+
+
+def dispose_engines(app, close:bool=True):
+    """Drop the connections of the pools of every engine of the app (primary and binds)
+
+    A preloading server (gunicorn --preload) creates the app in the master process and then forks the workers,
+    a connection opened before the fork would be shared by all of them. The master disposes the engines after
+    creating the app and every worker disposes them again after the fork with close=False: the inherited
+    connections are forgotten without closing them, closing them would end the sessions of the parent.
+
+    Args:
+        app (Flask): The application
+        close (bool, optional): Close the connections, False after a fork
+    """
+    with app.app_context():
+        for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or ()):
+            db.get_engine(app, bind).dispose(close=close)
@@ -0,0 +1,88 @@
+''' Apply the migrations defined in src.migrations.versions and keep track of the schema version
+
+The applied versions are saved in the schema_version table, one row per migration.
+'''
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from src.migrations.versions import MIGRATIONS
+
+# Table used to save the applied versions
+schema_version = sa.Table('schema_version', sa.MetaData(),
+                          sa.Column('version', sa.Integer, primary_key=True, autoincrement=False),
+                          sa.Column('description', sa.String(200), nullable=False),
+                          sa.Column('applied_at', sa.DateTime, nullable=False))
+
+
+def head_version() -> int:
+    """Returns the version of the last migration in the code
+
+    Returns:
+        int: The head version, 0 if there are no migrations
+    """
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def current_version(connection) -> int:
+    """Returns the version of the database
+
+    It is a single query over a small table, so it is cheap enough to be run when the app starts.
+
+    Args:
+        connection (Connection): A connection to the database
+
+    Returns:
+        int: The current version, 0 if the database has never been migrated
+    """
+    try:
+        version = connection.execute(sa.select(sa.func.max(schema_version.c.version))).scalar()
+    except sa.exc.DBAPIError:
+        # The table does not exist yet
+        return 0
+    return version or 0
+
+
+def upgrade(engine, target:int=None, echo=None) -> list:
+    """Apply the pending migrations, every one in its own transaction
+
+    Args:
+        engine (Engine): The engine of the database
+        target (int, optional): The version to stop at. Defaults to the head version.
+        echo (callable, optional): Function called with a message for each applied migration.
+
+    Returns:
+        list: The applied migrations
+    """
+    target = head_version() if target is None else target
+    schema_version.create(engine, checkfirst=True)
+
+    with engine.connect() as connection:
+        current = current_version(connection)
+
+    applied = []
+    for step in MIGRATIONS:
+        if step.version <= current or step.version > target:
+            continue
+        with engine.begin() as connection:
+            step.upgrade(connection)
+            connection.execute(schema_version.insert().values(version=step.version,
+                                                              description=step.description,
+                                                              applied_at=datetime.now()))
+        applied.append(step)
+        if echo:
+            echo(f'Applied {step.version}: {step.description}')
+    return applied
+
+
+def is_schema_current(engine) -> bool:
+    """Check if the database is at the head version
+
+    Args:
+        engine (Engine): The engine of the database
+
+    Returns:
+        bool: True if there are no pending migrations
+    """
+    with engine.connect() as connection:
+        return current_version(connection) >= head_version()
@@ -0,0 +1,305 @@
+''' Versioned schema migrations
+
+Every migration is a function decorated with @migration(version, description) that receives a connection
+inside a transaction. The versions are applied in order by src.migrations.runner and the last applied version
+is saved in the schema_version table.
+
+Migrations describe the tables with their own MetaData instead of using the models, that way an old migration
+keeps doing the same thing even when the models change later.
+
+Never edit a migration that was already released, add a new one at the end of this file.
+'''
+import sqlalchemy as sa
+
+# The registered migrations, ordered by version
+MIGRATIONS = []
+
+
+class Migration:
+    """A single step of the schema history
+
+    Args:
+        version (int): The version the schema has after applying the migration
+        description (str): A short description of the change
+        upgrade (callable): Function that receives a connection and applies the change
+    """
+    def __init__(self, version:int, description:str, upgrade):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+
+
+def migration(version:int, description:str):
+    """Decorator used to register a migration
+
+    Args:
+        version (int): The version, it must be the previous one plus one
+        description (str): A short description of the change
+    """
+    def decorator(function):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise RuntimeError(f'migration {function.__name__} has version {version}, expected {expected}')
+        MIGRATIONS.append(Migration(version, description, function))
+        return function
+    return decorator
+
+
+def _rebuild_sqlite_table(connection, table:sa.Table):
+    """SQLite can not drop constraints, so the table is created again with the new definition and the rows are copied
+
+    Args:
+        connection (Connection): The connection of the migration
+        table (Table): The new definition of the table, with the same name as the old one
+    """
+    name = table.name
+    old_columns = {column['name'] for column in sa.inspect(connection).get_columns(name)}
+    columns = ', '.join(column.name for column in table.columns if column.name in old_columns)
+
+    table.name = f'_{name}_new'
+    table.create(connection)
+    connection.execute(sa.text(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {name}'))
+    connection.execute(sa.text(f'DROP TABLE {name}'))
+    connection.execute(sa.text(f'ALTER TABLE {table.name} RENAME TO {name}'))
+    table.name = name
+
+
+def _add_column(connection, table_name:str, column:sa.Column):
+    """Add a column to an existing table, the DDL of the column is compiled for the dialect of the connection
+
+    Args:
+        connection (Connection): The connection of the migration
+        table_name (str): The name of the table
+        column (Column): The new column, a NOT NULL column needs a server_default
+    """
+    sa.Table(table_name, sa.MetaData(), column)
+    ddl = sa.schema.CreateColumn(column).compile(dialect=connection.dialect)
+    connection.execute(sa.text(f'ALTER TABLE {table_name} ADD COLUMN {ddl}'))
+
+
+@migration(1, 'baseline schema: patient and prescription')
+def baseline(connection):
+    # Databases created before the migrations existed (with db.create_all()) already have the tables
+    existing = set(sa.inspect(connection).get_table_names())
+
+    metadata = sa.MetaData()
+    sa.Table('patient', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('username', sa.String(80), unique=True, nullable=False),
+             sa.Column('password', sa.Text(), unique=True, nullable=False),
+             sa.Column('fullname', sa.String(100)),
+             sa.Column('email', sa.String(100)),
+             sa.Column('phone', sa.String(100)),
+             sa.Column('address', sa.String(100)),
+             sa.Column('created_at', sa.DateTime),
+             sa.Column('updated_at', sa.DateTime))
+    sa.Table('prescription', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('title', sa.String(70), nullable=False),
+             sa.Column('body', sa.Text, nullable=False),
+             sa.Column('expedition_date', sa.DateTime),
+             sa.Column('user_id', sa.Integer, sa.ForeignKey('patient.id')),
+             sa.Column('created_at', sa.DateTime),
+             sa.Column('updated_at', sa.DateTime))
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing:
+            table.create(connection)
+
+
+@migration(2, 'index prescription (user_id, id) and patient email, drop unique password')
+def indexes_and_password_unique(connection):
+    metadata = sa.MetaData()
+    patient = sa.Table('patient', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('username', sa.String(80), unique=True, nullable=False),
+             sa.Column('password', sa.Text(), nullable=False),
+             sa.Column('fullname', sa.String(100)),
+             sa.Column('email', sa.String(100)),
+             sa.Column('phone', sa.String(100)),
+             sa.Column('address', sa.String(100)),
+             sa.Column('created_at', sa.DateTime),
+             sa.Column('updated_at', sa.DateTime))
+    prescription = sa.Table('prescription', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('user_id', sa.Integer))
+
+    # The unique index over a Text column only makes the inserts slower, hashes are salted anyway
+    if connection.dialect.name == 'sqlite':
+        _rebuild_sqlite_table(connection, patient)
+    else:
+        for constraint in sa.inspect(connection).get_unique_constraints('patient'):
+            if constraint['column_names'] == ['password']:
+                connection.execute(sa.schema.DropConstraint(sa.UniqueConstraint(patient.c.password, name=constraint['name'])))
+
+    # email is used to find the patient in every login and register
+    sa.Index('ix_patient_email', patient.c.email).create(connection)
+    # Every query of prescriptions filters by user and pages by id
+    sa.Index('ix_prescription_user_id_id', prescription.c.user_id, prescription.c.id).create(connection)
+
+
+@migration(3, 'unique patient email, patient is_admin')
+def unique_email_and_admin(connection):
+    metadata = sa.MetaData()
+    patient = sa.Table('patient', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('email', sa.String(100)))
+
+    # The registration relies on the constraints to detect a taken email or username
+    # (it fails if there are already repeated emails, they should be fixed by hand first)
+    sa.Index('ix_patient_email', patient.c.email).drop(connection)
+    sa.Index('ix_patient_email', patient.c.email, unique=True).create(connection)
+
+    _add_column(connection, 'patient', sa.Column('is_admin', sa.Boolean, nullable=False, server_default=sa.false()))
+
+
+@migration(4, 'revoked_token table for the token blocklist')
+def revoked_token(connection):
+    metadata = sa.MetaData()
+    table = sa.Table('revoked_token', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('jti', sa.String(36), nullable=False),
+             sa.Column('token_type', sa.String(10)),
+             sa.Column('user_id', sa.Integer),
+             sa.Column('expires_at', sa.DateTime, nullable=False),
+             sa.Column('created_at', sa.DateTime, nullable=False))
+    table.create(connection)
+    sa.Index('ix_revoked_token_jti', table.c.jti, unique=True).create(connection)
+    # The workers ask for the tokens revoked since their last sync
+    sa.Index('ix_revoked_token_created_at', table.c.created_at).create(connection)
+
+
+@migration(5, 'full-text index of prescription title and body')
+def prescription_search(connection):
+    # The index is kept by the database itself, so the routes, the bulk operations and any other writer keep it in sync
+    if connection.dialect.name == 'sqlite':
+        # External content table: the FTS5 index only keeps the terms, the text stays in prescription.
+        # Note that rebuilding prescription with _rebuild_sqlite_table drops the triggers, they must be created again.
+        statements = [
+            "CREATE VIRTUAL TABLE prescription_fts USING fts5(title, body, content='prescription', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')",
+            'CREATE TRIGGER prescription_fts_insert AFTER INSERT ON prescription BEGIN '
+            'INSERT INTO prescription_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END',
+            'CREATE TRIGGER prescription_fts_delete AFTER DELETE ON prescription BEGIN '
+            "INSERT INTO prescription_fts(prescription_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+            'CREATE TRIGGER prescription_fts_update AFTER UPDATE OF title, body ON prescription BEGIN '
+            "INSERT INTO prescription_fts(prescription_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+            'INSERT INTO prescription_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END',
+            "INSERT INTO prescription_fts(prescription_fts) VALUES ('rebuild')",
+        ]
+    elif connection.dialect.name == 'postgresql':
+        # A generated column is computed on every insert and update, the title weights more than the body
+        statements = [
+            'ALTER TABLE prescription ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ('
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED",
+            'CREATE INDEX ix_prescription_search_vector ON prescription USING GIN (search_vector)',
+        ]
+    else:
+        # Other databases use the LIKE fallback of src.utils.search
+        statements = []
+
+    for statement in statements:
+        connection.execute(sa.text(statement))
+
+
+@migration(6, 'prescription_tombstone table and index of the changes of prescription')
+def prescription_changes(connection):
+    metadata = sa.MetaData()
+    tombstone = sa.Table('prescription_tombstone', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('prescription_id', sa.Integer, nullable=False),
+             sa.Column('user_id', sa.Integer, nullable=False),
+             sa.Column('deleted_at', sa.DateTime, nullable=False))
+    tombstone.create(connection)
+    sa.Index('ix_prescription_tombstone_user_id_deleted_at',
+             tombstone.c.user_id, tombstone.c.deleted_at, tombstone.c.id).create(connection)
+
+    # The sync asks for the rows of a user changed after a moment, the moment of a row is its last write
+    prescription = sa.Table('prescription', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('user_id', sa.Integer),
+             sa.Column('created_at', sa.DateTime),
+             sa.Column('updated_at', sa.DateTime))
+    sa.Index('ix_prescription_user_id_changed_at', prescription.c.user_id,
+             sa.func.coalesce(prescription.c.updated_at, prescription.c.created_at), prescription.c.id).create(connection)
+
+
+@migration(7, 'index prescription (user_id, expedition_date, id) and (user_id, created_at, id)')
+def prescription_sort_indexes(connection):
+    metadata = sa.MetaData()
+    prescription = sa.Table('prescription', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             sa.Column('user_id', sa.Integer),
+             sa.Column('expedition_date', sa.DateTime),
+             sa.Column('created_at', sa.DateTime))
+    # The date ranges and the sorts of the list seek on these indexes, in both directions
+    sa.Index('ix_prescription_user_id_expedition_date_id', prescription.c.user_id,
+             prescription.c.expedition_date, prescription.c.id).create(connection)
+    sa.Index('ix_prescription_user_id_created_at_id', prescription.c.user_id,
+             prescription.c.created_at, prescription.c.id).create(connection)
+
+
+@migration(8, 'full-text index of the decompressed prescription bodies')
+def prescription_search_decompressed(connection):
+    # Only SQLite stores compressed bodies (src.models.types). The index reads them through a view that decompresses
+    # them with decompress_text, a function that src.database registers on every connection: a connection without it
+    # (like the sqlite3 shell) can read the tables but can not write prescriptions.
+    # Postgres keeps the generated column of the migration 5, its bodies are never compressed.
+    if connection.dialect.name != 'sqlite':
+        return
+    statements = [
+        'DROP TRIGGER prescription_fts_insert',
+        'DROP TRIGGER prescription_fts_delete',
+        'DROP TRIGGER prescription_fts_update',
+        'DROP TABLE prescription_fts',
+        'CREATE VIEW prescription_fts_content AS SELECT id, title, decompress_text(body) AS body FROM prescription',
+        "CREATE VIRTUAL TABLE prescription_fts USING fts5(title, body, content='prescription_fts_content', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        'CREATE TRIGGER prescription_fts_insert AFTER INSERT ON prescription BEGIN '
+        'INSERT INTO prescription_fts(rowid, title, body) VALUES (new.id, new.title, decompress_text(new.body)); END',
+        'CREATE TRIGGER prescription_fts_delete AFTER DELETE ON prescription BEGIN '
+        "INSERT INTO prescription_fts(prescription_fts, rowid, title, body) VALUES ('delete', old.id, old.title, decompress_text(old.body)); END",
+        'CREATE TRIGGER prescription_fts_update AFTER UPDATE OF title, body ON prescription BEGIN '
+        "INSERT INTO prescription_fts(prescription_fts, rowid, title, body) VALUES ('delete', old.id, old.title, decompress_text(old.body)); "
+        'INSERT INTO prescription_fts(rowid, title, body) VALUES (new.id, new.title, decompress_text(new.body)); END',
+        # The new index starts empty
+        "INSERT INTO prescription_fts(prescription_fts) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        connection.execute(sa.text(statement))
+
+
+@migration(9, 'full-text index partitioned by the owner of the prescription')
+def prescription_search_by_owner(connection):
+    # A MATCH of FTS5 reads the terms of every user, the words are indexed with the id of their owner in front
+    # (owner_terms, see src.utils.fts) so a search only reads the terms of its user. Like decompress_text, owner_terms
+    # is registered by src.database on every connection. Postgres filters the user with its indexes.
+    if connection.dialect.name != 'sqlite':
+        return
+    title = 'owner_terms({row}.user_id, {row}.title)'
+    body = 'owner_terms({row}.user_id, decompress_text({row}.body))'
+    new = f"{title.format(row='new')}, {body.format(row='new')}"
+    old = f"{title.format(row='old')}, {body.format(row='old')}"
+    statements = [
+        'DROP TRIGGER prescription_fts_insert',
+        'DROP TRIGGER prescription_fts_delete',
+        'DROP TRIGGER prescription_fts_update',
+        'DROP TABLE prescription_fts',
+        'DROP VIEW prescription_fts_content',
+        'CREATE VIEW prescription_fts_content AS SELECT id, owner_terms(user_id, title) AS title, '
+        'owner_terms(user_id, decompress_text(body)) AS body FROM prescription',
+        "CREATE VIRTUAL TABLE prescription_fts USING fts5(title, body, content='prescription_fts_content', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        'CREATE TRIGGER prescription_fts_insert AFTER INSERT ON prescription BEGIN '
+        f'INSERT INTO prescription_fts(rowid, title, body) VALUES (new.id, {new}); END',
+        'CREATE TRIGGER prescription_fts_delete AFTER DELETE ON prescription BEGIN '
+        f"INSERT INTO prescription_fts(prescription_fts, rowid, title, body) VALUES ('delete', old.id, {old}); END",
+        # The owner is part of the indexed words, so a change of owner changes them too
+        'CREATE TRIGGER prescription_fts_update AFTER UPDATE OF title, body, user_id ON prescription BEGIN '
+        f"INSERT INTO prescription_fts(prescription_fts, rowid, title, body) VALUES ('delete', old.id, {old}); "
+        f'INSERT INTO prescription_fts(rowid, title, body) VALUES (new.id, {new}); END',
+        "INSERT INTO prescription_fts(prescription_fts) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        connection.execute(sa.text(statement))
@@ -9,14 +9,15 @@ class Patient(db.Model):
     """
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80),unique=True, nullable=False)
-    password = db.Column(db.Text(),unique=True, nullable=False)
+    password = db.Column(db.Text(), nullable=False)
     fullname = db.Column(db.String(100))
-    email = db.Column(db.String(100))
+    email = db.Column(db.String(100), unique=True, index=True)
     phone = db.Column(db.String(100))
     address = db.Column(db.String(100))
+    is_admin = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     prescriptions = db.relationship('Prescription',backref="patient") 
-    created_at = db.Column(db.DateTime, default=datetime.now())
-    updated_at = db.Column(db.DateTime, onupdate=datetime.now())
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.now)
     
     def __repr__(self) -> str:
         """Returns a representative string of the class
@@ -1,6 +1,7 @@
 # Import our db module
 from datetime import datetime
 from src.database import db
+from src.models.types import CompressedText
 class Prescription(db.Model):
     """Class that represent a prescription
 
@@ -10,11 +11,23 @@ class Prescription(db.Model):
     """
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(70),nullable=False)
-    body = db.Column(db.Text, nullable=False)
-    expedition_date = db.Column(db.DateTime, default=datetime.now())
+    # Large bodies can be stored compressed, see PRESCRIPTION_BODY_COMPRESS_MIN_BYTES
+    body = db.Column(CompressedText('PRESCRIPTION_BODY_COMPRESS_MIN_BYTES'), nullable=False)
+    expedition_date = db.Column(db.DateTime, default=datetime.now)
     user_id = db.Column(db.Integer, db.ForeignKey('patient.id'))
-    created_at = db.Column(db.DateTime, default=datetime.now())
-    updated_at = db.Column(db.DateTime, onupdate=datetime.now())
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.now)
+    
+    # The prescriptions are always filtered by user and paged by id
+    # (the indexes are created by the migrations in src/migrations/versions.py)
+    # The date ranges and sorts of the list seek on (user_id, date, id)
+    # The sync of the clients (/prescription/changes) seeks on the moment of the last write of the rows
+    __table_args__ = (
+        db.Index('ix_prescription_user_id_id', 'user_id', 'id'),
+        db.Index('ix_prescription_user_id_expedition_date_id', 'user_id', 'expedition_date', 'id'),
+        db.Index('ix_prescription_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_prescription_user_id_changed_at', user_id, db.func.coalesce(updated_at, created_at), id),
+    )
     
     def __repr__(self) -> str:
         """ Returns a representative string of the class            
@@ -0,0 +1,29 @@
+# Import our db module
+from datetime import datetime
+from src.database import db
+class PrescriptionTombstone(db.Model):
+    """Class that represents a deleted prescription, used by the sync of the clients (/prescription/changes)
+
+    The prescriptions are deleted for real, the tombstone only keeps the id and when it was deleted.
+    Old tombstones are removed with `flask db prune-tombstones`.
+
+    Args:
+        db (Model): The superclass
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    prescription_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    
+    # The sync reads the tombstones of a user in order of deletion
+    __table_args__ = (
+        db.Index('ix_prescription_tombstone_user_id_deleted_at', 'user_id', 'deleted_at', 'id'),
+    )
+    
+    def __repr__(self) -> str:
+        """Returns a representative string of the class
+
+        Returns:
+            str: The representative string of the class with the id of the prescription
+        """
+        return f'PrescriptionTombstone>>>{self.prescription_id}'
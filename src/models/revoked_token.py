@@ -0,0 +1,25 @@
+# Import our db module
+from datetime import datetime
+from src.database import db
+class RevokedToken(db.Model):
+    """Class that represents a revoked token (logout or revoked by an administrator)
+
+    Only the tokens that are not expired matter, the expired ones are rejected anyway.
+
+    Args:
+        db (Model): The superclass
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, index=True, nullable=False)
+    token_type = db.Column(db.String(10))
+    user_id = db.Column(db.Integer)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True, nullable=False)
+    
+    def __repr__(self) -> str:
+        """Returns a representative string of the class
+
+        Returns:
+            str: The representative string of the class with the jti
+        """
+        return f'RevokedToken>>>{self.jti}'
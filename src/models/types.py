@@ -0,0 +1,75 @@
+''' Column types shared by the models
+
+CompressedText is a Text column whose large values are stored compressed (zlib, then base64 so the column
+is still text). A value is compressed when it has PRESCRIPTION_BODY_COMPRESS_MIN_BYTES bytes or more (0, the
+default, never compresses) and the compressed copy is smaller. The compressed values start with MARKER, a
+control character the schemas do not accept (src.utils.schemas), and they are decompressed when they are read,
+so the rows written before enabling it, or with a different threshold, are read the same way.
+
+The values are only compressed on SQLite, where the full-text index is fed the plain text: every connection has
+the function decompress_text (see src.database) and the index reads the bodies through it (migration 8), so the
+compressed bodies are found like the others. Postgres already compresses the large values itself (TOAST) and its
+tsvector, like the LIKE of the other databases, needs the plain text in the column, so there they are not compressed.
+'''
+import base64
+import zlib
+
+from flask import current_app, has_app_context
+from sqlalchemy.types import Text, TypeDecorator
+
+# Prefix of the compressed values
+MARKER = '\x01z'
+
+# Databases where the values are compressed, see the module docstring
+COMPRESSED_DIALECTS = ('sqlite',)
+
+
+def compress_text(value:str, min_bytes:int) -> str:
+    """Compress a value if it is large enough and the compressed copy is smaller
+
+    Args:
+        value (str): The value
+        min_bytes (int): Values with fewer bytes are not compressed, 0 never compresses
+
+    Returns:
+        str: The value to store
+    """
+    if not min_bytes or value is None:
+        return value
+    raw = value.encode('utf-8')
+    if len(raw) < min_bytes:
+        return value
+    packed = MARKER + base64.b64encode(zlib.compress(raw, 6)).decode('ascii')
+    return packed if len(packed) < len(raw) else value
+
+
+def decompress_text(value:str) -> str:
+    """Inverse of compress_text, the values that are not compressed are returned as they are"""
+    if value is None or not value.startswith(MARKER):
+        return value
+    return zlib.decompress(base64.b64decode(value[len(MARKER):])).decode('utf-8')
+
+
+class CompressedText(TypeDecorator):
+    """Text stored compressed when it is large, see the module docstring"""
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, min_bytes_config:str, *args, **kwargs):
+        # The config key of the threshold, it is read on every write so the app can change it
+        self.min_bytes_config = min_bytes_config
+        super().__init__(*args, **kwargs)
+
+    def process_bind_param(self, value, dialect):
+        # Writes outside an app (like the migrations) are never compressed
+        if not has_app_context() or dialect.name not in COMPRESSED_DIALECTS:
+            return value
+        return compress_text(value, current_app.config.get(self.min_bytes_config, 0))
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+    def coerce_compared_value(self, op, value):
+        # The values compared with the column (like the patterns of LIKE) are never compressed
+        return Text()
@@ -5,15 +5,22 @@ A Blueprint is a way to organize a group of related views and other code.
 Rather than registering views and other code directly with an application, they are 
 registered with a blueprint. Then the blueprint is registered with the application when it is available in the factory function.
 '''
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 
 from src.database import db
 
-# We use werkzeug.security for dealing with password
-from werkzeug.security import check_password_hash, generate_password_hash
+# The passwords are hashed and checked on a bounded pool, out of the thread of the request
+from src.utils.passwords import passwords
+
+# Inserts committed in groups, when GROUP_COMMIT_ENABLED
+from src.utils.groupcommit import group_commit
 
 # Constants about HTTP messages
-from src.constants.http_status_code import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_409_CONFLICT
+from src.constants.http_status_code import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_409_CONFLICT, HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+# The unique constraints of the database detect a taken email or username
+import re
+from sqlalchemy.exc import IntegrityError
 
 # Validators for fields
 import validators
@@ -22,15 +29,38 @@ import validators
 from src.models.patient import Patient
 
 # Import utilities for jwt
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required,get_jwt_identity
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token, jwt_required, get_jwt, get_jwt_identity
+from jwt.exceptions import PyJWTError
+
+# Revocation of tokens
+from src.utils.tokens import revoke_claims, valid_jti
+
+# Read-through cache for the patient returned by /me
+from src.utils.cache import cache, patient_key
+
+# Max size of the request bodies and the validation of the patients
+from src.utils.payload import payload_limits
+from src.utils.schemas import ValidationError, patient_schema
+
+# Serializer of the patient
+from src.utils.serializers import patient_serializer
+
+# Rate limits of the routes, they can be changed with RATELIMIT_ROUTES
+from src.utils.ratelimit import limiter
 
-# Import swagger annotation
-from flasgger import swag_from
+# Max number of SQL statements of the routes, checked in debug and testing
+from src.utils.querybudget import query_budget
+
+# Endpoints only for administrators
+from src.utils.admin import admin_claims, admin_required
 
 # Define a blueprint for auth, the name indicates where is defined, (this file) and also we specify an url.
 auth = Blueprint("auth",__name__,url_prefix="/api/v1/auth")
 
 @auth.post('/register')
+@payload_limits.limit(16 * 1024)
+@limiter.limit(ip='10/minute')
+@query_budget.limit(4)
 def register():
     """User Registration
     ---
@@ -65,46 +95,167 @@ responses:
   400:
     description: Fails to Register due to bad request data"""
     
-    # We retrive this information from the request body
-    username = request.json['username']
-    email = request.json['email']
-    password = request.json['password']
+    # We retrive this information from the request body, parsed once
+    data = request.get_json(silent=True)
     
     # Check for the password, username and email
+    error = _validate_registration(data)
+    if error:
+        return jsonify({'error':error}),HTTP_400_BAD_REQUEST
+    username, email, password = data['username'], data['email'], data['password']
+    
+    # If there is any error with the fields we generate the hash password
+    pwd_hash=passwords.hash(password)
+    
+    # Save the new patient in the database, a single INSERT (grouped with others when group commit is enabled):
+    # if the email or username is already taken the unique constraints reject it
+    try:
+        patient = group_commit.insert(Patient, {'username':username, 'password':pwd_hash, 'email':email})
+    except IntegrityError as e:
+        return jsonify({'error':_taken_message(e)}),HTTP_409_CONFLICT
+    cache.delete(patient_key(patient.id))
+    
+    # Return a message with information of the patient
+    return {'message':"Patient created",
+            'user':{
+                'username':username, 'email':email
+            }}, HTTP_201_CREATED
+
+def _validate_registration(data):
+    """Check the fields of a new patient
+
+    Args:
+        data (dict): The patient sent by the client, with username, email and password in plain text
+
+    Returns:
+        str: The error message, None if the fields are valid
+    """
+    if not isinstance(data, dict) or not all(isinstance(data.get(field), str) for field in ('username', 'email', 'password')):
+        return "Username, email and password are required"
+    
+    # Types, lengths of the columns and control characters
+    try:
+        patient_schema.load(data)
+    except ValidationError as e:
+        return str(e)
+    
+    username, email, password = data['username'], data['email'], data['password']
     if len(password)<6:
-        return jsonify({'error':"Password is too short"}),HTTP_400_BAD_REQUEST
+        return "Password is too short"
     
     if len(username)<3:
-        return jsonify({'error':"Username is too short"}),HTTP_400_BAD_REQUEST
+        return "Username is too short"
     
     if not username.isalnum() or " " in username:
-        return jsonify({'error':"Usename should be alphanumeric and should not have spaces"}),HTTP_400_BAD_REQUEST
+        return "Usename should be alphanumeric and should not have spaces"
     
     if not validators.email(email):
-        return jsonify({'error':"Email is not valid"}),HTTP_400_BAD_REQUEST
+        return "Email is not valid"
     
-    # Check if the email or username is already taken
-    if Patient.query.filter_by(email=email).first() is not None:
-        return jsonify({'error':"Email is taken"}),HTTP_409_CONFLICT
+    return None
+
+def _taken_message(error:IntegrityError) -> str:
+    """Map the unique constraint that failed to the message for the client
+
+    Args:
+        error (IntegrityError): The error raised by the database
+
+    Returns:
+        str: The message
+    """
+    # Only the name of the constraint or of the column is looked at, the message of the driver can also
+    # have the value that was taken (a username like "myemail1")
+    failed = _failed_unique(error).lower()
+    if 'email' in failed:
+        return "Email is taken"
+    if 'username' in failed:
+        return "Username is taken"
+    return "Username or email is taken"
+
+def _failed_unique(error:IntegrityError) -> str:
+    """The unique constraint that failed: its name (postgres, mysql) or its columns (sqlite)
+
+    Args:
+        error (IntegrityError): The error raised by the database
+
+    Returns:
+        str: The name or the columns, empty if the driver does not tell it
+    """
+    diag = getattr(error.orig, 'diag', None)
+    if getattr(diag, 'constraint_name', None):
+        # psycopg2, like "patient_username_key" or "ix_patient_email"
+        return diag.constraint_name
+    # sqlite: "UNIQUE constraint failed: patient.email", mysql: "Duplicate entry '...' for key 'patient.ix_patient_email'"
+    match = re.search(r"UNIQUE constraint failed: ([^\n]+)|for key '([^']+)'", str(error.orig))
+    if match is None:
+        return ''
+    return match.group(1) or match.group(2)
+
+@auth.post('/import')
+@payload_limits.limit(1024 * 1024)
+@admin_required
+def import_patients():
+    """Register many patients in a single transaction, only for administrators
+
+    Used by the onboarding migrations, the body should be like:
+    {"patients": [{"username": "...", "email": "...", "password": "..."}, ...]}
+    fullname, phone and address are optional.
+
+    Returns:
+        Http message: 201 with the created patients, or the errors and nothing is created
+    """
+    rows = (request.get_json(silent=True) or {}).get('patients')
+    if not isinstance(rows, list) or not rows:
+        return {'error':'patients should be a non empty list'},HTTP_400_BAD_REQUEST
     
-    if Patient.query.filter_by(username=username).first() is not None:
-        return jsonify({'error':"Username is taken"}),HTTP_409_CONFLICT
+    max_batch_size = current_app.config['IMPORT_MAX_BATCH_SIZE']
+    if len(rows) > max_batch_size:
+        return {'error':f'A batch can not have more than {max_batch_size} patients'},HTTP_413_REQUEST_ENTITY_TOO_LARGE
     
-    # If there is any error with the fields we generate the hash password
-    pwd_hash=generate_password_hash(password)
+    # All the patients are validated before doing anything
+    errors = []
+    emails, usernames = set(), set()
+    for index, row in enumerate(rows):
+        error = _validate_registration(row)
+        if error is None and row['email'] in emails:
+            error = "Email is repeated in the batch"
+        if error is None and row['username'] in usernames:
+            error = "Username is repeated in the batch"
+        if error:
+            errors.append({'index':index, 'error':error})
+        else:
+            emails.add(row['email'])
+            usernames.add(row['username'])
+    if errors:
+        return {'errors':errors},HTTP_400_BAD_REQUEST
     
-    # Save the new patient in the database
-    patient = Patient(username=username,password=pwd_hash,email=email)
-    db.session.add(patient)
-    db.session.commit()
+    hashes = passwords.hash_many([row['password'] for row in rows])
+    patients = [{
+        'username':row['username'],
+        'email':row['email'],
+        'password':pwd_hash,
+        'fullname':row.get('fullname'),
+        'phone':row.get('phone'),
+        'address':row.get('address'),
+    } for row, pwd_hash in zip(rows, hashes)]
     
-    # Return a message with information of the patient
-    return {'message':"Patient created",
-            'user':{
-                'username':username, 'email':email
-            }}, HTTP_201_CREATED
+    # A bulk INSERT in one transaction, if any email or username is taken nothing is created
+    try:
+        db.session.bulk_insert_mappings(Patient, patients)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return {'error':_taken_message(e)},HTTP_409_CONFLICT
+    
+    return {'message':"Patients created",
+            'count':len(patients),
+            'users':[{'username':patient['username'], 'email':patient['email']} for patient in patients]
+            }, HTTP_201_CREATED
 
 @auth.post('/login')
+@payload_limits.limit(16 * 1024)
+@limiter.limit(ip='30/minute', email='10/minute')
+@query_budget.limit(4)
 def login():
     """User log in
 ---
@@ -149,11 +300,16 @@ responses:
     
     # If exist we check the password
     if patient:
-        is_pass_correct=check_password_hash(patient.password, password)
+        is_pass_correct=passwords.verify(patient.password, password)
         # If pass is correct we create jwt refresh and access token and return them
         if is_pass_correct:
-            refresh = create_refresh_token(identity=patient.id)
-            access = create_access_token(identity=patient.id)
+            # If the hash was made with an old method or cost we take the chance to update it
+            if passwords.needs_rehash(patient.password):
+                patient.password = passwords.hash(password)
+                db.session.commit()
+            claims = admin_claims(patient)
+            refresh = create_refresh_token(identity=patient.id, additional_claims=claims)
+            access = create_access_token(identity=patient.id, additional_claims=claims)
 
             return {
                 'user':{
@@ -168,24 +324,97 @@ responses:
 
 # With jwt_required we specify that it is necessary a jwt token for access this endpoint
 @auth.get('/me')
+@limiter.limit(identity='120/minute')
+@query_budget.limit(3)
 @jwt_required()
 def me():
     
     # We get the id of the user who is logged
     patient_id = get_jwt_identity()
+    
+    # The mobile clients ask for it all the time, so it is cached
+    key = patient_key(patient_id)
+    payload = cache.get(key)
+    if payload is not None:
+        return payload,HTTP_200_OK,{'X-Cache':'HIT'}
+    
     # We get the information related to the patient logged and return his username and email.
     patient = Patient.query.filter_by(id=patient_id).first()
-    return {
-        'username': patient.username,
-        'email': patient.email
-    },HTTP_200_OK
+    payload = patient_serializer.dump(patient)
+    cache.set(key, payload)
+    return payload,HTTP_200_OK,{'X-Cache':'MISS'}
 
 # token used for refresh user token    
 @auth.get('/token/refresh')
+@limiter.limit(identity='30/minute')
+@query_budget.limit(3)
 @jwt_required(refresh=True)
 def refresh_users_token():
     identity=get_jwt_identity()
-    access = create_access_token(identity=identity)
+    # The claims are built again from the patient, an administrator removed with `flask admin remove`
+    # does not keep getting admin tokens until the refresh token expires
+    patient = Patient.query.filter_by(id=identity).first()
+    if patient is None:
+        return {'error':'Patient does not exist'},HTTP_401_UNAUTHORIZED
+    access = create_access_token(identity=identity, additional_claims=admin_claims(patient))
     return {
         'access':access
-    },HTTP_200_OK
\ No newline at end of file
+    },HTTP_200_OK
+
+# Revoke the token used in the request, access or refresh
+@auth.post('/logout')
+@payload_limits.limit(16 * 1024)
+@query_budget.limit(5)
+@jwt_required(verify_type=False)
+def logout():
+    """Revoke the token of the request
+
+    The refresh token can be sent in the body ({"refresh_token": "..."}) to revoke both at once.
+
+    Returns:
+        Http message: An http message
+    """
+    claims = [get_jwt()]
+    refresh = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh:
+        try:
+            refresh_claims = decode_token(refresh, allow_expired=True)
+        except PyJWTError:
+            return {'error':'refresh_token is not valid'},HTTP_400_BAD_REQUEST
+        # Nobody can revoke the tokens of other patient
+        if refresh_claims.get(current_app.config['JWT_IDENTITY_CLAIM']) != get_jwt_identity():
+            return {'error':'refresh_token is not valid'},HTTP_400_BAD_REQUEST
+        claims.append(refresh_claims)
+    if not all(valid_jti(token.get('jti')) for token in claims):
+        return {'error':'token is not valid'},HTTP_400_BAD_REQUEST
+    
+    # Both tokens or none
+    revoke_claims(*claims)
+    return {'message':'Token revoked'},HTTP_200_OK
+
+@auth.post('/revoke')
+@payload_limits.limit(16 * 1024)
+@admin_required
+def revoke_token():
+    """Revoke any token, only for administrators
+
+    The body should have the token ({"token": "..."}) or only its identifier ({"jti": "..."}).
+
+    Returns:
+        Http message: An http message
+    """
+    body = request.get_json(silent=True) or {}
+    if body.get('token'):
+        try:
+            claims = decode_token(body['token'], allow_expired=True)
+        except PyJWTError:
+            return {'error':'token is not valid'},HTTP_400_BAD_REQUEST
+    elif body.get('jti'):
+        claims = {'jti':body['jti']}
+    else:
+        return {'error':'token or jti is required'},HTTP_400_BAD_REQUEST
+    if not valid_jti(claims.get('jti')):
+        return {'error':'jti is not valid'},HTTP_400_BAD_REQUEST
+    
+    revoke_claims(claims)
+    return {'message':'Token revoked'},HTTP_200_OK
\ No newline at end of file
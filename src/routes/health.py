@@ -0,0 +1,56 @@
+''' Health checks for the process manager and the load balancer
+
+GET /healthz    liveness, the worker answers (it does not touch the database)
+GET /readyz     readiness, a connection of the pool of every engine (primary and replica) answers a ping
+'''
+from flask import Blueprint, current_app
+
+from src.constants.http_status_code import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+from src.database import db
+
+health = Blueprint("health",__name__)
+
+@health.get('/healthz')
+def healthz():
+    """Liveness of the worker
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: The worker is alive
+    """
+    return {'status':'ok'},HTTP_200_OK
+
+@health.get('/readyz')
+def readyz():
+    """Readiness of the worker, its database connections answer
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Every database answers
+      503:
+        description: A database does not answer, or the schema is outdated
+    """
+    databases = {}
+    ready = True
+    for bind in [None] + list(current_app.config.get('SQLALCHEMY_BINDS') or ()):
+        engine = db.get_engine(current_app, bind)
+        try:
+            # A connection of the pool and the ping of the dialect, no table is read
+            connection = engine.raw_connection()
+            try:
+                engine.dialect.do_ping(connection.dbapi_connection)
+            finally:
+                connection.close()
+        except Exception as e:
+            current_app.logger.warning('Database %s is not ready: %s', bind or 'primary', e)
+            databases[bind or 'primary'] = {'ready':False, 'pool':engine.pool.status()}
+            ready = False
+        else:
+            databases[bind or 'primary'] = {'ready':True, 'pool':engine.pool.status()}
+    if not ready:
+        return {'status':'unavailable', 'databases':databases},HTTP_503_SERVICE_UNAVAILABLE
+    return {'status':'ready', 'databases':databases},HTTP_200_OK
@@ -5,8 +5,8 @@ A Blueprint is a way to organize a group of related views and other code.
 Rather than registering views and other code directly with an application, they are 
 registered with a blueprint. Then the blueprint is registered with the application when it is available in the factory function.
 '''
-from flask import Blueprint,request
-from src.constants.http_status_code import HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_404_NOT_FOUND
+from flask import Blueprint,Response,current_app,request,stream_with_context
+from src.constants.http_status_code import HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_207_MULTI_STATUS, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_410_GONE, HTTP_413_REQUEST_ENTITY_TOO_LARGE
 
 # Import the model for prescription
 from src.models.prescription import Prescription
@@ -17,12 +17,58 @@ from flask_jwt_extended import get_jwt_identity,jwt_required
 # Import the database
 from src.database import db
 
+# Helpers for cursor pagination
+from src.utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# Helpers for the batch operations
+from src.utils.bulk import apply_operations, summarize
+
+# Inserts committed in groups, when GROUP_COMMIT_ENABLED
+from src.utils.groupcommit import group_commit
+
+# Read-through cache for single prescriptions
+from src.utils.cache import cache, prescription_key
+
+# Conditional GET (ETag / Last-Modified)
+from src.utils.conditional import conditional_response, is_conditional, make_etag, not_modified, not_modified_response
+
+# One serializer per model, with sparse fieldsets (?fields=id,title)
+from src.utils.serializers import InvalidFields, prescription_serializer
+
+# Incremental sync, with tombstones for the deleted prescriptions
+from src.utils.changes import ExpiredSyncToken, add_tombstones, list_changes, settle_seconds
+
+# Date ranges and sort of the list
+from src.utils.filters import InvalidFilter, after, order_by, parse_date, parse_filters, parse_sort
+
+# Full-text search
+from src.utils.search import parse_terms, search_prescriptions as search, terms_fingerprint
+
+# Max number of SQL statements of the routes, checked in debug and testing
+from src.utils.querybudget import query_budget
+
+# Max size of the request bodies and the validation of the prescriptions
+from src.utils.payload import payload_limits
+from src.utils.schemas import ValidationError, prescription_schema
+
+# Used by the export
+import csv
+import io
+
 # Define a blueprint for prescriptions, the name indicates where is defined, (this file) and also we specify an url.
 prescriptions = Blueprint("prescriptions",__name__,url_prefix="/api/v1/prescription")
 
+# Max number of elements that can be asked in a single page when using cursor pagination
+MAX_CURSOR_LIMIT = 100
+
+# Columns that are enough to know if a prescription changed, used for ETags
+VERSION_COLUMNS = (Prescription.id, Prescription.created_at, Prescription.updated_at)
+
 
 # Another way of declarate routes
 @prescriptions.route('/',methods=['POST','GET'])
+@payload_limits.limit(256 * 1024)
+@query_budget.limit(6)
 @jwt_required()
 def handle_prescriptions():
     """Route used for getting or posting a prescription
@@ -36,46 +82,60 @@ def handle_prescriptions():
     # If the method is post, we capture the title and body and create a new prescripton
     # it is necessary to call commit for finish transaction
     if request.method == 'POST':
-        title = request.get_json().get('title','')
-        body = request.get_json().get('body','')
-        prescription = Prescription(title=title, body=body, user_id=current_user) 
-        db.session.add(prescription)
-        db.session.commit()
+        # The body is parsed and validated once, with the title length of the column and the max size of the body
+        try:
+            values = prescription_schema.load(request.get_json(silent=True))
+        except ValidationError as e:
+            return {'error':str(e)},HTTP_400_BAD_REQUEST
+        # The commit can be shared with other requests, see src/utils/groupcommit.py
+        prescription = group_commit.insert(Prescription, {**values, 'user_id':current_user})
+        cache.delete(prescription_key(current_user, prescription.id))
 
         # Return a message with the new object
-        return {
-            'id':prescription.id,
-            'title':prescription.title,
-            'body':prescription.body,
-            'expedition_date':prescription.expedition_date,
-            'created_at':prescription.created_at,
-            'updated_at':prescription.updated_at
-        },HTTP_201_CREATED
+        return prescription_serializer.dump(prescription),HTTP_201_CREATED
     
     # If the method is get
     else:
         
+        # Sparse fieldset, when body is not asked it is not even read from the database
+        try:
+            fields = prescription_serializer.parse_fields(request.args.get('fields'))
+        except InvalidFields as e:
+            return {'error':str(e)},HTTP_400_BAD_REQUEST
+        
+        # Date ranges and sort, like ?expedition_from=2024-01-01&sort=-expedition_date
+        try:
+            conditions = parse_filters(request.args)
+            sort = parse_sort(request.args.get('sort'))
+        except InvalidFilter as e:
+            return {'error':str(e)},HTTP_400_BAD_REQUEST
+        
+        # Cursor (keyset) pagination is opt-in, old clients keep using page and per_page
+        if 'cursor' in request.args or 'limit' in request.args:
+            return _list_prescriptions_by_cursor(current_user, fields, conditions, sort)
+        
         # We define pagination
         # Pagination, page 1 by default and 5 per page by default
         page = request.args.get('page',1,type=int)
         per_page=request.args.get('per_page',5,type=int)
         
-        # We filter the prescriptions per user and then apply pagination
-        prescriptions=Prescription.query.filter_by(user_id=current_user).paginate(page=page,per_page=per_page)
+        # We filter the prescriptions per user, ordered so every page is always the same
+        _, column, descending = sort
+        query = Prescription.query.filter_by(user_id=current_user).filter(*conditions).order_by(*order_by(column, descending))
+        
+        # If the client sent an ETag we first compare it using only the ids and dates of the page
+        if is_conditional() and page >= 1 and per_page >= 1:
+            total = query.order_by(None).count()
+            versions = query.with_entities(*VERSION_COLUMNS).limit(per_page).offset((page - 1) * per_page).all()
+            etag = _list_etag(current_user, versions, total)
+            if versions and not_modified(etag):
+                return not_modified_response(etag, _last_change(versions))
         
-        # The container for the data
-        data = []
+        # Then apply pagination
+        prescriptions=query.options(*prescription_serializer.load_options(fields)).paginate(page=page,per_page=per_page)
         
-        # We iterate over the prescription paginated
-        for prescription in prescriptions.items:
-            data.append({
-            'id':prescription.id,
-            'title':prescription.title,
-            'body':prescription.body,
-            'expedition_date':prescription.expedition_date,
-            'created_at':prescription.created_at,
-            'updated_at':prescription.updated_at 
-            })
+        # The container for the data, with the prescriptions paginated
+        data = prescription_serializer.dump_many(prescriptions.items, fields)
             
         # Information regarding prescriptions and pagination
         meta = {
@@ -92,12 +152,321 @@ def handle_prescriptions():
         # http://127.0.0.1:5000/api/v1/prescription?page=1&per_page=11
         
         # Return data and information regarding the pagination (meta)
-        return {
+        # the list only honors If-None-Match, a deleted row does not change the last modification date
+        versions = [_version(prescription) for prescription in prescriptions.items]
+        return conditional_response({
             'data':data,
             'meta':meta
-        },HTTP_200_OK
+        }, _list_etag(current_user, versions, prescriptions.total), _last_change(versions), honor_if_modified_since=False)
+
+def _list_prescriptions_by_cursor(current_user, fields:tuple, conditions:list, sort:tuple):
+    """List the prescriptions of a user using keyset pagination
+
+    Instead of counting all the rows and skipping with OFFSET we seek on (user_id, sort column, id),
+    so every page costs the same no matter how deep it is.
+
+    Args:
+        current_user (int): The id of the logged user
+        fields (tuple): The fields asked by the client
+        conditions (list): The conditions of the date ranges
+        sort (tuple): The sort, from parse_sort
+
+    Returns:
+        Http message: An http message with the data and a next_cursor in meta
+    """
+    # Number of elements per page, 5 by default like per_page
+    limit = request.args.get('limit',5,type=int)
+    if limit < 1 or limit > MAX_CURSOR_LIMIT:
+        return {'error':f'limit should be between 1 and {MAX_CURSOR_LIMIT}'},HTTP_400_BAD_REQUEST
+    
+    sort_name, column, descending = sort
+    query = Prescription.query.filter(Prescription.user_id == current_user, *conditions)
+    
+    # An empty cursor means the first page
+    # The cursor has the id of the last row, and the value of the sort column when it is not the id
+    cursor = request.args.get('cursor','')
+    if cursor:
+        try:
+            values = decode_cursor(cursor)
+            last_id = int(values['id'])
+            # A cursor is only valid with the sort it was made for
+            if values.get('s', 'id') != sort_name:
+                raise InvalidCursor('cursor is not valid')
+            value = None
+            # The value of the sort column is null when the last row had no date
+            if column is not Prescription.id and values['v'] is not None:
+                value = parse_date(values['v'])
+        except (InvalidCursor, InvalidFilter, KeyError, TypeError, ValueError):
+            return {'error':'cursor is not valid'},HTTP_400_BAD_REQUEST
+        query = query.filter(after(column, descending, value, last_id))
+    
+    query = query.order_by(*order_by(column, descending)).limit(limit + 1)
+    
+    # The count is the expensive part, so it is only done when the client asks for it
+    # http://127.0.0.1:5000/api/v1/prescription?limit=5&with_total=1
+    total = None
+    if request.args.get('with_total','0') in ('1','true'):
+        total = Prescription.query.filter(Prescription.user_id == current_user, *conditions).count()
+    
+    # If the client sent an ETag we first compare it using only the ids and dates of the page
+    if is_conditional():
+        versions = query.with_entities(*VERSION_COLUMNS).all()
+        etag = _list_etag(current_user, versions[:limit], len(versions) > limit, total)
+        if not_modified(etag):
+            return not_modified_response(etag, _last_change(versions[:limit]))
+    
+    # We ask for one more row than needed, that way we know if there is a next page without counting
+    # The column of the sort is always loaded, the next cursor has its value
+    rows = query.options(*prescription_serializer.load_options(fields, (column.key,))).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    
+    data = prescription_serializer.dump_many(rows, fields)
+    
+    meta = {
+        'limit': limit,
+        'has_next': has_next,
+        'next_cursor': _next_cursor(rows[-1], sort) if has_next else None,
+    }
+    if total is not None:
+        meta['total_count'] = total
+    
+    versions = [_version(prescription) for prescription in rows]
+    return conditional_response({
+        'data':data,
+        'meta':meta
+    }, _list_etag(current_user, versions, has_next, total), _last_change(versions), honor_if_modified_since=False)
+
+def _next_cursor(prescription, sort:tuple) -> str:
+    """Cursor that points after a prescription in the order of a sort"""
+    sort_name, column, _ = sort
+    values = {'id': prescription.id}
+    # The cursors of the default sort are the same as before the sorts existed
+    if sort_name != 'id':
+        values['s'] = sort_name
+    if column is not Prescription.id:
+        value = getattr(prescription, column.key)
+        values['v'] = value.isoformat() if value is not None else None
+    return encode_cursor(values)
+
+def _version(prescription) -> tuple:
+    """The values that change every time a prescription changes, like VERSION_COLUMNS"""
+    return (prescription.id, prescription.created_at, prescription.updated_at)
+
+def _last_change(versions:list):
+    """The date of the last change in a list of versions, None if the list is empty"""
+    return max((updated_at or created_at for _, created_at, updated_at in versions if updated_at or created_at), default=None)
+
+def _list_etag(current_user, versions:list, *extra) -> str:
+    """ETag of a page of prescriptions, it changes when a row of the page or the pagination changes
+
+    Args:
+        current_user (int): The id of the logged user
+        versions (list): The (id, created_at, updated_at) of the rows of the page
+        extra: Other values of the page, like the total count
+
+    Returns:
+        str: The ETag
+    """
+    return make_etag(current_user, request.query_string, *extra, *[tuple(version) for version in versions])
+
+@prescriptions.post('/bulk')
+@payload_limits.limit(8 * 1024 * 1024)
+@jwt_required()
+def bulk_prescriptions():
+    """Create, update and delete many prescriptions in a single request
+
+    The body should be like:
+    {"operations": [
+        {"op": "create", "title": "...", "body": "..."},
+        {"op": "update", "id": 1, "title": "..."},
+        {"op": "delete", "id": 2}
+    ]}
+
+    The operations are written with bulk statements in a single transaction, or in chunks of
+    BULK_CHUNK_SIZE operations when it is configured. Every operation gets its own result.
+
+    Returns:
+        Http message: The results of every operation and a summary, 207 if any of them failed
+    """
+    current_user = get_jwt_identity()
+    operations = (request.get_json(silent=True) or {}).get('operations')
+    
+    if not isinstance(operations, list) or not operations:
+        return {'error':'operations should be a non empty list'},HTTP_400_BAD_REQUEST
+    
+    max_batch_size = current_app.config['BULK_MAX_BATCH_SIZE']
+    if len(operations) > max_batch_size:
+        return {'error':f'A batch can not have more than {max_batch_size} operations'},HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    
+    results = apply_operations(current_user, operations, current_app.config['BULK_CHUNK_SIZE'])
+    summary = summarize(results)
+    
+    return {
+        'results':results,
+        'summary':summary
+    },HTTP_207_MULTI_STATUS if summary['failed'] else HTTP_200_OK
+
+@prescriptions.get('/export')
+@jwt_required()
+def export_prescriptions():
+    """Stream all the prescriptions of the logged user as NDJSON (one json per line) or CSV
+
+    The rows are fetched from the database in chunks of EXPORT_CHUNK_SIZE with a server side cursor
+    and written to the response as soon as they arrive, so the memory used does not depend on the number of rows.
+
+    http://127.0.0.1:5000/api/v1/prescription/export?format=csv
+
+    Returns:
+        Http message: A streamed response
+    """
+    current_user = get_jwt_identity()
+    export_format = request.args.get('format','ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return {'error':'format should be ndjson or csv'},HTTP_400_BAD_REQUEST
+    try:
+        fields = prescription_serializer.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return {'error':str(e)},HTTP_400_BAD_REQUEST
+    
+    # stream_results asks the driver for a server side cursor, yield_per fetches the rows in chunks
+    query = Prescription.query.filter_by(user_id=current_user).order_by(Prescription.id) \
+        .options(*prescription_serializer.load_options(fields)) \
+        .execution_options(stream_results=True).yield_per(current_app.config['EXPORT_CHUNK_SIZE'])
+    
+    def generate_ndjson():
+        dumps = current_app.json.dumps
+        for prescription in query:
+            yield dumps(prescription_serializer.dump(prescription, fields)) + '\n'
+    
+    def generate_csv():
+        # The writer writes in a buffer that we empty after every row
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for prescription in query:
+            writer.writerow([_csv_value(value) for value in prescription_serializer.dump(prescription, fields).values()])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # The header is sent even if there are no rows
+        yield buffer.getvalue()
+    
+    if export_format == 'csv':
+        generator, mimetype = generate_csv(), 'text/csv'
+    else:
+        generator, mimetype = generate_ndjson(), 'application/x-ndjson'
+    
+    # stream_with_context keeps the request (and the database session) alive while the rows are sent
+    return Response(stream_with_context(generator), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=prescriptions.{export_format}'})
+
+@prescriptions.get('/search')
+@query_budget.limit(4)
+@jwt_required()
+def search_prescriptions():
+    """Full-text search over the title and body of the prescriptions of the logged user
+
+    The results are ranked (the best matches first) and paged with a cursor like the list. The cursor only
+    works for the same q, and the pages are not a snapshot: the changes made between two pages can repeat or
+    skip a row (see src/utils/search.py).
+
+    http://127.0.0.1:5000/api/v1/prescription/search?q=amoxicilina&limit=10
+
+    Returns:
+        Http message: An http message with the data and a next_cursor in meta
+    """
+    current_user = get_jwt_identity()
+    terms = parse_terms(request.args.get('q',''))
+    if not terms:
+        return {'error':'q should have at least one word'},HTTP_400_BAD_REQUEST
+    limit = request.args.get('limit',5,type=int)
+    if limit < 1 or limit > MAX_CURSOR_LIMIT:
+        return {'error':f'limit should be between 1 and {MAX_CURSOR_LIMIT}'},HTTP_400_BAD_REQUEST
+    try:
+        fields = prescription_serializer.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return {'error':str(e)},HTTP_400_BAD_REQUEST
+    
+    # The cursor has the number of rows already sent and the fingerprint of the search they belong to
+    fingerprint = terms_fingerprint(terms)
+    offset = 0
+    cursor = request.args.get('cursor','')
+    if cursor:
+        try:
+            values = decode_cursor(cursor)
+            offset = int(values['offset'])
+            if offset < 0 or values['q'] != fingerprint:
+                raise InvalidCursor('cursor is not valid')
+        except (InvalidCursor, KeyError, TypeError, ValueError):
+            return {'error':'cursor is not valid'},HTTP_400_BAD_REQUEST
+    
+    # We ask for one more row than needed, that way we know if there is a next page without counting
+    rows = search(current_user, terms, limit + 1, offset, prescription_serializer.load_options(fields))
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    
+    return {
+        'data':prescription_serializer.dump_many([prescription for prescription, score in rows], fields),
+        'meta':{
+            'limit': limit,
+            'has_next': has_next,
+            'next_cursor': encode_cursor({'offset': offset + limit, 'q': fingerprint}) if has_next else None,
+        }
+    },HTTP_200_OK
+
+@prescriptions.get('/changes')
+@query_budget.limit(4)
+@jwt_required()
+def prescription_changes():
+    """Prescriptions created, updated or deleted since the last sync of the client
+
+    The first sync is done without a token, then the client sends the sync_token of the previous response.
+    While has_more is true the client should ask again right away with the new token.
+
+    http://127.0.0.1:5000/api/v1/prescription/changes?since=<sync_token>&limit=100
+
+    Returns:
+        Http message: The changed prescriptions in data, the ids of the deleted ones in deleted, and the new token
+    """
+    current_user = get_jwt_identity()
+    limit = request.args.get('limit',MAX_CURSOR_LIMIT,type=int)
+    if limit < 1 or limit > MAX_CURSOR_LIMIT:
+        return {'error':f'limit should be between 1 and {MAX_CURSOR_LIMIT}'},HTTP_400_BAD_REQUEST
+    try:
+        fields = prescription_serializer.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return {'error':str(e)},HTTP_400_BAD_REQUEST
+    
+    config = current_app.config
+    try:
+        changes = list_changes(current_user, request.args.get('since',''), limit,
+                               settle_seconds(config), config['CHANGES_TOMBSTONE_DAYS'],
+                               prescription_serializer.load_options(fields))
+    except InvalidCursor:
+        return {'error':'since is not a valid sync token'},HTTP_400_BAD_REQUEST
+    except ExpiredSyncToken as e:
+        return {'error':str(e)},HTTP_410_GONE
+    
+    return {
+        'data':prescription_serializer.dump_many(changes['rows'], fields),
+        'deleted':changes['deleted'],
+        'meta':{
+            'has_more': changes['has_more'],
+            'sync_token': changes['sync_token'],
+        }
+    },HTTP_200_OK
+
+def _csv_value(value):
+    """Format a value for the csv export, dates are written in ISO 8601"""
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
 
 @prescriptions.get('/<int:id>')
+@query_budget.limit(4)
 @jwt_required()
 def get_prescription(id:int):
     """Get prescription by id
@@ -131,26 +500,49 @@ responses:
     """
     # We get the current user
     current_user = get_jwt_identity()
-    # We filter the prescription by user and id
-    prescription = Prescription.query.filter_by(user_id=current_user, id=id).first()
+    try:
+        fields = prescription_serializer.parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return {'error':str(e)},HTTP_400_BAD_REQUEST
+    
+    # The serialized prescription is cached, edit and delete remove it from the cache
+    key = prescription_key(current_user, id)
+    payload = cache.get(key)
+    if payload is not None:
+        version = (payload['id'], payload['created_at'], payload['updated_at'])
+        return conditional_response(prescription_serializer.project(payload, fields), _etag(current_user, version),
+                                    _last_change([version]), headers={'X-Cache':'HIT'})
+    
+    # If the client sent an ETag we first compare it using only the id and the dates
+    if is_conditional():
+        version = db.session.query(*VERSION_COLUMNS).filter_by(user_id=current_user, id=id).first()
+        if version and not_modified(_etag(current_user, version), _last_change([version])):
+            return not_modified_response(_etag(current_user, version), _last_change([version]))
+    
+    # We filter the prescription by user and id, only the full prescription is cached
+    options = prescription_serializer.load_options(fields)
+    prescription = Prescription.query.filter_by(user_id=current_user, id=id).options(*options).first()
     
     # If there is no prescription for the id return a error message
     if not prescription:
         return {'message':'item not found'},HTTP_404_NOT_FOUND
     
     # Else, return the searched element
-    return {
-        'id':prescription.id,
-        'title':prescription.title,
-        'body':prescription.body,
-        'expedition_date':prescription.expedition_date,
-        'created_at':prescription.created_at,
-        'updated_at':prescription.updated_at 
-    },HTTP_200_OK
+    payload = prescription_serializer.dump(prescription, fields)
+    if not options:
+        cache.set(key, payload)
+    version = _version(prescription)
+    return conditional_response(payload, _etag(current_user, version), _last_change([version]), headers={'X-Cache':'MISS'})
+
+def _etag(current_user, version:tuple) -> str:
+    """ETag of a single prescription, built from its (id, created_at, updated_at)"""
+    return make_etag(current_user, request.query_string, *version)
 
 # We are gonna update using put or patch
 @prescriptions.put('/<int:id>')
 @prescriptions.patch('/<int:id>')
+@payload_limits.limit(256 * 1024)
+@query_budget.limit(5)
 @jwt_required()
 def edit_prescription(id:int):   
     """Edit a prescription given an id
@@ -170,26 +562,23 @@ def edit_prescription(id:int):
     if not prescription:
         return {'message':'Item not found'},HTTP_404_NOT_FOUND
     
-    # We get the fields that cant be modified 
-    title = request.get_json().get('title')
-    body = request.get_json().get('body')
+    # We get the new fields, PUT replaces the prescription and PATCH only changes the fields that are sent
+    try:
+        values = prescription_schema.load(request.get_json(silent=True), partial=request.method == 'PATCH')
+    except ValidationError as e:
+        return {'error':str(e)},HTTP_400_BAD_REQUEST
     
     # We set the new fields and we commit to the db
-    prescription.title = title
-    prescription.body = body
+    for field, value in values.items():
+        setattr(prescription, field, value)
     db.session.commit()
+    cache.delete(prescription_key(current_user, id))
     
     # Return the modified element
-    return {
-        'id':prescription.id,
-        'title':prescription.title,
-        'body':prescription.body,
-        'expedition_date':prescription.expedition_date,
-        'created_at':prescription.created_at,
-        'updated_at':prescription.updated_at 
-    },HTTP_200_OK
+    return prescription_serializer.dump(prescription),HTTP_200_OK
     
 @prescriptions.delete("/<int:id>")
+@query_budget.limit(5)
 @jwt_required()
 def delete_prescription(id:int):
     """Delete a prescription by id
@@ -210,8 +599,10 @@ def delete_prescription(id:int):
     if not prescription:
         return {'message':'Item not found'},HTTP_404_NOT_FOUND
     
-    # else we delete the prescription and commit
+    # else we delete the prescription and commit, with a tombstone for the sync of the clients
     db.session.delete(prescription)
+    add_tombstones(current_user, [id])
     db.session.commit()
+    cache.delete(prescription_key(current_user, id))
     # return a message ok with no content
     return {},HTTP_204_NO_CONTENT
\ No newline at end of file
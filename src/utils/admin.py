@@ -0,0 +1,33 @@
+''' Helpers for the endpoints that only the administrators can use
+
+A patient is an administrator when Patient.is_admin is true (see `flask admin grant`).
+The login adds the claim "admin" to the tokens of the administrators, so checking it does not need a query.
+'''
+from functools import wraps
+
+from flask_jwt_extended import get_jwt, jwt_required
+
+from src.constants.http_status_code import HTTP_403_FORBIDDEN
+
+
+def admin_claims(patient) -> dict:
+    """The extra claims of the tokens of a patient
+
+    Args:
+        patient (Patient): The patient that logs in
+
+    Returns:
+        dict: {"admin": True} for the administrators, empty for the others
+    """
+    return {'admin': True} if patient.is_admin else {}
+
+
+def admin_required(view):
+    """Decorator for the views that need a valid access token of an administrator"""
+    @wraps(view)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if not get_jwt().get('admin'):
+            return {'error':'Only administrators can do this'},HTTP_403_FORBIDDEN
+        return view(*args, **kwargs)
+    return wrapper
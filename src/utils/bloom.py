@@ -0,0 +1,41 @@
+''' A compact Bloom filter
+
+A Bloom filter answers "is this item in the set?" with "no" or "maybe", using a few bits per item.
+It never gives false negatives, so when it says "no" we can skip the database.
+'''
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Bloom filter sized for a number of items and a rate of false positives
+
+    Args:
+        capacity (int): Expected number of items
+        error_rate (float): Expected rate of false positives when the filter has capacity items
+    """
+
+    def __init__(self, capacity:int=100000, error_rate:float=0.001):
+        capacity = max(1, capacity)
+        # The optimal number of bits and of hash functions for the capacity and the error rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item:str):
+        # Double hashing: the k positions come from two halves of a single digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, item:str):
+        """Add an item to the filter"""
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item:str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
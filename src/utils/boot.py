@@ -0,0 +1,43 @@
+''' Time spent by create_app in every phase of the start of the app
+
+create_app calls boot.mark(name) at the end of every phase, the time since the previous mark is the time of
+the phase. The phases are logged when the app is ready, kept in app.extensions['boot'] and exposed in /metrics
+as app_boot_seconds{phase="..."}.
+'''
+import time
+
+
+class BootTimer:
+    """Measures the phases of create_app
+
+    Args:
+        app (Flask): The application
+        imports (float, optional): Seconds spent importing the modules of the app, reported as the first phase
+            of the first app of the process, the imports only happen once
+    """
+
+    # True once the imports were reported
+    _imports_reported = False
+
+    def __init__(self, app, imports:float=None):
+        self.app = app
+        self.phases = app.extensions['boot'] = {}
+        if imports is not None and not BootTimer._imports_reported:
+            self.phases['imports'] = imports
+            BootTimer._imports_reported = True
+        self._last = time.perf_counter()
+
+    def mark(self, phase:str):
+        """End a phase, it started at the previous mark
+
+        Args:
+            phase (str): The name of the phase
+        """
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    def report(self):
+        """Log the time of every phase"""
+        self.app.logger.info('App started in %.1f ms (%s)', sum(self.phases.values()) * 1000,
+                             ', '.join(f'{phase} {seconds * 1000:.1f} ms' for phase, seconds in self.phases.items()))
@@ -0,0 +1,195 @@
+''' Apply a batch of create/update/delete operations over the prescriptions of a user
+
+The operations are validated one by one, but they are written with bulk statements:
+one INSERT for all the creates, one UPDATE (executemany) for all the updates and one DELETE for all
+the deletes, so a batch costs a few round trips and a single commit instead of one request and one commit per row.
+
+The ids of the created rows come back from the INSERT itself where the database supports RETURNING with
+executemany (postgres). On SQLite the creates are multi-row INSERTs and the ids are the range that ends at lastrowid.
+'''
+from datetime import datetime
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.constants.http_status_code import HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_500_INTERNAL_SERVER_ERROR
+from src.database import db
+from src.models.prescription import Prescription
+from src.utils.cache import cache, prescription_key
+from src.utils.changes import add_tombstones
+from src.utils.schemas import ValidationError, prescription_schema
+
+# The supported operations and the key used to count them in the summary
+OPERATIONS = {'create':'created', 'update':'updated', 'delete':'deleted'}
+
+# Rows of a multi-row INSERT on SQLite, with 4 parameters each they stay under the 999 variables of old SQLite builds
+SQLITE_INSERT_ROWS = 200
+
+
+def _error(index:int, op, status:int, message:str) -> dict:
+    return {'index':index, 'op':op, 'status':status, 'error':message}
+
+
+def _validate(index:int, operation) -> dict:
+    """Check a single operation of the batch
+
+    Args:
+        index (int): The position of the operation in the batch
+        operation (dict): The operation sent by the client
+
+    Returns:
+        dict: An error result, or None when the operation is valid (its validated fields are kept in operation['values'])
+    """
+    if not isinstance(operation, dict):
+        return _error(index, None, HTTP_400_BAD_REQUEST, 'operation should be an object')
+    op = operation.get('op')
+    if op not in OPERATIONS:
+        return _error(index, op, HTTP_400_BAD_REQUEST, f'op should be one of {", ".join(OPERATIONS)}')
+    if op != 'create' and (not isinstance(operation.get('id'), int) or isinstance(operation.get('id'), bool)):
+        return _error(index, op, HTTP_400_BAD_REQUEST, 'id should be an integer')
+    if op == 'update' and 'title' not in operation and 'body' not in operation:
+        return _error(index, op, HTTP_400_BAD_REQUEST, 'title or body is required')
+    if op != 'delete':
+        # The same schema as the single routes, the updates only check the fields they change
+        try:
+            operation['values'] = prescription_schema.load(operation, partial=op == 'update')
+        except ValidationError as e:
+            return _error(index, op, HTTP_400_BAD_REQUEST, str(e))
+    return None
+
+
+def _insert(current_user, rows:list) -> list:
+    """Insert the created prescriptions of a chunk with as few statements as the database allows
+
+    Args:
+        current_user (int): The id of the logged user
+        rows (list): The validated values of every new prescription
+
+    Raises:
+        SQLAlchemyError: When the insert fails
+
+    Returns:
+        list: The ids of the new rows, in the same order
+    """
+    created_at = datetime.now()
+    table = Prescription.__table__
+    params = [{'title':values['title'], 'body':values['body'], 'user_id':current_user, 'created_at':created_at}
+              for values in rows]
+    connection = db.session.connection()
+    if connection.dialect.insert_executemany_returning:
+        return [row.id for row in connection.execute(table.insert().returning(table.c.id), params)]
+
+    if connection.dialect.name == 'sqlite':
+        # The transaction of the chunk holds the write lock, so the rows of one INSERT get consecutive ids
+        # (the largest rowid plus one) and lastrowid is the id of the last of them
+        ids = []
+        for start in range(0, len(params), SQLITE_INSERT_ROWS):
+            part = params[start:start + SQLITE_INSERT_ROWS]
+            last = connection.execute(table.insert().values(part)).lastrowid
+            ids.extend(range(last - len(part) + 1, last + 1))
+        return ids
+
+    # Without RETURNING or a known order of the ids, every row is inserted alone and gives its own id
+    return [connection.execute(table.insert(), values).lastrowid for values in params]
+
+
+def _apply_chunk(current_user, chunk:list, results:list):
+    """Write a chunk of valid operations in a single transaction
+
+    Args:
+        current_user (int): The id of the logged user, every operation is scoped to him
+        chunk (list): Pairs of (index, operation) already validated
+        results (list): The results of the batch, filled by position
+    """
+    # A single query to know which of the referenced prescriptions belong to the user
+    ids = [operation['id'] for _, operation in chunk if operation['op'] != 'create']
+    owned = set()
+    if ids:
+        owned = {row.id for row in db.session.query(Prescription.id).filter(Prescription.user_id == current_user, Prescription.id.in_(ids))}
+
+    creates, updates, deletes = [], [], []
+    for index, operation in chunk:
+        op = operation['op']
+        if op == 'create':
+            creates.append((index, operation['values']))
+        elif operation['id'] not in owned:
+            results[index] = _error(index, op, HTTP_404_NOT_FOUND, 'Item not found')
+        elif op == 'update':
+            updates.append((index, {**operation['values'], 'id':operation['id']}))
+        else:
+            deletes.append((index, operation['id']))
+
+    try:
+        created = _insert(current_user, [values for _, values in creates]) if creates else []
+        if updates:
+            db.session.bulk_update_mappings(Prescription, [values for _, values in updates])
+        if deletes:
+            Prescription.query.filter(Prescription.user_id == current_user,
+                                      Prescription.id.in_([id for _, id in deletes])).delete(synchronize_session=False)
+            add_tombstones(current_user, [id for _, id in deletes])
+        db.session.commit()
+        # The cached copies of the changed prescriptions are not valid anymore
+        cache.delete(*[prescription_key(current_user, values['id']) for _, values in updates],
+                     *[prescription_key(current_user, id) for _, id in deletes])
+    except SQLAlchemyError:
+        db.session.rollback()
+        for index, operation in chunk:
+            if results[index] is None:
+                results[index] = _error(index, operation['op'], HTTP_500_INTERNAL_SERVER_ERROR, 'The chunk was rolled back')
+        return
+
+    for (index, _), id in zip(creates, created):
+        results[index] = {'index':index, 'op':'create', 'status':HTTP_201_CREATED, 'id':id}
+    for index, values in updates:
+        results[index] = {'index':index, 'op':'update', 'status':HTTP_200_OK, 'id':values['id']}
+    for index, id in deletes:
+        results[index] = {'index':index, 'op':'delete', 'status':HTTP_204_NO_CONTENT, 'id':id}
+
+
+def apply_operations(current_user, operations:list, chunk_size:int=0) -> list:
+    """Validate and apply a batch of operations
+
+    Args:
+        current_user (int): The id of the logged user
+        operations (list): The operations sent by the client
+        chunk_size (int, optional): Number of operations per transaction, 0 means a single transaction. Defaults to 0.
+
+    Returns:
+        list: A result for every operation, in the same order
+    """
+    results = [None] * len(operations)
+    valid = []
+    seen = set()
+    for index, operation in enumerate(operations):
+        error = _validate(index, operation)
+        # The writes of a batch are grouped by kind, so the same prescription can only be touched once
+        if error is None and operation['op'] != 'create':
+            if operation['id'] in seen:
+                error = _error(index, operation['op'], HTTP_400_BAD_REQUEST, 'id appears more than once in the batch')
+            seen.add(operation['id'])
+        if error:
+            results[index] = error
+        else:
+            valid.append((index, operation))
+
+    chunk_size = chunk_size if chunk_size and chunk_size > 0 else max(len(valid), 1)
+    for start in range(0, len(valid), chunk_size):
+        _apply_chunk(current_user, valid[start:start + chunk_size], results)
+    return results
+
+
+def summarize(results:list) -> dict:
+    """Count the results of a batch by kind
+
+    Args:
+        results (list): The results returned by apply_operations
+
+    Returns:
+        dict: The summary of the batch
+    """
+    summary = {'total':len(results), 'created':0, 'updated':0, 'deleted':0, 'failed':0}
+    for result in results:
+        if 'error' in result:
+            summary['failed'] += 1
+        else:
+            summary[OPERATIONS[result['op']]] += 1
+    return summary
@@ -0,0 +1,204 @@
+''' Read-through cache for serialized payloads
+
+The cache is pluggable: the backend is chosen with the CACHE_BACKEND config key.
+- "lru" (default): an in-process LRU with a time to live for every entry
+- "null": disables the cache
+- "package.module:ClassName": any class that implements CacheBackend, for example one backed by redis
+
+The in-process backend is per worker, a delete only clears the copy of the worker that did the write and the
+others serve the old value (and its ETag) until it expires. So when the app runs in several worker processes
+(SERVER_WORKERS > 1, set by gunicorn.conf.py) its entries live at most CACHE_LOCAL_TTL seconds (1 by default),
+use a shared backend to cache them longer.
+
+The values read from the read replica are not saved, they can be behind the primary (see src.utils.replica).
+
+Usage:
+    payload = cache.get(prescription_key(user_id, id))
+    cache.set(prescription_key(user_id, id), payload)
+    cache.delete(prescription_key(user_id, id))
+'''
+import importlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from src.utils.replica import reads_from_replica
+
+
+def prescription_key(user_id, id) -> str:
+    """Key of a serialized prescription"""
+    return f'prescription:{user_id}:{id}'
+
+
+def patient_key(user_id) -> str:
+    """Key of a serialized patient"""
+    return f'patient:{user_id}'
+
+
+class CacheBackend:
+    """Interface that every cache backend should implement"""
+
+    def get(self, key:str):
+        """Returns the value saved for key, or None if there is no value"""
+        raise NotImplementedError
+
+    def set(self, key:str, value, ttl:float=None):
+        """Saves value for key, ttl is the number of seconds the value is valid"""
+        raise NotImplementedError
+
+    def delete(self, *keys:str):
+        """Removes the values saved for the keys"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Removes all the values"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Returns the counters of the backend: hits, misses, evictions and size"""
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    """Backend that never saves anything, used to disable the cache"""
+
+    def __init__(self, **options):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'hits':0, 'misses':self.misses, 'evictions':0, 'size':0}
+
+
+class LRUCache(CacheBackend):
+    """In-process cache, when it is full the least recently used entry is evicted
+
+    Args:
+        max_entries (int): Max number of entries
+        ttl (float): Default number of seconds an entry is valid
+    """
+
+    def __init__(self, max_entries:int=1024, ttl:float=30, **options):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, value), the order is the order of use
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions, 'size':len(self._entries)}
+
+
+# Names that can be used in CACHE_BACKEND
+BACKENDS = {
+    'lru': LRUCache,
+    'null': NullCache,
+}
+
+
+class Cache:
+    """Flask extension that holds the cache backend of the app
+
+    The methods are proxies to the backend of the current app.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Create the backend configured in the app
+
+        Args:
+            app (Flask): The application
+        """
+        name = app.config.get('CACHE_BACKEND', 'lru')
+        if name in BACKENDS:
+            backend_class = BACKENDS[name]
+        else:
+            module_name, _, class_name = name.partition(':')
+            backend_class = getattr(importlib.import_module(module_name), class_name)
+        ttl = app.config.get('CACHE_TTL', 30)
+        local_ttl = app.config.get('CACHE_LOCAL_TTL', 1)
+        if issubclass(backend_class, LRUCache) and app.config.get('SERVER_WORKERS', 1) > 1 and ttl > local_ttl:
+            app.logger.warning('The in-process cache is not shared by the %s workers, its entries live %s seconds instead of %s',
+                               app.config['SERVER_WORKERS'], local_ttl, ttl)
+            ttl = local_ttl
+        app.extensions['cache'] = backend_class(max_entries=app.config.get('CACHE_MAX_ENTRIES', 1024), ttl=ttl)
+
+    @property
+    def backend(self) -> CacheBackend:
+        return current_app.extensions['cache']
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        # A value read from the replica can be behind the primary, it would be served until it expires
+        if reads_from_replica():
+            return
+        self.backend.set(key, value, ttl)
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+# Instance cache object, initialized in create_app
+cache = Cache()
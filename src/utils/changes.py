@@ -0,0 +1,178 @@
+''' Incremental sync of the prescriptions ("changes since")
+
+A client keeps the sync_token of its last sync and asks only for what changed after it:
+the rows created or updated (ordered by the moment of their last write, coalesce(updated_at, created_at))
+and the tombstones of the deleted ones (ordered by deleted_at). Both lists are read with keyset pagination,
+the token has the position reached in each of them.
+
+A write is stamped before its transaction commits, so a row can become visible with a stamp older than rows that
+were already synced. To not miss it, a sync only reads the changes older than the settle window (settle_seconds):
+the longest a transaction can stay open after stamping its rows. By default it comes from the timeouts that end
+a slow transaction, so raising one of them also raises the window. Without a statement timeout (postgres, mysql)
+nothing bounds a transaction, then a commit slower than the window can still be missed.
+
+Tombstones are kept CHANGES_TOMBSTONE_DAYS days, a token older than that can not be used (the client missed
+deletions) and the client has to sync again from the start.
+'''
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from src.database import db
+from src.models.prescription import Prescription
+from src.models.prescription_tombstone import PrescriptionTombstone
+from src.utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# Added to the timeouts in the settle window, for the work of a transaction that none of them bounds
+SETTLE_MARGIN_SECONDS = 2
+
+# The moment of the last write of a prescription, the same expression as the index ix_prescription_user_id_changed_at
+CHANGED_AT = sa.func.coalesce(Prescription.updated_at, Prescription.created_at)
+
+
+class ExpiredSyncToken(Exception):
+    """Raised when a token is older than the tombstones that are kept"""
+
+
+def settle_seconds(config) -> float:
+    """The settle window of the sync, see the module docstring
+
+    Args:
+        config (Config): The config of the app. CHANGES_SETTLE_SECONDS wins when it is set, otherwise the window
+            is the sum of the waits of a write before its commit: the lock (busy_timeout of SQLite), the statement
+            (DB_STATEMENT_TIMEOUT_MS) and the batch of the group commit (GROUP_COMMIT_TIMEOUT), plus a margin.
+
+    Returns:
+        float: The seconds
+    """
+    if config.get('CHANGES_SETTLE_SECONDS') is not None:
+        return config['CHANGES_SETTLE_SECONDS']
+    seconds = SETTLE_MARGIN_SECONDS + (config.get('DB_STATEMENT_TIMEOUT_MS') or 0) / 1000
+    if (config.get('SQLALCHEMY_DATABASE_URI') or '').startswith('sqlite'):
+        # sqlite3 waits 5 seconds for the lock when there is no busy_timeout
+        seconds += (config.get('SQLITE_PRAGMAS') or {}).get('busy_timeout', 5000) / 1000
+    if config.get('GROUP_COMMIT_ENABLED'):
+        seconds += config.get('GROUP_COMMIT_TIMEOUT', 10)
+    return seconds
+
+
+def add_tombstones(user_id, ids:list):
+    """Record the deletion of some prescriptions, in the transaction that deletes them
+
+    Args:
+        user_id (int): The owner of the prescriptions
+        ids (list): The ids of the deleted prescriptions
+    """
+    now = datetime.now()
+    db.session.bulk_insert_mappings(PrescriptionTombstone, [
+        {'prescription_id':id, 'user_id':user_id, 'deleted_at':now} for id in ids
+    ])
+
+
+def encode_sync_token(changed:tuple, deleted:tuple) -> str:
+    """Encode the positions reached in the changes and in the tombstones
+
+    Args:
+        changed (tuple): (moment, id) of the last changed row, or None when no row was returned yet
+        deleted (tuple): (moment, id) of the last tombstone
+
+    Returns:
+        str: The opaque token
+    """
+    values = {'d': [deleted[0].isoformat(), deleted[1]]}
+    if changed is not None:
+        values['c'] = [changed[0].isoformat(), changed[1]]
+    return encode_cursor(values)
+
+
+def decode_sync_token(token:str) -> tuple:
+    """Decode a token generated by encode_sync_token
+
+    Args:
+        token (str): The token sent by the client
+
+    Raises:
+        InvalidCursor: When the token is malformed
+
+    Returns:
+        tuple: The positions (changed, deleted)
+    """
+    values = decode_cursor(token)
+    try:
+        positions = []
+        for key in ('c', 'd'):
+            if key in values:
+                moment, id = values[key]
+                positions.append((datetime.fromisoformat(moment), int(id)))
+            else:
+                positions.append(None)
+    except (TypeError, ValueError):
+        raise InvalidCursor('sync token is not valid')
+    if positions[1] is None:
+        raise InvalidCursor('sync token is not valid')
+    return tuple(positions)
+
+
+def _after(moment, id_column, position:tuple):
+    """Condition for the rows after a (moment, id) position"""
+    last_moment, last_id = position
+    return sa.or_(moment > last_moment, sa.and_(moment == last_moment, id_column > last_id))
+
+
+def list_changes(user_id, token:str, limit:int, settle_seconds:float, tombstone_days:float, options:tuple=()) -> dict:
+    """Read the changes of the prescriptions of a user since a token
+
+    Args:
+        user_id (int): The owner of the prescriptions
+        token (str): The token of the last sync, empty for the first sync
+        limit (int): Max number of changed rows and of tombstones
+        settle_seconds (float): Only changes older than these seconds are read
+        tombstone_days (float): Days the tombstones are kept
+        options (tuple, optional): Loader options of the query, to read only some columns
+
+    Raises:
+        InvalidCursor: When the token is malformed
+        ExpiredSyncToken: When the token is older than the tombstones
+
+    Returns:
+        dict: The changed prescriptions, the ids of the deleted ones, has_more and the new token
+    """
+    now = datetime.now()
+    horizon = now - timedelta(seconds=settle_seconds)
+    if token:
+        changed, deleted = decode_sync_token(token)
+        if deleted[0] < now - timedelta(days=tombstone_days):
+            raise ExpiredSyncToken('sync token expired, sync again from the start')
+    else:
+        # A new client has nothing to delete, only the deletions from now on matter
+        changed, deleted = None, (horizon, 0)
+
+    query = Prescription.query.filter(Prescription.user_id == user_id, CHANGED_AT <= horizon)
+    if changed is not None:
+        query = query.filter(_after(CHANGED_AT, Prescription.id, changed))
+    rows = query.options(*options).order_by(CHANGED_AT, Prescription.id).limit(limit + 1).all()
+
+    # A tombstone whose id was used again by a newer row of the same user is not sent, the row is in the changes
+    reused = sa.exists().where(Prescription.id == PrescriptionTombstone.prescription_id,
+                               Prescription.user_id == PrescriptionTombstone.user_id)
+    tombstones = db.session.query(PrescriptionTombstone.id, PrescriptionTombstone.prescription_id, PrescriptionTombstone.deleted_at) \
+        .filter(PrescriptionTombstone.user_id == user_id, PrescriptionTombstone.deleted_at <= horizon,
+                _after(PrescriptionTombstone.deleted_at, PrescriptionTombstone.id, deleted), ~reused) \
+        .order_by(PrescriptionTombstone.deleted_at, PrescriptionTombstone.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit or len(tombstones) > limit
+    rows = rows[:limit]
+    if rows:
+        changed = (rows[-1].updated_at or rows[-1].created_at, rows[-1].id)
+    if len(tombstones) > limit:
+        deleted = (tombstones[limit - 1].deleted_at, tombstones[limit - 1].id)
+    else:
+        # Every tombstone until the horizon was sent, so the token moves there and does not expire while the client syncs
+        deleted = max(deleted, (horizon, 0))
+
+    return {
+        'rows': rows,
+        'deleted': [tombstone.prescription_id for tombstone in tombstones[:limit]],
+        'has_more': has_more,
+        'sync_token': encode_sync_token(changed, deleted),
+    }
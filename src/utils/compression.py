@@ -0,0 +1,127 @@
+''' Compression of the responses, negotiated with the Accept-Encoding header of the client
+
+gzip is always available, brotli (br) and zstd are used when the packages brotli and zstandard are installed.
+
+Only responses bigger than COMPRESS_MIN_SIZE and with a compressible mimetype are compressed.
+Streamed responses (like the export) and responses that already have a Content-Encoding are left untouched.
+
+The extension counts the bytes before and after compressing and the time spent, see compress.stats(),
+useful to tune COMPRESS_MIN_SIZE and the levels.
+'''
+import gzip
+import threading
+import time
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+# Encodings in order of preference when the client accepts more than one with the same quality
+ENCODINGS = ('br', 'zstd', 'gzip')
+
+# Default mimetypes that are worth compressing
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain',
+                      'text/css', 'application/javascript')
+
+
+def available_encodings() -> tuple:
+    """Returns the encodings that can be used with the installed packages"""
+    installed = {'gzip': True, 'br': brotli is not None, 'zstd': zstandard is not None}
+    return tuple(encoding for encoding in ENCODINGS if installed[encoding])
+
+
+class Compress:
+    """Flask extension that compresses the responses"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the configuration and register the after_request hook
+
+        Args:
+            app (Flask): The application
+        """
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_LEVEL', 4)
+        app.config.setdefault('COMPRESS_ZSTD_LEVEL', 3)
+        app.config.setdefault('COMPRESS_MIMETYPES', COMPRESS_MIMETYPES)
+        app.extensions['compress'] = self
+
+        if app.config['COMPRESS_ENABLED']:
+            encodings = available_encodings()
+            app.after_request(lambda response: self._after_request(app, encodings, response))
+
+    def _after_request(self, app, encodings, response):
+        if response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+            return response
+        # The body depends on the Accept-Encoding of the client, caches should know it
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code < 200 or response.status_code in (204, 304) or request.method == 'HEAD'
+                or response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        start = time.perf_counter()
+        compressed = self._compress(app, encoding, data)
+        elapsed = time.perf_counter() - start
+        self._record(encoding, len(data), len(compressed), elapsed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag identifies the exact bytes, so every encoding needs its own one
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
+
+    def _compress(self, app, encoding:str, data:bytes) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(data, quality=app.config['COMPRESS_BROTLI_LEVEL'])
+        if encoding == 'zstd':
+            return zstandard.ZstdCompressor(level=app.config['COMPRESS_ZSTD_LEVEL']).compress(data)
+        return gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'])
+
+    def _record(self, encoding:str, size_in:int, size_out:int, elapsed:float):
+        with self._lock:
+            stats = self._stats.setdefault(encoding, {'responses':0, 'bytes_in':0, 'bytes_out':0, 'seconds':0.0})
+            stats['responses'] += 1
+            stats['bytes_in'] += size_in
+            stats['bytes_out'] += size_out
+            stats['seconds'] += elapsed
+
+    def stats(self) -> dict:
+        """Counters per encoding: responses compressed, bytes before and after, bytes saved and seconds spent
+
+        Returns:
+            dict: The counters, by encoding
+        """
+        with self._lock:
+            return {encoding: dict(stats, bytes_saved=stats['bytes_in'] - stats['bytes_out'])
+                    for encoding, stats in self._stats.items()}
+
+
+# Instance compress object, initialized in create_app
+compress = Compress()
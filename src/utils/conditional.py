@@ -0,0 +1,134 @@
+''' Helpers for conditional GET (ETag / Last-Modified)
+
+The clients send back the ETag they got with If-None-Match (or the date with If-Modified-Since),
+if the resource did not change we answer 304 Not Modified without a body.
+
+The idea is to decide it with a cheap query (only ids and dates) before loading and serializing the full rows.
+'''
+import hashlib
+from datetime import timezone
+
+from flask import make_response, request
+
+from src.constants.http_status_code import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+from src.utils.compression import ENCODINGS
+
+
+def is_conditional() -> bool:
+    """Returns True if the request has conditional headers"""
+    return bool(request.if_none_match) or request.if_modified_since is not None
+
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from the values that identify a version of a resource
+
+    Args:
+        parts: The values, for example the id and the updated_at of a row
+
+    Returns:
+        str: The ETag, without quotes
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def to_http_date(value):
+    """Our dates are saved in local time without timezone, the headers need them in UTC
+
+    Args:
+        value (datetime): A naive datetime in local time
+
+    Returns:
+        datetime: The same moment in UTC, without microseconds
+    """
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def not_modified(etag:str, last_modified=None) -> bool:
+    """Check the conditional headers of the request
+
+    If-None-Match has priority over If-Modified-Since, like the RFC 7232 says.
+
+    Args:
+        etag (str): The current ETag of the resource
+        last_modified (datetime, optional): The last change of the resource, None to ignore If-Modified-Since.
+
+    Returns:
+        bool: True if the client already has the current version
+    """
+    if request.if_none_match:
+        return _matching_etag(etag) is not None
+    if last_modified is not None and request.if_modified_since is not None:
+        return to_http_date(last_modified) <= request.if_modified_since
+    return False
+
+
+def conditional_response(payload, etag:str, last_modified=None, status:int=HTTP_200_OK, headers:dict=None,
+                         honor_if_modified_since:bool=True):
+    """Build the response with the validators, or a 304 if the client already has this version
+
+    Args:
+        payload (dict): The body of the response
+        etag (str): The ETag of the payload
+        last_modified (datetime, optional): The last change of the payload
+        status (int, optional): The status when the payload is sent. Defaults to 200.
+        headers (dict, optional): Extra headers
+        honor_if_modified_since (bool, optional): False for lists, where a deleted row does not change the date. Defaults to True.
+
+    Returns:
+        Response: The response
+    """
+    if not_modified(etag, last_modified if honor_if_modified_since else None):
+        return not_modified_response(etag, last_modified, headers)
+    response = make_response(payload, status, headers or {})
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def not_modified_response(etag:str, last_modified=None, headers:dict=None):
+    """Build a 304 response, without body
+
+    Args:
+        etag (str): The ETag of the resource
+        last_modified (datetime, optional): The last change of the resource
+        headers (dict, optional): Extra headers
+
+    Returns:
+        Response: The response
+    """
+    response = make_response('', HTTP_304_NOT_MODIFIED, headers or {})
+    # The same validator as the response the client has, with the suffix of its encoding if it was compressed
+    _set_validators(response, _matching_etag(etag) or etag, last_modified)
+    return response
+
+
+def _matching_etag(etag:str) -> str:
+    """The variant of the ETag sent by the client in If-None-Match
+
+    The compressed responses have the encoding added to the ETag, see src.utils.compression
+
+    Args:
+        etag (str): The current ETag of the resource
+
+    Returns:
+        str: The ETag, with the suffix of the encoding the client got, None if it does not match
+    """
+    if not request.if_none_match:
+        return None
+    for candidate in (etag, *(f'{etag}-{encoding}' for encoding in ENCODINGS)):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = to_http_date(last_modified)
+    # The client can keep the response but it should ask us before using it again
+    response.headers['Cache-Control'] = 'private, no-cache'
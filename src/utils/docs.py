@@ -0,0 +1,132 @@
+''' API docs: the Swagger UI and /apispec.json, generated by flasgger from src/config/swagger.py and the docstrings
+of the routes
+
+SWAGGER_MODE:
+    eager       flasgger is set up when the app starts and the spec is built then, like a development server expects
+    lazy        flasgger is imported and the spec is built on the first request to the docs (the default)
+    static      /apispec.json is served from SWAGGER_STATIC_FILE, generated at build time with `flask docs build`
+    disabled    there are no docs
+
+Importing flasgger (and jsonschema, yaml, mistune) and walking every route is a good part of the start of a
+worker, in the lazy and static modes a worker that never serves the docs never pays for it.
+'''
+import importlib.util
+import os
+import threading
+
+from flask import Blueprint, Response, current_app, jsonify, redirect, url_for
+
+from src.config.swagger import swagger_config, template
+
+# Values of SWAGGER_MODE
+MODES = ('eager', 'lazy', 'static', 'disabled')
+
+
+def build_spec(app) -> dict:
+    """Build the OpenAPI spec of an app with flasgger, without registering its views
+
+    Args:
+        app (Flask): The application
+
+    Returns:
+        dict: The spec, as served in /apispec.json
+    """
+    return _swagger(app).get_apispecs(swagger_config['specs'][0]['endpoint'])
+
+
+def _swagger(app):
+    from flasgger import Swagger
+    swagger = Swagger(config=dict(swagger_config), template=template)
+    swagger.app = app
+    swagger.load_config(app)
+    return swagger
+
+
+class ApiDocs:
+    """Flask extension that serves the docs in the mode of SWAGGER_MODE"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the docs, it should be the last extension, so the spec has all the routes
+
+        Args:
+            app (Flask): The application
+
+        Raises:
+            ValueError: When SWAGGER_MODE is not one of MODES
+        """
+        app.config.setdefault('SWAGGER_MODE', 'lazy')
+        # By default the static spec is in the instance folder
+        app.config['SWAGGER_STATIC_FILE'] = app.config.get('SWAGGER_STATIC_FILE') or os.path.join(app.instance_path, 'apispec.json')
+        mode = app.config['SWAGGER_MODE']
+        if mode not in MODES:
+            raise ValueError(f'SWAGGER_MODE should be one of {", ".join(MODES)}, not {mode}')
+        # The flasgger object of the lazy mode and the spec of the static mode
+        state = app.extensions['api_docs'] = {'mode': mode, 'swagger': None, 'spec': None}
+        if mode == 'disabled':
+            return
+
+        if mode == 'eager':
+            from flasgger import Swagger
+            swagger = Swagger(app, config=dict(swagger_config), template=template)
+            with app.app_context():
+                swagger.get_apispecs(swagger_config['specs'][0]['endpoint'])
+            return
+
+        if mode == 'static':
+            path = app.config['SWAGGER_STATIC_FILE']
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    state['spec'] = file.read()
+            else:
+                # The docs still work, the spec is built on the first request as in the lazy mode
+                app.logger.warning('%s does not exist, run `flask docs build`, the spec will be built on demand', path)
+        app.register_blueprint(self._blueprint(app))
+
+    def _blueprint(self, app) -> Blueprint:
+        """The views of flasgger, with the same endpoints, importing it only when they are used"""
+        # find_spec locates the package without importing it
+        package = os.path.dirname(importlib.util.find_spec('flasgger').origin)
+        ui = f'ui{app.config.get("SWAGGER", {}).get("uiversion", 3)}'
+        blueprint = Blueprint('flasgger', __name__,
+                              template_folder=os.path.join(package, ui, 'templates'),
+                              static_folder=os.path.join(package, ui, 'static'),
+                              static_url_path=swagger_config['static_url_path'])
+        for spec in swagger_config['specs']:
+            blueprint.add_url_rule(spec['route'], spec['endpoint'], self._spec)
+        if swagger_config.get('swagger_ui', True):
+            blueprint.add_url_rule(swagger_config['specs_route'], 'apidocs', self._ui)
+            blueprint.add_url_rule('/oauth2-redirect.html', 'oauth_redirect', self._oauth_redirect)
+            blueprint.add_url_rule('/apidocs/index.html', 'apidocs_index', lambda: redirect(url_for('flasgger.apidocs')))
+        return blueprint
+
+    def _get_swagger(self):
+        state = current_app.extensions['api_docs']
+        with self._lock:
+            if state['swagger'] is None:
+                state['swagger'] = _swagger(current_app._get_current_object())
+                current_app.logger.info('Swagger loaded on demand')
+            return state['swagger']
+
+    def _spec(self):
+        state = current_app.extensions['api_docs']
+        if state['spec'] is not None:
+            return Response(state['spec'], mimetype='application/json')
+        # flasgger keeps the spec once it is built (except in debug mode)
+        return jsonify(self._get_swagger().get_apispecs(swagger_config['specs'][0]['endpoint']))
+
+    def _ui(self):
+        from flasgger.base import APIDocsView
+        return APIDocsView(view_args={'config': self._get_swagger().config}).get()
+
+    def _oauth_redirect(self):
+        from flasgger.base import OAuthRedirect
+        return OAuthRedirect().get()
+
+
+# Instance api_docs object, initialized in create_app
+api_docs = ApiDocs()
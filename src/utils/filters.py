@@ -0,0 +1,125 @@
+''' Filters and sorting of the list of prescriptions
+
+Date ranges (ISO 8601 dates or datetimes, "from" is included and "to" is not):
+    ?expedition_from=2024-01-01&expedition_to=2024-04-01
+    ?created_from=2024-01-01T08:00:00
+
+Sorting, by id (the default), expedition_date or created_at, with a "-" for descending order:
+    ?sort=-expedition_date
+
+The id is always the last key of the order, so the order is total and works with the cursor pagination.
+Every sort is backed by an index (user_id, column, id), so a page is a seek on the index.
+The dates can be NULL, the rows without a date always come last (NULLS LAST) in both directions.
+'''
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from src.models.prescription import Prescription
+
+# Columns that can be used to sort
+SORTS = {
+    'id': Prescription.id,
+    'expedition_date': Prescription.expedition_date,
+    'created_at': Prescription.created_at,
+}
+
+# Query parameter -> (column, operator)
+RANGES = {
+    'expedition_from': (Prescription.expedition_date, '>='),
+    'expedition_to': (Prescription.expedition_date, '<'),
+    'created_from': (Prescription.created_at, '>='),
+    'created_to': (Prescription.created_at, '<'),
+}
+
+
+class InvalidFilter(ValueError):
+    """Raised when a client sends a filter or a sort we can not use"""
+
+
+def parse_date(value:str) -> datetime:
+    """Parse a date of a filter
+
+    Args:
+        value (str): A date or a datetime in ISO 8601
+
+    Raises:
+        InvalidFilter: When the date is not valid
+
+    Returns:
+        datetime: The date
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidFilter(f'{value} is not a valid date, use ISO 8601 like 2024-01-31')
+
+
+def parse_filters(args) -> list:
+    """Conditions of the date ranges sent by the client
+
+    Args:
+        args (MultiDict): The query parameters
+
+    Raises:
+        InvalidFilter: When a date is not valid
+
+    Returns:
+        list: The conditions for query.filter()
+    """
+    conditions = []
+    for name, (column, operator) in RANGES.items():
+        if args.get(name):
+            date = parse_date(args[name])
+            conditions.append(column >= date if operator == '>=' else column < date)
+    return conditions
+
+
+def parse_sort(value:str) -> tuple:
+    """Parse the sort sent by the client
+
+    Args:
+        value (str): Like "expedition_date" or "-expedition_date", None for the default
+
+    Raises:
+        InvalidFilter: When the column can not be used to sort
+
+    Returns:
+        tuple: The name of the sort, the column and True when the order is descending
+    """
+    value = value or 'id'
+    name = value.lstrip('-')
+    if name not in SORTS:
+        raise InvalidFilter(f'sort should be one of {", ".join(SORTS)}, with a - for descending order')
+    return value, SORTS[name], value.startswith('-')
+
+
+def order_by(column, descending:bool) -> tuple:
+    """The order of the query for a sort, the id breaks the ties"""
+    if column is Prescription.id:
+        return (Prescription.id.desc() if descending else Prescription.id,)
+    if descending:
+        return column.desc().nulls_last(), Prescription.id.desc()
+    return column.asc().nulls_last(), Prescription.id
+
+
+def after(column, descending:bool, value, last_id:int):
+    """Condition for the rows that come after a row in the order of a sort (the seek of the cursor)
+
+    Args:
+        column (Column): The column of the sort
+        descending (bool): True when the order is descending
+        value: The value of the column in the last row, None when it is NULL
+        last_id (int): The id of the last row
+
+    Returns:
+        The condition for query.filter()
+    """
+    next_id = Prescription.id < last_id if descending else Prescription.id > last_id
+    if column is Prescription.id:
+        return next_id
+    # The NULLs come last, after a NULL there are only NULLs with the next ids
+    if value is None:
+        return sa.and_(column.is_(None), next_id)
+    beyond = column < value if descending else column > value
+    return sa.or_(beyond, sa.and_(column == value, next_id), column.is_(None))
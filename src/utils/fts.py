@@ -0,0 +1,41 @@
+''' The terms of the SQLite full-text index, partitioned by the owner of the prescription
+
+FTS5 has one index for the whole table, so a MATCH reads the terms of every user even when the query only wants
+the rows of one of them. Instead every word is indexed with the id of its owner in front ("u12xamoxicilina"),
+the index is sorted by term, so the words of a user are together and a search only reads the terms of its user.
+
+owner_terms is registered as an SQL function on every SQLite connection (see src.database), the view and the
+triggers of the index use it (migration 9).
+'''
+import re
+
+# The characters that unicode61 keeps inside a token, \w alone also accepts "_"
+WORD = re.compile(r'[^\W_]+')
+
+
+def owner_prefix(user_id) -> str:
+    """The prefix of the indexed words of a user
+
+    Args:
+        user_id (int): The owner of the prescriptions
+
+    Returns:
+        str: The prefix, the x ends the id so "u1x2..." and "u12x..." can not be confused
+    """
+    return f'u{user_id}x'
+
+
+def owner_terms(user_id, text:str) -> str:
+    """The text of a column as it is indexed, every word with the prefix of its owner
+
+    Args:
+        user_id (int): The owner of the prescription, a row without owner is not indexed
+        text (str): The plain text of the column
+
+    Returns:
+        str: The words with their prefix, separated by spaces
+    """
+    if text is None or user_id is None:
+        return ''
+    prefix = owner_prefix(user_id)
+    return ' '.join(prefix + word for word in WORD.findall(text))
@@ -0,0 +1,176 @@
+''' Group commit of small inserts
+
+Every commit waits for the database to write its log to disk (fsync), so on a burst of small inserts
+(new prescriptions, registrations) the disk and not the CPU limits the throughput.
+With GROUP_COMMIT_ENABLED the inserts of the requests of a worker are handed to a writer thread that puts
+the ones that arrive together in a single transaction, committed when GROUP_COMMIT_MAX_ROWS rows are waiting or
+GROUP_COMMIT_MAX_DELAY_MS milliseconds after the first one, whatever happens first.
+The request waits until its transaction is committed, so the answer is only sent once the row is durable,
+and GROUP_COMMIT_MAX_DELAY_MS is the max latency added to a request.
+
+A request that waits more than GROUP_COMMIT_TIMEOUT cancels its insert and answers 503, the writer skips the
+cancelled inserts, so the client can retry without creating the row twice. When the writer already started the
+transaction of the insert it can not be cancelled anymore, then the request waits for its result.
+
+Every request keeps its own result: when an insert fails (for example a taken email) the transaction is
+rolled back, the failed insert gets its error and the others are written again without it.
+
+When the mode is disabled the insert is done in the transaction of the request with its own commit.
+
+    prescription = group_commit.insert(Prescription, {'title':title, 'body':body, 'user_id':user_id})
+'''
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from flask import current_app
+
+from src.constants.http_status_code import HTTP_503_SERVICE_UNAVAILABLE
+from src.database import db
+
+
+def _insert_row(connection, table, values:dict) -> dict:
+    """Insert a row and return its values, with the defaults computed by SQLAlchemy plus the generated id"""
+    result = connection.execute(table.insert().values(**values))
+    params = dict(result.last_inserted_params())
+    params.update(zip((column.key for column in table.primary_key.columns), result.inserted_primary_key))
+    return params
+
+
+class GroupCommitTimeout(Exception):
+    """Raised when the transaction of an insert was not committed in GROUP_COMMIT_TIMEOUT seconds"""
+
+
+class GroupCommitter:
+    """Flask extension that writes the inserts of the requests in groups"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        # app -> (queue of its writer thread, pid of the process that started it)
+        self._writers = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the configuration and register the error handler for GroupCommitTimeout
+
+        Args:
+            app (Flask): The application
+        """
+        app.config.setdefault('GROUP_COMMIT_ENABLED', False)
+        app.config.setdefault('GROUP_COMMIT_MAX_DELAY_MS', 5)
+        app.config.setdefault('GROUP_COMMIT_MAX_ROWS', 100)
+        app.config.setdefault('GROUP_COMMIT_TIMEOUT', 10)
+        app.extensions['group_commit'] = self
+
+        @app.errorhandler(GroupCommitTimeout)
+        def handle_group_commit_timeout(e):
+            return {'error':'The database is busy, try again later'},HTTP_503_SERVICE_UNAVAILABLE,{'Retry-After':'1'}
+
+    def _get_queue(self) -> queue.Queue:
+        """The writer thread is started on first use, and again after a fork, threads do not survive it"""
+        app = current_app._get_current_object()
+        with self._lock:
+            pending, pid = self._writers.get(app, (None, None))
+            if pending is None or pid != os.getpid():
+                pending = queue.Queue()
+                self._writers[app] = (pending, os.getpid())
+                writer = threading.Thread(target=self._write, args=(app, pending), name='group-commit', daemon=True)
+                writer.start()
+            return pending
+
+    def insert(self, model, values:dict):
+        """Insert a row and wait until it is committed
+
+        Args:
+            model (Model): The model of the row
+            values (dict): The values of the columns
+
+        Raises:
+            GroupCommitTimeout: When the writer did not start the insert in GROUP_COMMIT_TIMEOUT seconds
+            SQLAlchemyError: When the insert of this row fails, like IntegrityError
+
+        Returns:
+            Model: The row, with its id and the default values
+        """
+        config = current_app.config
+        if not config['GROUP_COMMIT_ENABLED']:
+            try:
+                params = _insert_row(db.session.connection(), model.__table__, values)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            # Like in the group commit, reading the instance does not query the row again
+            return model(**params)
+
+        future = Future()
+        self._get_queue().put((model.__table__, values, future))
+        try:
+            params = future.result(timeout=config['GROUP_COMMIT_TIMEOUT'])
+        except TimeoutError:
+            # Nothing was written, the writer skips a cancelled insert
+            if future.cancel():
+                raise GroupCommitTimeout()
+            # It is already in a transaction, its result is the answer
+            params = future.result()
+        # A detached instance, it is only used to build the response
+        return model(**params)
+
+    def _write(self, app, pending:queue.Queue):
+        """Loop of the writer thread"""
+        config = app.config
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + config['GROUP_COMMIT_MAX_DELAY_MS'] / 1000
+            while len(batch) < config['GROUP_COMMIT_MAX_ROWS']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # The requests that gave up are skipped, the others can not be cancelled anymore
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            # The app context gives the types of the columns their config (like the compression of the bodies)
+            with app.app_context():
+                self._commit(db.get_engine(app), batch)
+
+    def _commit(self, engine, batch:list):
+        """Write a batch in a transaction, the inserts that fail are removed and the rest is written again
+
+        Args:
+            engine (Engine): The engine of the primary database
+            batch (list): Tuples (table, values, future)
+        """
+        while batch:
+            failed = None
+            results = []
+            try:
+                with engine.begin() as connection:
+                    for index, (table, values, future) in enumerate(batch):
+                        failed = index
+                        results.append(_insert_row(connection, table, values))
+                    failed = None
+            except Exception as e:
+                if failed is None:
+                    # The commit itself failed, nothing of the batch was written
+                    for _, _, future in batch:
+                        future.set_exception(e)
+                    return
+                batch[failed][2].set_exception(e)
+                batch = batch[:failed] + batch[failed + 1:]
+                continue
+
+            for (_, _, future), params in zip(batch, results):
+                future.set_result(params)
+            return
+
+
+# Instance group_commit object, initialized in create_app
+group_commit = GroupCommitter()
@@ -0,0 +1,57 @@
+''' Fast JSON provider for the app, backed by orjson
+
+orjson is several times faster than the json module of the standard library, mostly for the lists of prescriptions.
+Like the default provider of Flask the keys are sorted, the output is compact and the dates are in HTTP format,
+but the text is not escaped to ASCII: orjson writes the accented characters as UTF-8 where the default provider
+writes \\u escapes. Both are the same JSON for the clients, only the bytes differ (the ETags do not depend on them,
+they are built from the versions of the rows, see src.utils.conditional).
+
+orjson is optional, if it is not installed the default provider of Flask is used.
+'''
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that uses orjson to serialize and deserialize"""
+
+    # The dates go to the default function of Flask so they keep the HTTP format
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self._dumps(obj, kwargs.get('indent')).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Pretty print in debug mode, like the default provider
+        indent = 2 if self.compact is False or (self.compact is None and self._app.debug) else None
+        return self._app.response_class(self._dumps(obj, indent) + b'\n', mimetype=self.mimetype)
+
+    def _dumps(self, obj, indent=None) -> bytes:
+        options = self.options
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=options)
+
+
+def make_json_provider(app):
+    """Create the JSON provider configured in JSON_PROVIDER
+
+    Args:
+        app (Flask): The application
+
+    Returns:
+        JSONProvider: orjson if it is configured and installed, the default provider of Flask otherwise
+    """
+    if app.config.get('JSON_PROVIDER', 'orjson') == 'orjson' and orjson is not None:
+        return OrjsonProvider(app)
+    return DefaultJSONProvider(app)
@@ -0,0 +1,178 @@
+''' Request metrics in the Prometheus text format
+
+For every endpoint and status class (2xx, 4xx...) we record histograms of:
+    http_request_duration_seconds   the latency of the request
+    http_request_sql_statements     the number of SQL statements it ran
+    http_request_sql_seconds        the time it spent in SQL
+The SQL numbers come from the engine events, see src.utils.sqltrace.
+
+GET /metrics also exposes the counters of the cache, the compression and the cache of verified tokens, and the
+seconds of every phase of the boot of the app.
+The metrics are per worker, Prometheus should scrape every worker (or they should be summed by the exporter).
+'''
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, g, request
+
+from src.constants.http_status_code import (is_client_error, is_informational, is_redirect, is_server_error,
+                                            is_success)
+from src.utils.sqltrace import request_sql_stats
+
+# Upper bounds of the buckets of every histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def status_class(status:int) -> str:
+    """The class of a status code, used as label
+
+    Args:
+        status (int): The status code
+
+    Returns:
+        str: "1xx", "2xx", "3xx", "4xx", "5xx" or "other"
+    """
+    for check, name in ((is_informational, '1xx'), (is_success, '2xx'), (is_redirect, '3xx'),
+                        (is_client_error, '4xx'), (is_server_error, '5xx')):
+        if check(status):
+            return name
+    return 'other'
+
+
+class Histogram:
+    """Cumulative histogram with a series per combination of labels
+
+    Args:
+        name (str): The name of the metric
+        help (str): The description of the metric
+        buckets (tuple): The upper bounds of the buckets, ordered
+    """
+
+    def __init__(self, name:str, help:str, buckets:tuple):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels:tuple, value:float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self, label_names:tuple) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            base = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {cumulative}')
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Flask extension that records the request metrics and serves them in /metrics"""
+
+    LABELS = ('endpoint', 'status')
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the hooks and the /metrics endpoint
+
+        It should be initialized before the other extensions, so its before_request runs first.
+
+        Args:
+            app (Flask): The application
+        """
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        if not app.config['METRICS_ENABLED']:
+            return
+        app.extensions['metrics'] = {
+            'latency': Histogram('http_request_duration_seconds', 'Latency of the requests', LATENCY_BUCKETS),
+            'statements': Histogram('http_request_sql_statements', 'SQL statements per request', STATEMENT_BUCKETS),
+            'sql_seconds': Histogram('http_request_sql_seconds', 'Seconds spent in SQL per request', LATENCY_BUCKETS),
+        }
+        app.before_request(self._start)
+        app.after_request(self._record)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.render)
+
+    def _start(self):
+        g.request_started = time.perf_counter()
+
+    def _record(self, response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        # The requests that match no route share a label, the paths would make too many series
+        labels = (request.endpoint or 'unmatched', status_class(response.status_code))
+        sql = request_sql_stats()
+        histograms = current_app.extensions['metrics']
+        histograms['latency'].observe(labels, time.perf_counter() - started)
+        histograms['statements'].observe(labels, sql['statements'])
+        histograms['sql_seconds'].observe(labels, sql['seconds'])
+        return response
+
+    def render(self):
+        """Metrics in the Prometheus text format
+        ---
+        tags:
+          - Metrics
+        responses:
+          200:
+            description: The metrics of this worker
+        """
+        lines = []
+        for histogram in current_app.extensions['metrics'].values():
+            lines.extend(histogram.render(self.LABELS))
+        lines.extend(_extension_metrics())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def _extension_metrics() -> list:
+    """Counters kept by the other extensions"""
+    lines = []
+    cache = current_app.extensions.get('cache')
+    if cache is not None:
+        lines.extend(_counters('cache', cache.stats()))
+
+    jwt = current_app.extensions.get('flask-jwt-extended')
+    if jwt is not None and hasattr(jwt, 'verify_cache_stats'):
+        lines.extend(_counters('jwt_verify_cache', jwt.verify_cache_stats()))
+
+    for phase, seconds in current_app.extensions.get('boot', {}).items():
+        lines.append(f'app_boot_seconds{{phase="{phase}"}} {seconds:.6f}')
+
+    compress = current_app.extensions.get('compress')
+    if compress is not None:
+        for encoding, stats in sorted(compress.stats().items()):
+            for name, value in sorted(stats.items()):
+                lines.append(f'compression_{name}{{encoding="{encoding}"}} {value}')
+    return lines
+
+
+def _counters(prefix:str, stats:dict) -> list:
+    return [f'{prefix}_{name} {value}' for name, value in sorted(stats.items())]
+
+
+# Instance metrics object, initialized in create_app
+metrics = Metrics()
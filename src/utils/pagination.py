@@ -0,0 +1,53 @@
+''' Helpers for keyset (cursor) pagination
+
+Offset pagination (page/per_page) needs a COUNT(*) and an OFFSET on every request, so the deeper the page
+the slower the query. Keyset pagination instead remembers the last row returned and seeks past it using an index,
+which costs the same for the first page and for the last one.
+
+The cursor sent to the clients is opaque: it is a url safe base64 encoded json document, clients should only
+send back what we gave them.
+'''
+import base64
+import binascii
+import json
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we can not decode"""
+
+
+def encode_cursor(values:dict) -> str:
+    """Encode the position of the last row returned as an opaque cursor
+
+    Args:
+        values (dict): The values that identify the position, for example {'id': 10}
+
+    Returns:
+        str: The opaque cursor
+    """
+    raw = json.dumps(values, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    # We remove the padding, it is not needed to decode and it is not url friendly
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor:str) -> dict:
+    """Decode a cursor generated by encode_cursor
+
+    Args:
+        cursor (str): The opaque cursor sent by the client
+
+    Raises:
+        InvalidCursor: When the cursor is malformed
+
+    Returns:
+        dict: The values that identify the position
+    """
+    # We add again the padding removed in encode_cursor
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor('cursor is not valid')
+    if not isinstance(values, dict):
+        raise InvalidCursor('cursor is not valid')
+    return values
@@ -0,0 +1,177 @@
+''' Password hashing on a bounded worker pool
+
+Hashing and checking a password is a CPU heavy key derivation (pbkdf2), done inline it blocks the thread
+of the request, so a burst of logins starves the other endpoints of the worker.
+Here the work goes to a dedicated pool with a limited number of workers and a limited queue:
+when the queue is full we fail fast with PasswordPoolBusy (503) instead of piling up requests.
+
+Configuration:
+    PASSWORD_HASH_METHOD        werkzeug method with its cost, for example "pbkdf2:sha256:600000", it is checked when
+                                the app starts (werkzeug 2.2 only supports pbkdf2 and the plain hashlib digests)
+    PASSWORD_POOL_EXECUTOR      "thread" (hashlib releases the GIL) or "process"
+    PASSWORD_POOL_WORKERS       number of workers, the number of CPUs by default
+    PASSWORD_POOL_QUEUE_DEPTH   number of tasks that can wait for a worker
+    PASSWORD_POOL_TIMEOUT       seconds a request waits for its result
+'''
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from src.constants.http_status_code import HTTP_503_SERVICE_UNAVAILABLE
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the pool can not accept more work"""
+
+
+def check_hash_method(method:str):
+    """Check that werkzeug can hash with a method, like generate_password_hash does but without hashing
+
+    Args:
+        method (str): "pbkdf2:<digest>[:<iterations>]" or the name of a hashlib digest
+
+    Raises:
+        ValueError: When the method is not supported
+    """
+    name, _, options = method.partition(':')
+    if name == 'pbkdf2':
+        digest, _, iterations = options.partition(':')
+        valid = digest in hashlib.algorithms_available and (not iterations or iterations.isdigit())
+    else:
+        valid = not options and method in hashlib.algorithms_available
+    if not valid:
+        raise ValueError(f'PASSWORD_HASH_METHOD {method!r} is not supported by werkzeug')
+
+
+class PasswordHasher:
+    """Flask extension that hashes and checks passwords on a bounded pool"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the configuration and register the error handler for PasswordPoolBusy
+
+        Args:
+            app (Flask): The application
+
+        Raises:
+            ValueError: When PASSWORD_HASH_METHOD is not supported
+        """
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        app.config.setdefault('PASSWORD_POOL_EXECUTOR', 'thread')
+        app.config.setdefault('PASSWORD_POOL_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_POOL_QUEUE_DEPTH', 4 * app.config['PASSWORD_POOL_WORKERS'])
+        app.config.setdefault('PASSWORD_POOL_TIMEOUT', 10)
+        # A wrong method would break every registration and login, the app does not start with it
+        check_hash_method(app.config['PASSWORD_HASH_METHOD'])
+        app.extensions['passwords'] = self
+
+        @app.errorhandler(PasswordPoolBusy)
+        def handle_password_pool_busy(e):
+            return {'error':'Too many requests, try again later'},HTTP_503_SERVICE_UNAVAILABLE,{'Retry-After':'1'}
+
+    def _get_pool(self):
+        """The pool is created on first use, and again after a fork, workers do not survive it"""
+        config = current_app.config
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                workers = config['PASSWORD_POOL_WORKERS']
+                executor = ProcessPoolExecutor if config['PASSWORD_POOL_EXECUTOR'] == 'process' else ThreadPoolExecutor
+                self._pool = executor(max_workers=workers)
+                # Running tasks plus the ones waiting in the queue
+                self._slots = threading.BoundedSemaphore(workers + config['PASSWORD_POOL_QUEUE_DEPTH'])
+                self._pid = os.getpid()
+            return self._pool, self._slots
+
+    def _run(self, function, *args):
+        pool, slots = self._get_pool()
+        if not slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = pool.submit(function, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=current_app.config['PASSWORD_POOL_TIMEOUT'])
+        except TimeoutError:
+            future.cancel()
+            raise PasswordPoolBusy()
+
+    def hash(self, password:str) -> str:
+        """Hash a password with the configured method
+
+        Args:
+            password (str): The password in plain text
+
+        Returns:
+            str: The hash
+        """
+        return self._run(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+    def hash_many(self, passwords:list) -> list:
+        """Hash many passwords, used by the batch imports
+
+        It uses at most half of the workers at a time, so the logins keep working while an import runs.
+        Unlike hash() it waits for a free slot instead of failing when the queue is full.
+
+        Args:
+            passwords (list): The passwords in plain text
+
+        Returns:
+            list: The hashes, in the same order
+        """
+        config = current_app.config
+        pool, slots = self._get_pool()
+        window = max(1, config['PASSWORD_POOL_WORKERS'] // 2)
+        hashes = []
+        for start in range(0, len(passwords), window):
+            futures = []
+            for password in passwords[start:start + window]:
+                if not slots.acquire(timeout=config['PASSWORD_POOL_TIMEOUT']):
+                    raise PasswordPoolBusy()
+                future = pool.submit(generate_password_hash, password, config['PASSWORD_HASH_METHOD'])
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            hashes.extend(future.result() for future in futures)
+        return hashes
+
+    def verify(self, pwhash:str, password:str) -> bool:
+        """Check a password against its hash
+
+        Args:
+            pwhash (str): The hash saved in the database
+            password (str): The password in plain text
+
+        Returns:
+            bool: True if the password is correct
+        """
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash:str) -> bool:
+        """Check if a hash was made with other method or cost than the configured one
+
+        Args:
+            pwhash (str): The hash saved in the database
+
+        Returns:
+            bool: True if the hash should be generated again
+        """
+        method = current_app.config['PASSWORD_HASH_METHOD']
+        used = pwhash.split('$', 1)[0]
+        # A method without cost ("pbkdf2:sha256") uses the default cost of werkzeug, any cost is fine
+        return used != method and not used.startswith(method + ':')
+
+
+# Instance passwords object, initialized in create_app
+passwords = PasswordHasher()
@@ -0,0 +1,96 @@
+''' Max size of the request bodies
+
+Every request is checked before its body is read: a body larger than the limit of its route is answered with
+413 Request Entity Too Large, so an oversized upload never reaches the view nor the memory of the worker.
+
+The limits are declared on the routes, the routes without one use REQUEST_MAX_BYTES, and they can be
+overridden per endpoint with PAYLOAD_LIMITS:
+
+    @prescriptions.post('/bulk')
+    @payload_limits.limit(8 * 1024 * 1024)
+    @jwt_required()
+    def bulk_prescriptions(): ...
+
+    PAYLOAD_LIMITS = {'prescriptions.bulk_prescriptions': 16 * 1024 * 1024}
+
+A body without Content-Length (chunked) is read up to the limit in the check, and kept for the view.
+'''
+import io
+
+from flask import current_app, request
+
+from src.constants.http_status_code import HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+class PayloadLimits:
+    """Flask extension that rejects the bodies larger than the limit of their route"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the before_request hook, it should run before any hook that reads the body
+
+        Args:
+            app (Flask): The application
+        """
+        app.config.setdefault('REQUEST_MAX_BYTES', 1024 * 1024)
+        app.config.setdefault('PAYLOAD_LIMITS', {})
+        app.extensions['payload_limits'] = self
+        app.before_request(self._check)
+
+        # Also raised by werkzeug for the forms larger than MAX_CONTENT_LENGTH
+        @app.errorhandler(HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        def handle_413(e):
+            return {'error':'The request is too large'},HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def limit(self, max_bytes:int):
+        """Decorator that declares the max size of the body of a route
+
+        Args:
+            max_bytes (int): The max size in bytes
+        """
+        def decorator(view):
+            view._max_body_bytes = max_bytes
+            return view
+        return decorator
+
+    def limit_for(self, endpoint:str) -> int:
+        """The max size of the body of an endpoint
+
+        Args:
+            endpoint (str): The endpoint, None when no route matched
+
+        Returns:
+            int: The max size in bytes
+        """
+        overrides = current_app.config['PAYLOAD_LIMITS']
+        if endpoint in overrides:
+            return overrides[endpoint]
+        view = current_app.view_functions.get(endpoint)
+        return getattr(view, '_max_body_bytes', current_app.config['REQUEST_MAX_BYTES'])
+
+    def _check(self):
+        limit = self.limit_for(request.endpoint)
+        if request.content_length is not None:
+            if request.content_length > limit:
+                return self._too_large(limit)
+            return None
+
+        # Without Content-Length werkzeug only reads the body when the server says it is terminated (chunked)
+        environ = request.environ
+        if not environ.get('wsgi.input_terminated'):
+            return None
+        body = environ['wsgi.input'].read(limit + 1)
+        if len(body) > limit:
+            return self._too_large(limit)
+        environ['wsgi.input'] = io.BytesIO(body)
+        return None
+
+    def _too_large(self, limit:int):
+        return {'error':f'The body of the request can not be larger than {limit} bytes'},HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+# Instance payload_limits object, initialized in create_app
+payload_limits = PayloadLimits()
@@ -0,0 +1,115 @@
+''' Query budgets and N+1 detection, for development and CI
+
+When QUERY_BUDGET_ENABLED is set (by default in debug and testing) every SQL statement of a request is checked:
+- a statement slower than QUERY_SLOW_MS is logged with the endpoint that ran it
+- the same statement run QUERY_N_PLUS_ONE_THRESHOLD times or more with different parameters is logged as a
+  probable N+1 (a lazy relationship loaded row by row, like Patient.prescriptions)
+- when the request runs more statements than the budget of its route, QueryBudgetExceeded is raised
+  and the request fails with a 500, so the test that made it fails too
+
+The budgets are declared on the routes and can be overridden per endpoint with QUERY_BUDGETS:
+
+    @prescriptions.get('/<int:id>')
+    @query_budget.limit(4)
+    @jwt_required()
+    def get_prescription(id): ...
+
+    QUERY_BUDGETS = {'prescriptions.get_prescription': 6}
+
+A budget counts every statement of the request, the ones of the token blocklist included.
+'''
+from flask import current_app, g, has_request_context, request
+
+from src.constants.http_status_code import HTTP_500_INTERNAL_SERVER_ERROR
+from src.utils.sqltrace import OBSERVERS
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more statements than its budget
+
+    Args:
+        endpoint (str): The endpoint of the request
+        budget (int): The max number of statements
+    """
+
+    def __init__(self, endpoint:str, budget:int):
+        super().__init__(f'{endpoint} ran more than {budget} SQL statements')
+        self.endpoint = endpoint
+        self.budget = budget
+
+
+class QueryBudget:
+    """Flask extension that checks the statements of every request"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the configuration and start observing the statements
+
+        Args:
+            app (Flask): The application
+        """
+        app.config.setdefault('QUERY_BUDGET_ENABLED', None)
+        app.config.setdefault('QUERY_BUDGETS', {})
+        app.config.setdefault('QUERY_SLOW_MS', 100)
+        app.config.setdefault('QUERY_N_PLUS_ONE_THRESHOLD', 5)
+        enabled = app.config['QUERY_BUDGET_ENABLED']
+        if enabled is None:
+            enabled = app.debug or app.testing
+        if not enabled:
+            return
+
+        app.extensions['query_budget'] = self
+        if self._observe not in OBSERVERS:
+            OBSERVERS.append(self._observe)
+
+        @app.errorhandler(QueryBudgetExceeded)
+        def handle_query_budget_exceeded(e):
+            return {'error':str(e)},HTTP_500_INTERNAL_SERVER_ERROR
+
+    def limit(self, budget:int):
+        """Decorator that declares the max number of statements of a route
+
+        Args:
+            budget (int): The max number of statements
+        """
+        def decorator(view):
+            view._query_budget = budget
+            return view
+        return decorator
+
+    def _budget_for(self, endpoint:str):
+        overrides = current_app.config['QUERY_BUDGETS']
+        if endpoint in overrides:
+            return overrides[endpoint]
+        view = current_app.view_functions.get(endpoint)
+        return getattr(view, '_query_budget', None)
+
+    def _observe(self, statement:str, parameters, seconds:float):
+        # The observers are shared by every app of the process, and statements also run outside requests
+        if not has_request_context() or current_app.extensions.get('query_budget') is not self:
+            return
+        config = current_app.config
+        endpoint = request.endpoint or 'unmatched'
+
+        if seconds * 1000 >= config['QUERY_SLOW_MS']:
+            current_app.logger.warning('Slow SQL statement (%.1f ms) in %s: %s', seconds * 1000, endpoint, statement)
+
+        # statement -> set of the parameters it was run with
+        seen = g.setdefault('query_budget_statements', {})
+        variants = seen.setdefault(statement, set())
+        variants.add(repr(parameters))
+        if len(variants) == config['QUERY_N_PLUS_ONE_THRESHOLD']:
+            current_app.logger.warning('Possible N+1 in %s, the same statement ran %s times with different parameters: %s',
+                                       endpoint, len(variants), statement)
+
+        g.query_budget_count = g.get('query_budget_count', 0) + 1
+        budget = self._budget_for(endpoint) if request.endpoint else None
+        if budget is not None and g.query_budget_count > budget:
+            raise QueryBudgetExceeded(endpoint, budget)
+
+
+# Instance query_budget object, initialized in create_app
+query_budget = QueryBudget()
@@ -0,0 +1,215 @@
+''' Rate limiting with token buckets
+
+Every limit is a bucket of N tokens that refills at N tokens per period, every request takes one token,
+when the bucket is empty the request is answered with 429 Too Many Requests and a Retry-After header.
+A bucket is two numbers, so the memory per key is constant, and a bucket that is full again is the same
+as a bucket that does not exist, so idle keys are evicted.
+
+The limits can be per client ip, per email (from the json body, for login and register) and per JWT identity.
+They are declared on the routes with the decorator and can be overridden per endpoint with RATELIMIT_ROUTES:
+
+    @auth.post('/login')
+    @limiter.limit(ip='30/minute', email='10/minute')
+    def login(): ...
+
+    RATELIMIT_ROUTES = {'auth.login': {'ip': '100/minute', 'email': '10/minute'}}
+
+The in-memory storage is per worker, for many workers set RATELIMIT_STORAGE to "package.module:Class"
+with a class that implements RateLimitStorage over a shared store.
+'''
+import importlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from src.constants.http_status_code import HTTP_429_TOO_MANY_REQUESTS
+
+# Seconds in every period that can be used in a limit
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# The kinds of keys a limit can use
+KINDS = ('ip', 'email', 'identity')
+
+
+def parse_limit(limit:str) -> tuple:
+    """Parse a limit like "10/minute"
+
+    Args:
+        limit (str): The number of requests and the period
+
+    Raises:
+        ValueError: When the limit is not valid
+
+    Returns:
+        tuple: The capacity of the bucket and the tokens refilled per second
+    """
+    amount, _, period = limit.partition('/')
+    period = period.strip().rstrip('s')
+    if period not in PERIODS or not amount.strip().isdigit() or int(amount) < 1:
+        raise ValueError(f'Rate limit "{limit}" is not valid, it should be like "10/minute"')
+    capacity = int(amount)
+    return capacity, capacity / PERIODS[period]
+
+
+class RateLimitStorage:
+    """Interface that every storage should implement"""
+
+    def hit(self, key:str, capacity:int, rate:float) -> float:
+        """Take a token from the bucket of key
+
+        Args:
+            key (str): The key of the bucket
+            capacity (int): The size of the bucket
+            rate (float): The tokens refilled per second
+
+        Returns:
+            float: 0 if the request is allowed, else the seconds until there is a token again
+        """
+        raise NotImplementedError
+
+
+class MemoryStorage(RateLimitStorage):
+    """Buckets in a dict of the process, with eviction of the keys that are full again
+
+    Args:
+        max_keys (int): Max number of keys, when it is reached the least recently used one is evicted
+    """
+
+    def __init__(self, max_keys:int=100000, **options):
+        self.max_keys = max_keys
+        # key -> [tokens, last update, moment the bucket is full again], the order is the order of use
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                self._buckets.move_to_end(key)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = [tokens, now, now + (capacity - tokens) / rate]
+            self._evict(now)
+            return wait
+
+    def _evict(self, now):
+        # The least recently used keys are at the start, we stop at the first one that is still in use
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket[2] > now and len(self._buckets) <= self.max_keys:
+                break
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Names that can be used in RATELIMIT_STORAGE
+STORAGES = {
+    'memory': MemoryStorage,
+}
+
+
+class Limiter:
+    """Flask extension that applies the rate limits before the views"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Create the storage and register the before_request hook
+
+        Args:
+            app (Flask): The application
+        """
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+        app.config.setdefault('RATELIMIT_MAX_KEYS', 100000)
+        app.config.setdefault('RATELIMIT_ROUTES', {})
+
+        name = app.config['RATELIMIT_STORAGE']
+        if name in STORAGES:
+            storage_class = STORAGES[name]
+        else:
+            module_name, _, class_name = name.partition(':')
+            storage_class = getattr(importlib.import_module(module_name), class_name)
+        app.extensions['limiter'] = storage_class(max_keys=app.config['RATELIMIT_MAX_KEYS'])
+
+        # The limits of the config are validated now, not in the first request
+        for endpoint, limits in app.config['RATELIMIT_ROUTES'].items():
+            self._parse(limits)
+
+        if app.config['RATELIMIT_ENABLED']:
+            app.before_request(self._check)
+
+    def limit(self, **limits):
+        """Decorator that declares the default limits of a route
+
+        Args:
+            limits: Limits by kind of key, for example ip='30/minute', email='10/minute'
+        """
+        parsed = self._parse(limits)
+
+        def decorator(view):
+            view._rate_limits = parsed
+            return view
+        return decorator
+
+    def _parse(self, limits:dict) -> dict:
+        unknown = set(limits) - set(KINDS)
+        if unknown:
+            raise ValueError(f'Unknown rate limit keys: {", ".join(sorted(unknown))}')
+        return {kind: parse_limit(limit) for kind, limit in limits.items() if limit}
+
+    def _limits_for(self, endpoint:str) -> dict:
+        overrides = current_app.config['RATELIMIT_ROUTES']
+        if endpoint in overrides:
+            return self._parse(overrides[endpoint])
+        view = current_app.view_functions.get(endpoint)
+        return getattr(view, '_rate_limits', None)
+
+    def _key_value(self, kind:str):
+        if kind == 'ip':
+            return request.remote_addr
+        if kind == 'email':
+            # Flask caches the parsed body, the view does not parse it again
+            body = request.get_json(silent=True)
+            email = body.get('email') if isinstance(body, dict) else None
+            return email.strip().lower() if isinstance(email, str) and email.strip() else None
+        # Access or refresh, the view itself checks the type it needs
+        verify_jwt_in_request(optional=True, verify_type=False)
+        return get_jwt_identity()
+
+    def _check(self):
+        if request.endpoint is None:
+            return None
+        limits = self._limits_for(request.endpoint)
+        if not limits:
+            return None
+
+        storage = current_app.extensions['limiter']
+        for kind, (capacity, rate) in limits.items():
+            value = self._key_value(kind)
+            if value is None:
+                continue
+            wait = storage.hit(f'{request.endpoint}:{kind}:{value}', capacity, rate)
+            if wait:
+                return {'error':'Too many requests'},HTTP_429_TOO_MANY_REQUESTS,{'Retry-After':str(math.ceil(wait))}
+        return None
+
+
+# Instance limiter object, initialized in create_app
+limiter = Limiter()
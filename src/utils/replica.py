@@ -0,0 +1,88 @@
+''' Read/write splitting between the primary database and a read replica
+
+When SQLALCHEMY_BINDS has a "replica" bind (DB_REPLICA_URI), the safe requests (GET, HEAD, OPTIONS) read from
+the replica and every other request uses the primary. The routing itself is done by RoutingSession in src.database.
+
+The replica is behind the primary, so after a client writes something (a mutating request that succeeded)
+the client reads from the primary for REPLICA_PIN_SECONDS, that way it always reads its own writes.
+The pin travels with the client, not in the worker: the response of the write has the moment of the write in
+the header X-Last-Write and in a cookie, and the next requests send it back (browsers send the cookie, the other
+clients should copy the header). Any worker reads the moment from the request, so the pin holds whichever worker
+gets the next request. A client that sends a fake moment only sends its own reads to the primary.
+REPLICA_PIN_SECONDS should be longer than the usual lag of the replica.
+
+The payloads read from the replica can be behind, so they are not written in the cache (see src.utils.cache).
+
+Locally two SQLite files can stand for the primary and the replica:
+
+    SQLALCHEMY_DB_URI=sqlite:////tmp/primary.db DB_REPLICA_URI=sqlite:////tmp/replica.db
+'''
+import time
+
+from flask import current_app, g, has_request_context, request
+
+from src.database import REPLICA_BIND
+
+# Methods that never change data
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Header and cookie with the moment (unix time) of the last write of the client
+LAST_WRITE_HEADER = 'X-Last-Write'
+LAST_WRITE_COOKIE = 'last_write'
+
+
+def reads_from_replica() -> bool:
+    """True when the queries of the current request go to the replica"""
+    return has_request_context() and g.get('db_use_replica', False)
+
+
+class ReplicaRouter:
+    """Flask extension that chooses the database of every request"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the configuration and register the hooks, only when there is a replica bind
+
+        Args:
+            app (Flask): The application
+        """
+        app.config.setdefault('REPLICA_PIN_SECONDS', 5)
+        if REPLICA_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+            return
+
+        app.extensions['replica_router'] = self
+        app.before_request(self._route)
+        app.after_request(self._pin)
+
+    def _last_write(self) -> float:
+        """The moment of the last write sent by the client, None if it did not send a valid one"""
+        value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    def _route(self):
+        g.db_use_replica = False
+        if request.method not in SAFE_METHODS:
+            return None
+        last_write = self._last_write()
+        # The clocks of the servers can be a bit apart, a moment in the future also pins the client
+        pin_seconds = current_app.config['REPLICA_PIN_SECONDS']
+        g.db_use_replica = last_write is None or abs(time.time() - last_write) >= pin_seconds
+        return None
+
+    def _pin(self, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            last_write = f'{time.time():.3f}'
+            response.headers[LAST_WRITE_HEADER] = last_write
+            response.set_cookie(LAST_WRITE_COOKIE, last_write, max_age=int(current_app.config['REPLICA_PIN_SECONDS']) + 1,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+# Instance replica router object, initialized in create_app
+replica_router = ReplicaRouter()
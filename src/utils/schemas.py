@@ -0,0 +1,141 @@
+''' Schemas of the json bodies
+
+Every body is parsed once (request.get_json) and validated once against the schema of its resource, the
+same schema is used by the single routes and by the bulk ones. The max lengths come from the columns of the
+models, so a value that does not fit in its column is rejected with a 400 instead of failing in the database.
+
+    try:
+        values = prescription_schema.load(request.get_json(silent=True), partial=request.method == 'PATCH')
+    except ValidationError as e:
+        return {'error':str(e)},HTTP_400_BAD_REQUEST
+
+The control characters (except tab and new lines) are not accepted in any field: postgres can not store
+NUL and src.models.types uses another one to mark the compressed bodies.
+'''
+import re
+
+from flask import current_app
+
+from src.models.patient import Patient
+from src.models.prescription import Prescription
+
+# Control characters that are rejected, tab, \n and \r are allowed
+CONTROL_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class ValidationError(ValueError):
+    """Raised when a body does not match its schema
+
+    Args:
+        errors (dict): field -> message
+    """
+
+    def __init__(self, errors:dict):
+        self.errors = errors
+        super().__init__('; '.join(f'{field} {message}' for field, message in errors.items()))
+
+
+class Field:
+    """A text field of a schema
+
+    Args:
+        required (bool, optional): The field must be sent (unless the load is partial)
+        default (str, optional): The value of a field that is not required and was not sent
+        min_length (int, optional): Min number of characters
+        max_length (int, optional): Max number of characters, usually the length of the column
+        max_bytes (int or str, optional): Max size in bytes (UTF-8), or the config key that has it
+    """
+
+    def __init__(self, required:bool=False, default:str=None, min_length:int=0, max_length:int=None, max_bytes=None):
+        self.required = required
+        self.default = default
+        self.min_length = min_length
+        self.max_length = max_length
+        self.max_bytes = max_bytes
+
+    def validate(self, value) -> str:
+        """Check a value
+
+        Args:
+            value: The value sent by the client
+
+        Returns:
+            str: The error message, None if the value is valid
+        """
+        if not isinstance(value, str):
+            return 'should be a string'
+        if len(value) < self.min_length:
+            return 'is required' if not value else f'should have at least {self.min_length} characters'
+        if self.max_length is not None and len(value) > self.max_length:
+            return f'can not be longer than {self.max_length} characters'
+        max_bytes = current_app.config[self.max_bytes] if isinstance(self.max_bytes, str) else self.max_bytes
+        if max_bytes is not None and len(value.encode('utf-8')) > max_bytes:
+            return f'can not be larger than {max_bytes} bytes'
+        if CONTROL_CHARACTERS.search(value):
+            return 'can not have control characters'
+        return None
+
+
+class Schema:
+    """Schema of a json object, the fields that are not declared are ignored
+
+    Args:
+        fields: Field of every key
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def load(self, data, partial:bool=False) -> dict:
+        """Validate a body
+
+        Args:
+            data: The parsed json body
+            partial (bool, optional): Only validate the fields that were sent, for updates
+
+        Raises:
+            ValidationError: With the errors of every field
+
+        Returns:
+            dict: The values of the fields, with the defaults of the missing ones (unless partial)
+        """
+        if not isinstance(data, dict):
+            raise ValidationError({'request': 'body should be a json object'})
+        values, errors = {}, {}
+        for name, field in self.fields.items():
+            if name not in data or data[name] is None:
+                if field.required and not partial:
+                    errors[name] = 'is required'
+                elif field.default is not None and not partial:
+                    values[name] = field.default
+                continue
+            error = field.validate(data[name])
+            if error:
+                errors[name] = error
+            else:
+                values[name] = data[name]
+        if errors:
+            raise ValidationError(errors)
+        return values
+
+
+def _length(column) -> int:
+    """The length of a String column"""
+    return column.type.length
+
+
+# A prescription, created or edited by the single routes and by the bulk one
+prescription_schema = Schema(
+    title=Field(required=True, min_length=1, max_length=_length(Prescription.title)),
+    body=Field(default='', max_bytes='PRESCRIPTION_BODY_MAX_BYTES'),
+)
+
+# A new patient, of the registration and of the import
+patient_schema = Schema(
+    username=Field(required=True, max_length=_length(Patient.username)),
+    email=Field(required=True, max_length=_length(Patient.email)),
+    password=Field(required=True, max_length=1024),
+    fullname=Field(max_length=_length(Patient.fullname)),
+    phone=Field(max_length=_length(Patient.phone)),
+    address=Field(max_length=_length(Patient.address)),
+)
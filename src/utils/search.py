@@ -0,0 +1,102 @@
+''' Full-text search over the title and body of the prescriptions
+
+The index is created by the migration 5:
+- SQLite: the FTS5 table prescription_fts, ranked with bm25 (the title weights more than the body).
+  Its words are prefixed by their owner since the migration 9 (src.utils.fts), so a search only reads its user's terms
+- Postgres: the generated column prescription.search_vector with a GIN index, ranked with ts_rank
+- other databases: a LIKE over title and body, without ranking
+
+The text of the client is never passed as query syntax, it is split in words and every word is searched as a prefix,
+so "amox 500" finds "Amoxicilina 500 mg". Every word must be present.
+
+The results are ordered by (score, id), where a lower score is a better match. They are paged with an offset
+and not with the score of the last row: bm25 depends on the statistics of the whole index, so any insert (of any
+user) changes the scores between two pages, and the float4 of ts_rank does not survive the json of a cursor.
+The cursor keeps the offset and a fingerprint of the words (see terms_fingerprint), it is only valid for the same
+search. The pages are not a snapshot: a prescription created, changed or deleted between two pages can move the
+others, so a row can be repeated or skipped.
+'''
+import hashlib
+import re
+
+import sqlalchemy as sa
+
+from src.database import db
+from src.models.prescription import Prescription
+from src.utils.fts import WORD, owner_prefix
+
+# Max number of words of a search
+MAX_TERMS = 10
+
+# Weights of bm25 for the columns of prescription_fts (title, body)
+BM25_WEIGHTS = (10.0, 1.0)
+
+
+def parse_terms(text:str) -> list:
+    """Split the text of a search in words
+
+    Args:
+        text (str): The text sent by the client
+
+    Returns:
+        list: The words, lowercase, at most MAX_TERMS
+    """
+    return re.findall(r'\w+', (text or '').lower())[:MAX_TERMS]
+
+
+def terms_fingerprint(terms:list) -> str:
+    """Short digest of the words of a search, the cursor of a search is not valid for another one
+
+    Args:
+        terms (list): The words, from parse_terms
+
+    Returns:
+        str: The fingerprint
+    """
+    return hashlib.sha1(' '.join(terms).encode('utf-8')).hexdigest()[:12]
+
+
+def search_prescriptions(user_id, terms:list, limit:int, offset:int=0, options:tuple=()) -> list:
+    """Search the prescriptions of a user
+
+    Args:
+        user_id (int): The owner of the prescriptions
+        terms (list): The words, from parse_terms
+        limit (int): Max number of rows
+        offset (int, optional): Number of rows of the previous pages
+        options (tuple, optional): Loader options of the query, to read only some columns
+
+    Returns:
+        list: Tuples (prescription, score) ordered by score and id
+    """
+    # The replica, when there is one, runs the same database as the primary
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        fts = sa.table('prescription_fts', sa.column('rowid'))
+        # bm25 and MATCH take the name of the table itself
+        table = sa.literal_column('prescription_fts')
+        score = sa.func.bm25(table, *BM25_WEIGHTS)
+        # The words as they are indexed, see src.utils.fts
+        words = [word for term in terms for word in WORD.findall(term)]
+        if not words:
+            return []
+        prefix = owner_prefix(user_id)
+        match = ' '.join(f'"{prefix}{word}"*' for word in words)
+        query = (db.session.query(Prescription, score)
+                 .join(fts, fts.c.rowid == Prescription.id)
+                 .filter(table.op('MATCH')(match)))
+    elif dialect == 'postgresql':
+        vector = sa.literal_column('prescription.search_vector')
+        tsquery = sa.func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        # ts_rank is higher for better matches, we keep the order of "lower is better"
+        score = -sa.func.ts_rank(vector, tsquery)
+        query = db.session.query(Prescription, score).filter(vector.op('@@')(tsquery))
+    else:
+        score = sa.literal(0.0)
+        query = db.session.query(Prescription, score)
+        for term in terms:
+            pattern = f'%{term}%'
+            query = query.filter(sa.or_(Prescription.title.ilike(pattern), Prescription.body.ilike(pattern)))
+
+    query = query.filter(Prescription.user_id == user_id)
+    return query.options(*options).order_by(score, Prescription.id).offset(offset).limit(limit).all()
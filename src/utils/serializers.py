@@ -0,0 +1,114 @@
+''' Serializers for the models
+
+Every model has a single serializer, built once when the module is imported, that turns a row into the dict
+returned by the API. It also supports sparse fieldsets (?fields=id,title) and tells the query which columns
+should be loaded, so a large column like Prescription.body is not read when it is not requested.
+'''
+from functools import lru_cache
+from operator import attrgetter
+
+from sqlalchemy.orm import load_only
+
+from src.models.patient import Patient
+from src.models.prescription import Prescription
+
+
+class InvalidFields(ValueError):
+    """Raised when a client asks for a field that does not exist"""
+
+
+class ModelSerializer:
+    """Serializer of a model
+
+    Args:
+        model (Model): The model
+        fields (tuple): The fields returned by the API, in order
+        always (tuple, optional): Fields that are always returned, even in a sparse fieldset
+        loaded (tuple, optional): Columns that are always loaded, for example the ones used by the ETags
+    """
+
+    def __init__(self, model, fields:tuple, always:tuple=(), loaded:tuple=()):
+        self.model = model
+        self.fields = tuple(fields)
+        self.always = tuple(always)
+        self.loaded = tuple(loaded)
+        # Compiled getters, one for every set of fields that is asked
+        self._getter = lru_cache(maxsize=64)(self._compile)
+
+    def _compile(self, fields:tuple):
+        getter = attrgetter(*fields)
+        if len(fields) == 1:
+            return lambda obj: (getter(obj),)
+        return getter
+
+    def parse_fields(self, raw:str=None) -> tuple:
+        """Parse the fields of a sparse fieldset
+
+        Args:
+            raw (str, optional): The comma separated list sent by the client, None or empty for all the fields
+
+        Raises:
+            InvalidFields: When a field does not exist
+
+        Returns:
+            tuple: The fields to return, in the order of the serializer
+        """
+        if not raw:
+            return self.fields
+        asked = {field.strip() for field in raw.split(',') if field.strip()}
+        unknown = asked - set(self.fields)
+        if unknown:
+            raise InvalidFields(f'Unknown fields: {", ".join(sorted(unknown))}')
+        asked.update(self.always)
+        return tuple(field for field in self.fields if field in asked)
+
+    def dump(self, obj, fields:tuple=None) -> dict:
+        """Serialize a row
+
+        Args:
+            obj (Model): The row
+            fields (tuple, optional): The fields returned by parse_fields. Defaults to all the fields.
+
+        Returns:
+            dict: The serialized row
+        """
+        fields = fields or self.fields
+        return dict(zip(fields, self._getter(fields)(obj)))
+
+    def dump_many(self, objs, fields:tuple=None) -> list:
+        """Serialize a list of rows"""
+        fields = fields or self.fields
+        getter = self._getter(fields)
+        return [dict(zip(fields, getter(obj))) for obj in objs]
+
+    def project(self, payload:dict, fields:tuple=None) -> dict:
+        """Keep only some fields of an already serialized row, for example a cached one"""
+        if not fields or fields == self.fields:
+            return payload
+        return {field: payload[field] for field in fields}
+
+    def load_options(self, fields:tuple=None, extra:tuple=()) -> tuple:
+        """Query options that load only the columns needed for the fields, the others are deferred
+
+        Args:
+            fields (tuple, optional): The fields returned by parse_fields
+            extra (tuple, optional): Other fields the caller reads from the rows, like the column of a sort
+
+        Returns:
+            tuple: The options for query.options()
+        """
+        if not fields or fields == self.fields:
+            return ()
+        columns = [getattr(self.model, name) for name in self.fields
+                   if name in fields or name in self.loaded or name in extra]
+        return (load_only(*columns),)
+
+
+# The prescription: the id and the dates used by the ETags are always loaded, body only when it is asked
+prescription_serializer = ModelSerializer(Prescription,
+                                          ('id', 'title', 'body', 'expedition_date', 'created_at', 'updated_at'),
+                                          always=('id',),
+                                          loaded=('id', 'created_at', 'updated_at'))
+
+# The patient, as returned by /auth/me
+patient_serializer = ModelSerializer(Patient, ('username', 'email'))
@@ -0,0 +1,50 @@
+''' Tracing of the SQL statements, from the events of the engines
+
+Every engine created by src.database is instrumented: the statements run during a request are counted
+and timed in flask.g (see request_sql_stats()), and the functions in OBSERVERS are called after every statement,
+so other tools (metrics, query budgets) can look at them without listening to the engines themselves.
+'''
+import time
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+# Functions called after every statement with (statement, parameters, seconds)
+OBSERVERS = []
+
+
+def instrument(engine):
+    """Listen to the statements of an engine
+
+    Args:
+        engine (Engine): The engine
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def request_sql_stats() -> dict:
+    """Number of statements and seconds spent in SQL by the current request
+
+    Returns:
+        dict: statements and seconds
+    """
+    return g.setdefault('sql_stats', {'statements':0, 'seconds':0.0})
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The start is kept in the context of the statement, so a statement that fails (after_cursor_execute is not
+    # called) or an observer that raises does not leave anything behind for the next statements
+    if context is not None:
+        context.sql_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'sql_started', None)
+    seconds = time.perf_counter() - started if started is not None else 0.0
+    if has_request_context():
+        stats = request_sql_stats()
+        stats['statements'] += 1
+        stats['seconds'] += seconds
+    for observer in OBSERVERS:
+        observer(statement, parameters, seconds)
@@ -0,0 +1,201 @@
+''' Verified token cache and token revocation
+
+CachingJWTManager keeps the claims of the tokens it already verified, keyed by the digest of the token,
+until the token expires. A client that sends the same token again skips the signature verification.
+
+TokenBlocklist keeps the revoked tokens (logout, or revoked by an administrator) in the revoked_token table
+and a Bloom filter of their jti in every worker. Most tokens are not revoked, for them the filter answers
+"no" without touching the database; only a "maybe" is confirmed with a query.
+The filter of every worker is synced with the table every REVOCATION_SYNC_INTERVAL seconds, so a token revoked
+in another worker is rejected here after at most that time. A sync reads the rows with an id above the last one
+it saw and, for the databases that do not commit the ids in order (postgres sequences), the rows created in the
+last REVOCATION_SYNC_OVERLAP seconds again: a revocation whose commit was slow is still loaded, and one slower
+than the overlap is loaded by the next rebuild of the filter (REVOCATION_REBUILD_INTERVAL).
+'''
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_jwt_extended import JWTManager
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from src.database import db
+from src.models.revoked_token import RevokedToken
+from src.utils.bloom import BloomFilter
+from src.utils.cache import LRUCache
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager that caches the claims of the verified tokens until they expire"""
+
+    def __init__(self, app=None, add_context_processor=False):
+        self._verified = None
+        super().__init__(app, add_context_processor)
+
+    def init_app(self, app, add_context_processor=False):
+        super().init_app(app, add_context_processor)
+        app.config.setdefault('JWT_VERIFY_CACHE_SIZE', 10000)
+        size = app.config['JWT_VERIFY_CACHE_SIZE']
+        self._verified = LRUCache(max_entries=size) if size else None
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # The tokens from cookies (csrf) and the expired ones always follow the normal path
+        if self._verified is None or csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = hashlib.sha256(encoded_token.encode('utf-8')).hexdigest()
+        claims = self._verified.get(key)
+        if claims is not None:
+            return dict(claims)
+
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        # A token is only kept while it is valid
+        ttl = claims['exp'] - time.time() if 'exp' in claims else None
+        if ttl and ttl > 0:
+            self._verified.set(key, dict(claims), ttl)
+        return claims
+
+    def verify_cache_stats(self) -> dict:
+        """Counters of the cache of verified tokens"""
+        return self._verified.stats() if self._verified else {}
+
+
+class TokenBlocklist:
+    """Revoked tokens, in the database and in a Bloom filter per worker"""
+
+    def __init__(self, app=None, jwt=None):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._pid = None
+        self._last_sync = 0.0
+        self._last_rebuild = 0.0
+        self._synced_id = 0
+        if app is not None:
+            self.init_app(app, jwt)
+
+    def init_app(self, app, jwt:JWTManager):
+        """Read the configuration and register the blocklist in the JWT manager
+
+        Args:
+            app (Flask): The application
+            jwt (JWTManager): The JWT manager of the app
+        """
+        app.config.setdefault('REVOCATION_BLOOM_CAPACITY', 100000)
+        app.config.setdefault('REVOCATION_BLOOM_ERROR_RATE', 0.001)
+        app.config.setdefault('REVOCATION_SYNC_INTERVAL', 5)
+        app.config.setdefault('REVOCATION_SYNC_OVERLAP', 60)
+        app.config.setdefault('REVOCATION_REBUILD_INTERVAL', 3600)
+        app.extensions['blocklist'] = self
+        # The filter of a previous app (other database) is not valid for this one
+        self._bloom = None
+        jwt.token_in_blocklist_loader(self.is_revoked)
+
+    def _refresh(self):
+        """Build the filter (on first use, after a fork and from time to time) or add the last revoked tokens"""
+        config = current_app.config
+        now = time.monotonic()
+        rebuild = (self._bloom is None or self._pid != os.getpid()
+                   or now - self._last_rebuild > config['REVOCATION_REBUILD_INTERVAL'])
+        if not rebuild and now - self._last_sync < config['REVOCATION_SYNC_INTERVAL']:
+            return
+
+        with self._lock:
+            query = db.session.query(RevokedToken.id, RevokedToken.jti)
+            if rebuild:
+                # The rebuild also forgets the tokens that already expired
+                bloom = BloomFilter(config['REVOCATION_BLOOM_CAPACITY'], config['REVOCATION_BLOOM_ERROR_RATE'])
+                synced_id = 0
+                query = query.filter(RevokedToken.expires_at > datetime.now())
+            else:
+                # The new rows, and the recent ones again in case they were committed after a row with a higher id
+                bloom = self._bloom
+                synced_id = self._synced_id
+                overlap = datetime.now() - timedelta(seconds=config['REVOCATION_SYNC_OVERLAP'])
+                query = query.filter(or_(RevokedToken.id > synced_id, RevokedToken.created_at >= overlap))
+            for row in query:
+                bloom.add(row.jti)
+                synced_id = max(synced_id, row.id)
+
+            self._bloom = bloom
+            self._synced_id = synced_id
+            self._last_sync = now
+            if rebuild:
+                self._pid = os.getpid()
+                self._last_rebuild = now
+
+    def is_revoked(self, jwt_header, jwt_payload) -> bool:
+        """Callback of flask_jwt_extended, called for every protected request
+
+        Args:
+            jwt_header (dict): The header of the token
+            jwt_payload (dict): The claims of the token
+
+        Returns:
+            bool: True if the token was revoked
+        """
+        self._refresh()
+        jti = jwt_payload['jti']
+        if jti not in self._bloom:
+            return False
+        # The filter can give false positives, the table has the final word
+        return db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None
+
+    def revoke(self, tokens:list):
+        """Revoke tokens, all of them in a single commit
+
+        Args:
+            tokens (list): The RevokedToken rows to add, the ones already revoked are skipped
+        """
+        jtis = [token.jti for token in tokens]
+        for attempt in range(2):
+            revoked = {row.jti for row in db.session.query(RevokedToken.jti).filter(RevokedToken.jti.in_(jtis))}
+            db.session.add_all([token for token in tokens if token.jti not in revoked])
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Other request revoked one of them at the same moment, the next attempt skips it
+                db.session.rollback()
+                if attempt:
+                    raise
+        self._refresh()
+        for jti in jtis:
+            self._bloom.add(jti)
+
+
+def valid_jti(jti) -> bool:
+    """Check that a jti can be stored in the revoked_token table
+
+    Args:
+        jti (any): The jti claim of a token, or the one sent by an administrator
+
+    Returns:
+        bool: True if it is a non empty string that fits the column
+    """
+    return isinstance(jti, str) and 0 < len(jti) <= RevokedToken.jti.type.length
+
+
+def revoke_claims(*claims:dict):
+    """Revoke the tokens with the given claims in a single commit
+
+    Args:
+        claims (dict): The decoded tokens, their jti must be valid (valid_jti)
+    """
+    tokens = []
+    for token in claims:
+        # Without exp the row is kept for the max lifetime of a refresh token
+        if 'exp' in token:
+            expires_at = datetime.fromtimestamp(token['exp'])
+        else:
+            expires_at = datetime.now() + (current_app.config.get('JWT_REFRESH_TOKEN_EXPIRES') or timedelta(days=3650))
+        tokens.append(RevokedToken(jti=token['jti'], token_type=token.get('type'),
+                                   user_id=token.get(current_app.config['JWT_IDENTITY_CLAIM']), expires_at=expires_at))
+    blocklist.revoke(tokens)
+
+
+# Instance blocklist object, initialized in create_app
+blocklist = TokenBlocklist()
@@ -0,0 +1,18 @@
+'''
+Production entry point, for a WSGI server with many worker processes:
+
+gunicorn -c gunicorn.conf.py
+
+(gunicorn.conf.py already points to src.wsgi:app, with any other server use src.wsgi:app)
+
+The app is created once when the module is imported. With a preloading server that happens in the master
+process, before the workers are forked, so here the connections opened while creating the app (the check of the
+schema) are closed and every worker opens its own ones. flask run (see src/app.py) is only for development.
+'''
+from src import create_app
+from src.database import dispose_engines
+
+app = create_app()
+
+# No connection of the master process may be inherited by the workers
+dispose_engines(app)
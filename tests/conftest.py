@@ -0,0 +1,70 @@
+''' Fixtures of the tests
+
+Every test gets its own app over a new SQLite file, with the migrations applied and a cheap password hash.
+
+python -m pytest
+'''
+import pytest
+
+from src import create_app
+from src.utils.sqltrace import OBSERVERS
+
+PASSWORD = 'secret-password'
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Config of the app, a test can change it before asking for the app"""
+    return {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'JWT_SECRET_KEY': 'test-secret-key-that-is-long-enough-for-hs256',
+        'SCHEMA_AUTO_UPGRADE': True,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'CACHE_BACKEND': 'null',
+    }
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    yield app
+    from src.database import dispose_engines
+    dispose_engines(app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def register(client, username:str='alice') -> dict:
+    """Register a patient and log him in
+
+    Returns:
+        dict: The Authorization header of the patient
+    """
+    email = f'{username}@example.com'
+    response = client.post('/api/v1/auth/register', json={'username':username, 'email':email, 'password':PASSWORD})
+    assert response.status_code == 201, response.json
+    response = client.post('/api/v1/auth/login', json={'email':email, 'password':PASSWORD})
+    assert response.status_code == 200, response.json
+    return {'Authorization': f'Bearer {response.json["user"]["access"]}'}
+
+
+@pytest.fixture
+def headers(client):
+    return register(client)
+
+
+@pytest.fixture
+def statements():
+    """The SQL statements run while the test is running"""
+    seen = []
+
+    def record(statement, parameters, seconds):
+        seen.append(statement)
+
+    OBSERVERS.append(record)
+    yield seen
+    OBSERVERS.remove(record)
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from sqlalchemy.exc import IntegrityError
+
+from conftest import PASSWORD, register
+from src.routes.auth import _taken_message
+
+
+class PostgresError(Exception):
+    """Like the errors of psycopg2, the message has the value and diag the name of the constraint"""
+
+    def __init__(self, message, constraint_name):
+        super().__init__(message)
+        self.diag = SimpleNamespace(constraint_name=constraint_name)
+
+
+def test_taken_username_with_email_in_its_value():
+    orig = PostgresError('duplicate key value violates unique constraint "patient_username_key"\n'
+                         'DETAIL:  Key (username)=(myemail1) already exists.', 'patient_username_key')
+    assert _taken_message(IntegrityError('INSERT', {}, orig)) == "Username is taken"
+
+
+def test_taken_email_on_postgres():
+    orig = PostgresError('duplicate key value violates unique constraint "ix_patient_email"', 'ix_patient_email')
+    assert _taken_message(IntegrityError('INSERT', {}, orig)) == "Email is taken"
+
+
+def test_taken_username_and_email_on_sqlite(client):
+    register(client, 'myemail1')
+    response = client.post('/api/v1/auth/register', json={'username':'myemail1', 'email':'other@example.com', 'password':PASSWORD})
+    assert response.status_code == 409
+    assert response.json['error'] == "Username is taken"
+
+    response = client.post('/api/v1/auth/register', json={'username':'other', 'email':'myemail1@example.com', 'password':PASSWORD})
+    assert response.status_code == 409
+    assert response.json['error'] == "Email is taken"
+
+
+def test_refresh_drops_the_admin_claim_of_a_removed_administrator(app, client):
+    email = 'admin@example.com'
+    client.post('/api/v1/auth/register', json={'username':'admin', 'email':email, 'password':PASSWORD})
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['admin', 'grant', email]).exit_code == 0
+    refresh = client.post('/api/v1/auth/login', json={'email':email, 'password':PASSWORD}).json['user']['refresh']
+    assert runner.invoke(args=['admin', 'remove', email]).exit_code == 0
+
+    response = client.get('/api/v1/auth/token/refresh', headers={'Authorization':f'Bearer {refresh}'})
+    assert response.status_code == 200
+    access = {'Authorization':f'Bearer {response.json["access"]}'}
+    response = client.post('/api/v1/auth/import', json={'patients':[]}, headers=access)
+    assert response.status_code == 403
@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+
+from benchmarks.run import percentile, run_scenario
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 51))
+    assert percentile(values, 99) == 50
+    assert percentile(values, 95) == 48
+    assert percentile(values, 50) == 25
+    assert percentile([7], 99) == 7
+    assert percentile([], 99) == 0.0
+
+
+def test_client_errors_count_as_errors(app):
+    def unauthorized(client, context, index):
+        return client.get('/api/v1/prescription/999999')
+
+    result = run_scenario(app, None, unauthorized, SimpleNamespace(concurrency=2, requests=4))
+    assert result['errors'] == 4
+    assert result['first_error'] == '401'
@@ -0,0 +1,93 @@
+from conftest import register
+from src.database import db
+from src.models.prescription import Prescription
+
+
+def test_creates_are_a_single_insert(app, client, headers, statements):
+    operations = [{'op':'create', 'title':f'title {i}', 'body':f'body {i}'} for i in range(50)]
+    statements.clear()
+    response = client.post('/api/v1/prescription/bulk', json={'operations':operations}, headers=headers)
+
+    assert response.status_code == 200, response.json
+    assert response.json['summary']['created'] == 50
+    inserts = [statement for statement in statements if statement.lstrip().upper().startswith('INSERT INTO PRESCRIPTION ')]
+    assert len(inserts) == 1
+
+    # Every result has the id of its own row
+    with app.app_context():
+        titles = dict(db.session.query(Prescription.id, Prescription.title))
+    for i, result in enumerate(response.json['results']):
+        assert titles[result['id']] == f'title {i}'
+
+
+def test_updates_and_deletes_without_creates(client, headers):
+    created = client.post('/api/v1/prescription/bulk', json={'operations':[{'op':'create', 'title':'a'}, {'op':'create', 'title':'b'}]}, headers=headers)
+    first, second = (result['id'] for result in created.json['results'])
+
+    response = client.post('/api/v1/prescription/bulk', json={'operations':[
+        {'op':'update', 'id':first, 'title':'changed'},
+        {'op':'delete', 'id':second},
+    ]}, headers=headers)
+
+    assert response.status_code == 200, response.json
+    assert client.get(f'/api/v1/prescription/{first}', headers=headers).json['title'] == 'changed'
+    assert client.get(f'/api/v1/prescription/{second}', headers=headers).status_code == 404
+
+
+def test_failed_chunk_is_rolled_back(app, client, headers, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    from src.utils import bulk
+    created = client.post('/api/v1/prescription/bulk', json={'operations':[{'op':'create', 'title':'kept'}, {'op':'create', 'title':'also kept'}]},
+                          headers=headers)
+    kept, also_kept = (result['id'] for result in created.json['results'])
+
+    def fail(*args, **kwargs):
+        raise OperationalError('INSERT INTO prescription_tombstone', {}, Exception('disk I/O error'))
+
+    monkeypatch.setattr(bulk, 'add_tombstones', fail)
+    response = client.post('/api/v1/prescription/bulk', json={'operations':[
+        {'op':'create', 'title':'lost'},
+        {'op':'update', 'id':kept, 'title':'changed'},
+        {'op':'delete', 'id':also_kept},
+        {'op':'delete', 'id':999},
+    ]}, headers=headers)
+
+    assert response.status_code == 207
+    assert [result['status'] for result in response.json['results']] == [500, 500, 500, 404]
+    with app.app_context():
+        assert sorted(title for title, in db.session.query(Prescription.title)) == ['also kept', 'kept']
+
+
+def test_only_the_failed_chunk_is_rolled_back(app, client, headers, monkeypatch):
+    from src.utils import bulk
+    app.config['BULK_CHUNK_SIZE'] = 2
+    calls = []
+    insert = bulk._insert
+
+    def fail_second_chunk(current_user, rows):
+        calls.append(rows)
+        if len(calls) == 2:
+            from sqlalchemy.exc import OperationalError
+            raise OperationalError('INSERT INTO prescription', {}, Exception('database is locked'))
+        return insert(current_user, rows)
+
+    monkeypatch.setattr(bulk, '_insert', fail_second_chunk)
+    operations = [{'op':'create', 'title':f'title {i}'} for i in range(4)]
+    response = client.post('/api/v1/prescription/bulk', json={'operations':operations}, headers=headers)
+
+    assert [result['status'] for result in response.json['results']] == [201, 201, 500, 500]
+    with app.app_context():
+        assert sorted(title for title, in db.session.query(Prescription.title)) == ['title 0', 'title 1']
+
+
+def test_created_ids_with_rows_of_other_chunks(app, client, headers):
+    other = register(client, 'bob')
+    client.post('/api/v1/prescription/bulk', json={'operations':[{'op':'create', 'title':'of bob'}]}, headers=other)
+    operations = [{'op':'create', 'title':f'title {i}'} for i in range(450)]
+    response = client.post('/api/v1/prescription/bulk', json={'operations':operations}, headers=headers)
+
+    assert response.status_code == 200, response.json
+    with app.app_context():
+        titles = dict(db.session.query(Prescription.id, Prescription.title))
+    assert [titles[result['id']] for result in response.json['results']] == [f'title {i}' for i in range(450)]
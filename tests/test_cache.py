@@ -0,0 +1,11 @@
+from src import create_app
+
+
+def test_in_process_cache_is_short_lived_with_many_workers(config):
+    app = create_app({**config, 'CACHE_BACKEND':'lru', 'CACHE_TTL':30, 'SERVER_WORKERS':4})
+    assert app.extensions['cache'].ttl == app.config['CACHE_LOCAL_TTL']
+
+
+def test_in_process_cache_keeps_its_ttl_with_one_worker(config):
+    app = create_app({**config, 'CACHE_BACKEND':'lru', 'CACHE_TTL':30, 'SERVER_WORKERS':1})
+    assert app.extensions['cache'].ttl == 30
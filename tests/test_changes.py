@@ -0,0 +1,50 @@
+import pytest
+
+from src.utils.changes import settle_seconds
+
+
+@pytest.fixture
+def config(config):
+    return {**config, 'CHANGES_SETTLE_SECONDS':0}
+
+
+def _sync(client, headers, token=''):
+    response = client.get(f'/api/v1/prescription/changes?since={token}', headers=headers)
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def test_sync_sends_the_changes_and_deletions_since_the_token(client, headers):
+    ids = [client.post('/api/v1/prescription/', json={'title':f'p{i}'}, headers=headers).json['id'] for i in range(3)]
+    first = _sync(client, headers)
+    assert [row['id'] for row in first['data']] == ids
+    assert first['deleted'] == []
+
+    client.put(f'/api/v1/prescription/{ids[0]}', json={'title':'changed'}, headers=headers)
+    client.delete(f'/api/v1/prescription/{ids[1]}', headers=headers)
+    second = _sync(client, headers, first['meta']['sync_token'])
+    assert [row['title'] for row in second['data']] == ['changed']
+    assert second['deleted'] == [ids[1]]
+
+    third = _sync(client, headers, second['meta']['sync_token'])
+    assert third['data'] == [] and third['deleted'] == []
+
+
+def test_changes_inside_the_settle_window_wait(app, client, headers):
+    app.config['CHANGES_SETTLE_SECONDS'] = 60
+    client.post('/api/v1/prescription/', json={'title':'new'}, headers=headers)
+    assert _sync(client, headers)['data'] == []
+
+
+def test_invalid_token_is_rejected(client, headers):
+    assert client.get('/api/v1/prescription/changes?since=nope', headers=headers).status_code == 400
+
+
+def test_settle_window_follows_the_timeouts():
+    sqlite = {'SQLALCHEMY_DATABASE_URI':'sqlite:///app.db', 'SQLITE_PRAGMAS':{'busy_timeout':5000}}
+    assert settle_seconds(sqlite) == 7
+    assert settle_seconds({**sqlite, 'GROUP_COMMIT_ENABLED':True, 'GROUP_COMMIT_TIMEOUT':10}) == 17
+
+    postgres = {'SQLALCHEMY_DATABASE_URI':'postgresql://db/app', 'DB_STATEMENT_TIMEOUT_MS':30000}
+    assert settle_seconds(postgres) == 32
+    assert settle_seconds({**postgres, 'CHANGES_SETTLE_SECONDS':1}) == 1
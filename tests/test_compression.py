@@ -0,0 +1,48 @@
+import gzip
+
+import pytest
+
+from src.utils.compression import available_encodings
+
+URL = '/api/v1/prescription/'
+
+
+@pytest.fixture
+def big_list(client, headers):
+    # A page well over COMPRESS_MIN_SIZE
+    for i in range(10):
+        client.post(URL, json={'title':f'title {i}', 'body':'tomar una tableta cada ocho horas ' * 10}, headers=headers)
+    return f'{URL}?limit=10'
+
+
+def test_gzip_is_negotiated_with_accept_encoding(client, headers, big_list):
+    plain = client.get(big_list, headers=headers)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    compressed = client.get(big_list, headers={**headers, 'Accept-Encoding':'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+
+    refused = client.get(big_list, headers={**headers, 'Accept-Encoding':'gzip;q=0, identity'})
+    assert 'Content-Encoding' not in refused.headers
+
+
+def test_preferred_encoding_wins_with_equal_quality(client, headers, big_list):
+    response = client.get(big_list, headers={**headers, 'Accept-Encoding':'gzip, br, zstd'})
+    assert response.headers['Content-Encoding'] == available_encodings()[0]
+
+
+def test_small_responses_are_not_compressed(app, client, headers):
+    client.post(URL, json={'title':'small'}, headers=headers)
+    response = client.get(f'{URL}?limit=1', headers={**headers, 'Accept-Encoding':'gzip'})
+    assert len(response.get_data()) < app.config['COMPRESS_MIN_SIZE']
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_streamed_responses_are_not_compressed(client, headers, big_list):
+    response = client.get(f'{URL}export?format=ndjson', headers={**headers, 'Accept-Encoding':'gzip'})
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert 'Content-Encoding' not in response.headers
+    assert len(response.get_data().splitlines()) == 10
@@ -0,0 +1,22 @@
+def test_not_modified_keeps_the_etag_of_the_compressed_response(client, headers):
+    created = client.post('/api/v1/prescription/', json={'title':'long', 'body':'tomar cada 8 horas ' * 200}, headers=headers)
+    url = f'/api/v1/prescription/{created.json["id"]}'
+
+    response = client.get(url, headers={**headers, 'Accept-Encoding':'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    response = client.get(url, headers={**headers, 'Accept-Encoding':'gzip', 'If-None-Match':etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_not_modified_of_an_uncompressed_response(client, headers):
+    created = client.post('/api/v1/prescription/', json={'title':'short'}, headers=headers)
+    url = f'/api/v1/prescription/{created.json["id"]}'
+
+    etag = client.get(url, headers=headers).headers['ETag']
+    response = client.get(url, headers={**headers, 'If-None-Match':etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from src import create_app
+from src.database import dispose_engines
+
+
+@pytest.fixture
+def make_app(config):
+    apps = []
+
+    def make(**overrides):
+        app = create_app({**config, **overrides})
+        apps.append(app)
+        return app
+    yield make
+    for app in apps:
+        dispose_engines(app)
+
+
+def test_lazy_spec_is_built_on_the_first_request(app, client):
+    state = app.extensions['api_docs']
+    assert state['mode'] == 'lazy' and state['swagger'] is None
+
+    response = client.get('/apispec.json')
+    assert response.status_code == 200
+    assert '/auth/login' in response.json['paths']
+    assert state['swagger'] is not None
+
+
+def test_static_spec_is_served_from_the_built_file(app, make_app, tmp_path):
+    path = tmp_path / 'apispec.json'
+    result = app.test_cli_runner().invoke(args=['docs', 'build', '--output', str(path)])
+    assert result.exit_code == 0, result.output
+
+    static = make_app(SWAGGER_MODE='static', SWAGGER_STATIC_FILE=str(path))
+    response = static.test_client().get('/apispec.json')
+    assert response.json == json.loads(path.read_text())
+    # flasgger was never set up
+    assert static.extensions['api_docs']['swagger'] is None
+
+
+def test_disabled_and_invalid_modes(make_app):
+    assert make_app(SWAGGER_MODE='disabled').test_client().get('/apispec.json').status_code == 404
+    with pytest.raises(ValueError):
+        make_app(SWAGGER_MODE='sometimes')
+
+
+def test_boot_phases_are_measured(app):
+    assert {'config', 'database', 'extensions', 'blueprints', 'docs'} <= set(app.extensions['boot'])
@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+from src.config.database import engine_options
+from src.database import db
+
+
+@pytest.fixture
+def config(config):
+    return {**config, 'DB_POOL_SIZE':3, 'DB_MAX_OVERFLOW':1}
+
+
+def test_sqlite_connections_get_the_pragmas_and_a_pool(app):
+    with app.app_context():
+        assert isinstance(db.engine.pool, QueuePool)
+        assert db.engine.pool.size() == 3
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(text('PRAGMA synchronous')).scalar() == 1
+        assert db.session.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+
+
+def test_options_from_the_config():
+    postgres = engine_options({'SQLALCHEMY_DATABASE_URI':'postgresql://db/app', 'DB_POOL_SIZE':10,
+                               'DB_POOL_PRE_PING':True, 'DB_STATEMENT_TIMEOUT_MS':2000})
+    assert postgres['pool_size'] == 10 and postgres['pool_pre_ping'] is True
+    assert postgres['connect_args'] == {'options':'-c statement_timeout=2000'}
+    assert 'sqlite_pragmas' not in postgres
+
+    # The options set by hand win
+    mysql = engine_options({'SQLALCHEMY_DATABASE_URI':'mysql://db/app', 'DB_POOL_SIZE':10, 'DB_STATEMENT_TIMEOUT_MS':2000,
+                            'SQLALCHEMY_ENGINE_OPTIONS':{'pool_size':4}})
+    assert mysql['pool_size'] == 4 and mysql['mysql_statement_timeout_ms'] == 2000
+
+    # An in memory database keeps its default pool, every connection would be another database
+    memory = engine_options({'SQLALCHEMY_DATABASE_URI':'sqlite://', 'DB_POOL_SIZE':10})
+    assert 'poolclass' not in memory and 'pool_size' not in memory
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import pytest
+
+from conftest import register
+
+URL = '/api/v1/prescription/export'
+
+
+@pytest.fixture
+def config(config):
+    # Several chunks for a handful of rows
+    return {**config, 'EXPORT_CHUNK_SIZE':2}
+
+
+@pytest.fixture
+def ids(client, headers):
+    return [client.post('/api/v1/prescription/', json={'title':f'title {i}', 'body':f'body, "{i}"'}, headers=headers).json['id']
+            for i in range(5)]
+
+
+def test_ndjson_streams_every_row_of_the_user(client, headers, ids):
+    client.post('/api/v1/prescription/', json={'title':'of bob'}, headers=register(client, 'bob'))
+    response = client.get(URL, headers=headers)
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['id'] for row in rows] == ids
+    assert rows[1]['body'] == 'body, "1"'
+
+
+def test_csv_with_sparse_fields(client, headers, ids):
+    response = client.get(f'{URL}?format=csv&fields=title,body', headers=headers)
+
+    assert response.mimetype == 'text/csv'
+    assert 'prescriptions.csv' in response.headers['Content-Disposition']
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['id', 'title', 'body']
+    assert rows[3] == [str(ids[2]), 'title 2', 'body, "2"']
+    assert len(rows) == 6
+
+
+def test_csv_without_rows_has_the_header(client, headers):
+    response = client.get(f'{URL}?format=csv&fields=title', headers=headers)
+    assert response.get_data(as_text=True).splitlines() == ['id,title']
+
+
+def test_unknown_format_and_fields(client, headers):
+    assert client.get(f'{URL}?format=xml', headers=headers).status_code == 400
+    assert client.get(f'{URL}?fields=password', headers=headers).status_code == 400
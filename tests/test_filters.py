@@ -0,0 +1,63 @@
+from sqlalchemy import text
+
+from src.database import db
+
+URL = '/api/v1/prescription/'
+
+
+def _create(app, client, headers, dates:list) -> list:
+    ids = [client.post(URL, json={'title':f'title {i}'}, headers=headers).json['id'] for i in range(len(dates))]
+    with app.app_context():
+        for id, date in zip(ids, dates):
+            db.session.execute(text('UPDATE prescription SET expedition_date = :date WHERE id = :id'), {'date':date, 'id':id})
+        db.session.commit()
+    return ids
+
+
+def _pages(client, headers, query:str) -> list:
+    seen, cursor = [], ''
+    while True:
+        response = client.get(f'{URL}?{query}&limit=2&cursor={cursor}', headers=headers)
+        assert response.status_code == 200, response.json
+        seen += [row['id'] for row in response.json['data']]
+        cursor = response.json['meta']['next_cursor']
+        if cursor is None:
+            return seen
+
+
+def test_sort_by_date_in_both_directions_with_nulls_last(app, client, headers):
+    ids = _create(app, client, headers, ['2024-03-01 00:00:00.000000', None, '2024-01-01 00:00:00.000000',
+                                         None, '2024-03-01 00:00:00.000000'])
+
+    assert _pages(client, headers, 'sort=expedition_date') == [ids[2], ids[0], ids[4], ids[1], ids[3]]
+    assert _pages(client, headers, 'sort=-expedition_date') == [ids[4], ids[0], ids[2], ids[3], ids[1]]
+
+
+def test_sort_column_is_loaded_when_fields_omit_it(app, client, headers, statements):
+    _create(app, client, headers, ['2024-01-01 00:00:00.000000', '2024-02-01 00:00:00.000000', None])
+    statements.clear()
+    response = client.get(f'{URL}?sort=expedition_date&fields=title&limit=1', headers=headers)
+
+    assert response.status_code == 200
+    assert 'expedition_date' not in response.json['data'][0]
+    assert response.json['meta']['next_cursor']
+    # The page and nothing else, no lazy load of the sort column for the cursor
+    assert len([statement for statement in statements if 'FROM prescription' in statement]) == 1
+
+
+def test_date_ranges(app, client, headers):
+    ids = _create(app, client, headers, ['2024-01-01 00:00:00.000000', '2024-02-01 00:00:00.000000',
+                                         '2024-03-01 00:00:00.000000'])
+
+    response = client.get(f'{URL}?expedition_from=2024-02-01&expedition_to=2024-03-01&limit=10', headers=headers)
+    assert [row['id'] for row in response.json['data']] == [ids[1]]
+
+
+def test_invalid_sort_date_and_cursor_of_other_sort(client, headers):
+    assert client.get(f'{URL}?sort=title', headers=headers).status_code == 400
+    assert client.get(f'{URL}?expedition_from=yesterday', headers=headers).status_code == 400
+
+    for i in range(3):
+        client.post(URL, json={'title':f'title {i}'}, headers=headers)
+    cursor = client.get(f'{URL}?limit=1&sort=created_at', headers=headers).json['meta']['next_cursor']
+    assert client.get(f'{URL}?limit=1&sort=-created_at&cursor={cursor}', headers=headers).status_code == 400
@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from conftest import PASSWORD
+from src.database import db
+from src.models.patient import Patient
+from src.utils.groupcommit import GroupCommitTimeout, group_commit
+
+
+@pytest.fixture
+def config(config):
+    return {**config, 'GROUP_COMMIT_ENABLED':True, 'GROUP_COMMIT_MAX_DELAY_MS':50}
+
+
+def _patient(name:str, email:str=None) -> dict:
+    return {'username':name, 'email':email or f'{name}@example.com', 'password':'hash'}
+
+
+def test_failed_insert_does_not_fail_the_rest_of_its_batch(app):
+    batch = [(Patient.__table__, values, Future())
+             for values in (_patient('ana'), _patient('taken', 'ana@example.com'), _patient('luis'))]
+    with app.app_context():
+        group_commit._commit(db.engine, list(batch))
+
+        assert isinstance(batch[1][2].exception(), IntegrityError)
+        assert batch[0][2].result()['id'] and batch[2][2].result()['id']
+        assert sorted(username for username, in db.session.query(Patient.username)) == ['ana', 'luis']
+
+
+def test_concurrent_registrations_keep_their_own_result(app):
+    def register(index):
+        # Two of the requests use the same email, only one of them can get it
+        email = 'same@example.com' if index < 2 else f'user{index}@example.com'
+        response = app.test_client().post('/api/v1/auth/register',
+                                          json={'username':f'user{index}', 'email':email, 'password':PASSWORD})
+        return response.status_code
+
+    # Not more threads than the password pool accepts at once with a single CPU
+    with ThreadPoolExecutor(4) as executor:
+        statuses = list(executor.map(register, range(8)))
+
+    assert sorted(statuses[:2]) == [201, 409]
+    assert statuses[2:] == [201] * 6
+    with app.app_context():
+        assert db.session.query(Patient.id).count() == 7
+
+
+def _insert(app, values:dict):
+    with app.app_context():
+        return group_commit.insert(Patient, values)
+
+
+def test_insert_that_timed_out_is_not_written(app, monkeypatch):
+    app.config.update(GROUP_COMMIT_TIMEOUT=0.2, GROUP_COMMIT_MAX_DELAY_MS=1)
+    started = threading.Event()
+    release = threading.Event()
+    commit = group_commit._commit
+
+    def slow_commit(engine, batch):
+        started.set()
+        release.wait(5)
+        commit(engine, batch)
+    monkeypatch.setattr(group_commit, '_commit', slow_commit)
+
+    with app.app_context():
+        # The first insert keeps the writer busy past its timeout, it is already running so it is waited for
+        first = ThreadPoolExecutor(1).submit(_insert, app, _patient('first'))
+        started.wait(5)
+        # The second one is still in the queue when it times out
+        with pytest.raises(GroupCommitTimeout):
+            group_commit.insert(Patient, _patient('second'))
+        release.set()
+        assert first.result(5).username == 'first'
+
+        monkeypatch.setattr(group_commit, '_commit', commit)
+        app.config['GROUP_COMMIT_TIMEOUT'] = 5
+        group_commit.insert(Patient, _patient('third'))
+        assert sorted(username for username, in db.session.query(Patient.username)) == ['first', 'third']
@@ -0,0 +1,64 @@
+import runpy
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from src.database import db, dispose_engines
+
+
+@pytest.fixture
+def config(config):
+    # A pool that keeps its connections, like the one of a worker
+    return {**config, 'DB_POOL_SIZE':2}
+
+
+def test_liveness_and_readiness(client):
+    assert client.get('/healthz').json == {'status':'ok'}
+
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.json['databases']['primary']['ready'] is True
+
+
+def test_readiness_fails_when_the_database_does_not_answer(app, client, monkeypatch):
+    with app.app_context():
+        dialect = db.engine.dialect
+
+    def down(connection):
+        raise ConnectionError('database is down')
+
+    monkeypatch.setattr(dialect, 'do_ping', down)
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.json['databases']['primary']['ready'] is False
+    # The liveness does not touch the database
+    assert client.get('/healthz').status_code == 200
+
+
+def test_workers_open_their_own_connections(app, client, monkeypatch):
+    assert client.get('/readyz').status_code == 200
+    with app.app_context():
+        pool = db.engine.pool
+    assert pool.checkedin() > 0
+
+    # What gunicorn runs in every worker after the fork, with the app preloaded by src.wsgi
+    for name in ('GUNICORN_WORKERS', 'PROXY_FIX_X_FOR', 'GUNICORN_PRELOAD'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setitem(sys.modules, 'src.wsgi', SimpleNamespace(app=app))
+    settings = runpy.run_path('gunicorn.conf.py')
+    assert settings['preload_app'] is True and settings['wsgi_app'] == 'src.wsgi:app'
+    settings['post_fork'](SimpleNamespace(log=SimpleNamespace(info=lambda *args:None)), SimpleNamespace(pid=1))
+
+    with app.app_context():
+        # The engine is the same, its pool is a new one without the inherited connections
+        assert db.engine.pool is not pool and db.engine.pool.checkedin() == 0
+    assert client.get('/readyz').status_code == 200
+
+
+def test_dispose_engines_closes_the_connections(app, client):
+    client.get('/readyz')
+    dispose_engines(app)
+    with app.app_context():
+        assert db.engine.pool.checkedin() == 0
+    assert client.get('/readyz').status_code == 200
@@ -0,0 +1,61 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from conftest import PASSWORD, register
+from src.database import db
+from src.models.patient import Patient
+
+URL = '/api/v1/auth/import'
+
+
+@pytest.fixture
+def admin(app):
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=1, additional_claims={"admin":True})}'}
+
+
+def _patients(*names) -> list:
+    return [{'username':name, 'email':f'{name}@example.com', 'password':PASSWORD} for name in names]
+
+
+def test_register_is_a_single_insert_without_lookups(client, statements):
+    statements.clear()
+    response = client.post('/api/v1/auth/register', json=_patients('ana')[0])
+
+    assert response.status_code == 201
+    patient = [statement for statement in statements if 'patient' in statement]
+    assert len(patient) == 1 and patient[0].lstrip().upper().startswith('INSERT')
+
+
+def test_imported_patients_can_log_in(client, admin):
+    response = client.post(URL, json={'patients':_patients('ana', 'luis')}, headers=admin)
+
+    assert response.status_code == 201, response.json
+    assert response.json['count'] == 2
+    assert client.post('/api/v1/auth/login', json={'email':'luis@example.com', 'password':PASSWORD}).status_code == 200
+
+
+def test_invalid_or_repeated_rows_create_nothing(app, client, admin):
+    rows = _patients('ana', 'luis') + [{**_patients('ana')[0], 'username':'other'}, {'username':'x'}]
+    response = client.post(URL, json={'patients':rows}, headers=admin)
+
+    assert response.status_code == 400
+    assert [error['index'] for error in response.json['errors']] == [2, 3]
+    with app.app_context():
+        assert db.session.query(Patient).count() == 0
+
+
+def test_taken_email_rolls_back_the_batch(app, client, admin):
+    register(client, 'luis')
+    response = client.post(URL, json={'patients':_patients('ana', 'luis')}, headers=admin)
+
+    assert response.status_code == 409
+    assert response.json['error'] == 'Email is taken'
+    with app.app_context():
+        assert [username for username, in db.session.query(Patient.username)] == ['luis']
+
+
+def test_batch_size_limit(app, client, admin):
+    app.config['IMPORT_MAX_BATCH_SIZE'] = 2
+    assert client.post(URL, json={'patients':_patients('a', 'b', 'c')}, headers=admin).status_code == 413
+    assert client.post(URL, json={'patients':[]}, headers=admin).status_code == 400
@@ -0,0 +1,39 @@
+from src.utils.metrics import Histogram, status_class
+
+
+def _metrics(client) -> dict:
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    return dict(line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines() if not line.startswith('#'))
+
+
+def test_requests_are_recorded_per_endpoint_and_status(client, headers):
+    client.get('/api/v1/prescription/?limit=5', headers=headers)
+    client.get('/api/v1/prescription/?limit=500', headers=headers)
+    client.get('/nowhere')
+
+    metrics = _metrics(client)
+    labels = '{endpoint="prescriptions.handle_prescriptions",status="2xx"'
+    assert metrics[f'http_request_duration_seconds_count{labels}}}'] == '1'
+    assert metrics['http_request_duration_seconds_count{endpoint="prescriptions.handle_prescriptions",status="4xx"}'] == '1'
+    assert metrics['http_request_duration_seconds_count{endpoint="unmatched",status="4xx"}'] == '1'
+    # The statements of the page are counted
+    assert float(metrics[f'http_request_sql_statements_sum{labels}}}']) >= 1
+    assert any(name.startswith('app_boot_seconds') for name in metrics)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', 'Latency', (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(('a',), value)
+
+    lines = histogram.render(('endpoint',))
+    assert 'latency_bucket{endpoint="a",le="0.1"} 2' in lines
+    assert 'latency_bucket{endpoint="a",le="1"} 3' in lines
+    assert 'latency_bucket{endpoint="a",le="+Inf"} 4' in lines
+    assert 'latency_count{endpoint="a"} 4' in lines
+
+
+def test_status_class():
+    assert [status_class(status) for status in (101, 204, 304, 429, 503, 99)] == ['1xx', '2xx', '3xx', '4xx', '5xx', 'other']
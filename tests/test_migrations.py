@@ -0,0 +1,45 @@
+import sqlalchemy as sa
+
+from src import create_app
+from src.database import db, dispose_engines, register_sqlite_functions
+from src.migrations.runner import current_version, head_version, upgrade
+
+
+def test_fresh_database_is_at_head_with_its_indexes(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert current_version(connection) == head_version()
+        indexes = set(db.session.execute(sa.text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+        assert {'ix_patient_email', 'ix_prescription_user_id_id', 'ix_prescription_user_id_changed_at',
+                'ix_prescription_user_id_expedition_date_id', 'ix_prescription_user_id_created_at_id'} <= indexes
+        # Nothing is pending
+        assert upgrade(db.engine) == []
+
+
+def test_outdated_schema_answers_503_until_upgraded(config):
+    app = create_app({**config, 'SCHEMA_AUTO_UPGRADE':False})
+    client = app.test_client()
+    try:
+        assert client.post('/api/v1/auth/login', json={'email':'a@example.com', 'password':'x'}).status_code == 503
+        assert client.get('/healthz').status_code == 200
+
+        result = app.test_cli_runner().invoke(args=['db', 'upgrade'])
+        assert f'Applied {head_version()}' in result.output
+        assert client.post('/api/v1/auth/login', json={'email':'a@example.com', 'password':'x'}).status_code != 503
+    finally:
+        dispose_engines(app)
+
+
+def test_upgrade_keeps_the_rows_of_older_versions(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    upgrade(engine, target=1)
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO patient (username, email, password) VALUES ('ana', 'ana@example.com', 'hash')"))
+
+    # The full-text migrations need the SQL functions of src.database
+    sa.event.listen(engine, 'connect', register_sqlite_functions)
+    upgrade(engine)
+    with engine.connect() as connection:
+        assert connection.execute(sa.text('SELECT username, is_admin FROM patient')).all() == [('ana', False)]
+        assert current_version(connection) == head_version()
+    engine.dispose()
@@ -0,0 +1,40 @@
+URL = '/api/v1/prescription/'
+
+
+def _create(client, headers, count:int) -> list:
+    return [client.post(URL, json={'title':f'title {i}'}, headers=headers).json['id'] for i in range(count)]
+
+
+def test_cursor_pages_go_through_every_row_once(client, headers):
+    ids = _create(client, headers, 7)
+
+    seen, cursor = [], ''
+    while True:
+        response = client.get(f'{URL}?limit=3&cursor={cursor}', headers=headers)
+        assert response.status_code == 200
+        seen += [row['id'] for row in response.json['data']]
+        cursor = response.json['meta']['next_cursor']
+        if not response.json['meta']['has_next']:
+            assert cursor is None
+            break
+    assert seen == ids
+
+
+def test_cursor_total_is_only_counted_when_asked(client, headers):
+    _create(client, headers, 3)
+    assert 'total_count' not in client.get(f'{URL}?limit=2', headers=headers).json['meta']
+    assert client.get(f'{URL}?limit=2&with_total=1', headers=headers).json['meta']['total_count'] == 3
+
+
+def test_invalid_cursor_and_limit(client, headers):
+    assert client.get(f'{URL}?cursor=zzz', headers=headers).status_code == 400
+    assert client.get(f'{URL}?limit=0', headers=headers).status_code == 400
+    assert client.get(f'{URL}?limit=101', headers=headers).status_code == 400
+
+
+def test_page_and_per_page_still_work(client, headers):
+    ids = _create(client, headers, 7)
+    response = client.get(f'{URL}?page=2&per_page=3', headers=headers)
+    assert [row['id'] for row in response.json['data']] == ids[3:6]
+    assert response.json['meta']['total_count'] == 7
+    assert response.json['meta']['has_next'] is True
@@ -0,0 +1,8 @@
+import pytest
+
+from src import create_app
+
+
+def test_unsupported_hash_method_fails_at_startup(config):
+    with pytest.raises(ValueError, match='PASSWORD_HASH_METHOD'):
+        create_app({**config, 'PASSWORD_HASH_METHOD':'scrypt:32768:8:1'})
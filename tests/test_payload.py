@@ -0,0 +1,34 @@
+import io
+
+URL = '/api/v1/prescription/'
+# The limit of the route
+LIMIT = 256 * 1024
+
+
+def _chunked(client, headers, data:bytes):
+    # Without Content-Length, like a body sent with Transfer-Encoding: chunked
+    return client.post(URL, input_stream=io.BytesIO(data), environ_overrides={'wsgi.input_terminated':True},
+                       headers={**headers, 'Content-Type':'application/json', 'Transfer-Encoding':'chunked'})
+
+
+def test_body_larger_than_the_limit_of_the_route(client, headers):
+    response = client.post(URL, data=b'x' * (LIMIT + 1), headers={**headers, 'Content-Type':'application/json'})
+    assert response.status_code == 413
+    assert 'error' in response.json
+
+
+def test_chunked_body_larger_than_the_limit(client, headers):
+    response = _chunked(client, headers, b'x' * (LIMIT + 1))
+    assert response.status_code == 413
+
+
+def test_chunked_body_under_the_limit_reaches_the_view(client, headers):
+    response = _chunked(client, headers, b'{"title":"chunked","body":"ok"}')
+    assert response.status_code == 201
+    assert response.json['title'] == 'chunked'
+
+
+def test_limit_can_be_overridden_per_endpoint(app, client, headers):
+    app.config['PAYLOAD_LIMITS'] = {'prescriptions.handle_prescriptions':64}
+    response = client.post(URL, json={'title':'a', 'body':'x' * 100}, headers=headers)
+    assert response.status_code == 413
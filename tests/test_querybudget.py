@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from src import create_app
+from src.utils import sqltrace
+from src.utils.querybudget import QueryBudgetExceeded
+
+
+def test_route_over_its_budget_fails(config, headers):
+    app = create_app({**config, 'QUERY_BUDGETS':{'auth.me':0}})
+    response = app.test_client().get('/api/v1/auth/me', headers=headers)
+    assert response.status_code == 500
+    assert response.json['error'] == 'auth.me ran more than 0 SQL statements'
+
+
+def test_error_of_an_observer_is_not_masked(monkeypatch):
+    engine = create_engine('sqlite://')
+    sqltrace.instrument(engine)
+    seen = []
+
+    def observer(statement, parameters, seconds):
+        seen.append(seconds)
+        if len(seen) == 1:
+            raise QueryBudgetExceeded('test', 0)
+
+    monkeypatch.setattr(sqltrace, 'OBSERVERS', [observer])
+    with engine.connect() as connection:
+        with pytest.raises(QueryBudgetExceeded):
+            connection.execute(text('SELECT 1'))
+        # The next statements are still timed
+        connection.execute(text('SELECT 2'))
+    assert len(seen) == 2 and seen[1] >= 0
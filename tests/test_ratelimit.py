@@ -0,0 +1,25 @@
+from src import create_app
+
+
+def test_clients_behind_the_proxy_have_their_own_bucket(config):
+    app = create_app({**config, 'PROXY_FIX_X_FOR':1, 'RATELIMIT_ROUTES':{'auth.login':{'ip':'2/minute'}}})
+    client = app.test_client()
+
+    def login(address):
+        return client.post('/api/v1/auth/login', json={'email':'nobody@example.com', 'password':'x'},
+                           headers={'X-Forwarded-For':address}).status_code
+
+    assert [login('10.0.0.1') for _ in range(3)] == [401, 401, 429]
+    # Another client behind the same proxy is not limited
+    assert login('10.0.0.2') == 401
+
+
+def test_too_many_requests_after_the_limit(app, client):
+    app.config['RATELIMIT_ROUTES'] = {'auth.login':{'ip':'3/minute'}}
+    statuses = [client.post('/api/v1/auth/login', json={'email':'nobody@example.com', 'password':'x'}).status_code
+                for _ in range(4)]
+
+    assert statuses == [401, 401, 401, 429]
+    response = client.post('/api/v1/auth/login', json={'email':'nobody@example.com', 'password':'x'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import text
+
+from conftest import register
+from src import create_app
+from src.database import db
+from src.migrations.runner import upgrade
+
+
+@pytest.fixture
+def replica_config(config, tmp_path):
+    # The replica is another file that never gets the writes, like a replica that is far behind
+    return {**config, 'SQLALCHEMY_BINDS':{'replica':f'sqlite:///{tmp_path / "replica.db"}'}, 'CACHE_BACKEND':'lru'}
+
+
+@pytest.fixture
+def replica_app(replica_config):
+    app = create_app(replica_config)
+    with app.app_context():
+        upgrade(db.get_engine(app, 'replica'))
+    return app
+
+
+def test_pin_travels_with_the_client_to_any_worker(replica_app, replica_config):
+    client = replica_app.test_client()
+    headers = register(client)
+    created = client.post('/api/v1/prescription/', json={'title':'mine'}, headers=headers)
+    last_write = created.headers['X-Last-Write']
+    url = f'/api/v1/prescription/{created.json["id"]}'
+
+    # Another worker, with nothing in memory, gets the next reads: the header sends them to the primary
+    other = create_app(replica_config).test_client()
+    # Without the pin the read goes to the replica, that does not have the row yet
+    assert other.get(url, headers=headers).status_code == 404
+    assert other.get(url, headers={**headers, 'X-Last-Write':last_write}).status_code == 200
+
+
+def test_reads_from_the_replica_are_not_cached(replica_app):
+    client = replica_app.test_client()
+    headers = register(client)
+    created = client.post('/api/v1/prescription/', json={'title':'mine'}, headers=headers)
+    url = f'/api/v1/prescription/{created.json["id"]}'
+
+    # The replica has a stale copy of the row
+    with replica_app.app_context(), db.get_engine(replica_app, 'replica').begin() as connection:
+        connection.execute(text("INSERT INTO prescription (id, title, body, user_id) VALUES (:id, 'old', '', 1)"),
+                           {'id':created.json['id']})
+
+    client.cookie_jar.clear()
+    assert client.get(url, headers=headers).json['title'] == 'old'
+    with replica_app.app_context():
+        assert replica_app.extensions['cache'].stats()['size'] == 0
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token, decode_token
+
+from conftest import PASSWORD, register
+from src.database import db
+from src.models.revoked_token import RevokedToken
+from src.utils.tokens import TokenBlocklist
+
+
+def _jti(app, headers) -> str:
+    with app.app_context():
+        return decode_token(headers['Authorization'].split()[1])['jti']
+
+
+def test_logout_revokes_the_token(client, headers):
+    assert client.get('/api/v1/auth/me', headers=headers).status_code == 200
+    assert client.post('/api/v1/auth/logout', headers=headers).status_code == 200
+    assert client.get('/api/v1/auth/me', headers=headers).status_code == 401
+
+
+def test_other_worker_sees_the_revocation_after_its_sync(app, headers):
+    jti = _jti(app, headers)
+    app.config['REVOCATION_SYNC_INTERVAL'] = 0
+    # The blocklist of another worker, with its own filter
+    worker = TokenBlocklist()
+    with app.app_context():
+        assert not worker.is_revoked({}, {'jti':jti})
+
+        db.session.add(RevokedToken(jti=jti, expires_at=datetime.now() + timedelta(hours=1)))
+        db.session.commit()
+        assert worker.is_revoked({}, {'jti':jti})
+
+
+def test_revocation_committed_late_is_still_synced(app, headers):
+    jti = _jti(app, headers)
+    app.config['REVOCATION_SYNC_INTERVAL'] = 0
+    worker = TokenBlocklist()
+    with app.app_context():
+        worker.is_revoked({}, {'jti':'other'})
+
+        # Created long before the last sync of the worker, but committed after it
+        db.session.add(RevokedToken(jti=jti, expires_at=datetime.now() + timedelta(hours=1),
+                                    created_at=datetime.now() - timedelta(hours=1)))
+        db.session.commit()
+        assert worker.is_revoked({}, {'jti':jti})
+
+
+def _login(client) -> dict:
+    register(client, 'bob')
+    response = client.post('/api/v1/auth/login', json={'email':'bob@example.com', 'password':PASSWORD})
+    return response.json['user']
+
+
+def test_logout_revokes_the_refresh_token_too(client):
+    tokens = _login(client)
+    response = client.post('/api/v1/auth/logout', json={'refresh_token':tokens['refresh']},
+                           headers={'Authorization': f'Bearer {tokens["access"]}'})
+
+    assert response.status_code == 200
+    assert client.get('/api/v1/auth/token/refresh', headers={'Authorization': f'Bearer {tokens["refresh"]}'}).status_code == 401
+
+
+def test_logout_with_a_bad_refresh_token_revokes_nothing(app, client):
+    tokens = _login(client)
+    headers = {'Authorization': f'Bearer {tokens["access"]}'}
+    response = client.post('/api/v1/auth/logout', json={'refresh_token':'not a token'}, headers=headers)
+
+    assert response.status_code == 400
+    assert client.get('/api/v1/auth/me', headers=headers).status_code == 200
+    with app.app_context():
+        assert db.session.query(RevokedToken).count() == 0
+
+
+def test_revoke_rejects_a_jti_longer_than_the_column(app, client):
+    with app.app_context():
+        admin = {'Authorization': f'Bearer {create_access_token(identity=1, additional_claims={"admin":True})}'}
+    response = client.post('/api/v1/auth/revoke', json={'jti':'x' * 37}, headers=admin)
+    assert response.status_code == 400
+
+    assert client.post('/api/v1/auth/revoke', json={'jti':'x' * 36}, headers=admin).status_code == 200
+    # Revoking it again is not an error
+    assert client.post('/api/v1/auth/revoke', json={'jti':'x' * 36}, headers=admin).status_code == 200
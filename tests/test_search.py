@@ -0,0 +1,58 @@
+from sqlalchemy import text
+
+from conftest import register
+from src.database import db
+
+
+def _pages(client, headers, q, between=None):
+    ids, cursor = [], ''
+    while True:
+        response = client.get(f'/api/v1/prescription/search?q={q}&limit=2&cursor={cursor}', headers=headers)
+        assert response.status_code == 200, response.json
+        ids += [row['id'] for row in response.json['data']]
+        cursor = response.json['meta']['next_cursor']
+        if not cursor:
+            return ids
+        if between:
+            between()
+
+
+def test_pages_do_not_depend_on_the_scores(client, headers):
+    for i in range(7):
+        client.post('/api/v1/prescription/', json={'title':f'amoxicilina {i}', 'body':'tomar ' * i}, headers=headers)
+    other = register(client, 'bob')
+
+    def insert_for_other_user():
+        # Changes the statistics of the index, so the scores of every row
+        client.post('/api/v1/prescription/', json={'title':'amoxicilina amoxicilina', 'body':'amoxicilina'}, headers=other)
+
+    ids = _pages(client, headers, 'amoxicilina', insert_for_other_user)
+    assert sorted(ids) == list(range(1, 8))
+
+
+def test_cursor_of_another_search_is_rejected(client, headers):
+    for i in range(3):
+        client.post('/api/v1/prescription/', json={'title':f'ibuprofeno {i}'}, headers=headers)
+    cursor = client.get('/api/v1/prescription/search?q=ibuprofeno&limit=1', headers=headers).json['meta']['next_cursor']
+
+    response = client.get(f'/api/v1/prescription/search?q=other&cursor={cursor}', headers=headers)
+    assert response.status_code == 400
+
+
+def test_index_is_partitioned_by_owner(app, client, headers):
+    client.post('/api/v1/prescription/', json={'title':'Amoxicilina', 'body':'cada ocho horas'}, headers=headers)
+    other = register(client, 'bob')
+    client.post('/api/v1/prescription/', json={'title':'amoxicilina', 'body':'cada doce horas'}, headers=other)
+
+    with app.app_context():
+        match = lambda query: db.session.execute(
+            text('SELECT rowid FROM prescription_fts WHERE prescription_fts MATCH :query ORDER BY rowid'), {'query':query}).scalars().all()
+        # The words of a user only match the searches of that user
+        assert match('"u1xamox"*') == [1]
+        assert match('"u2xamox"*') == [2]
+        assert match('amoxicilina') == []
+        db.session.execute(text("INSERT INTO prescription_fts(prescription_fts) VALUES ('integrity-check')"))
+
+    response = client.get('/api/v1/prescription/search?q=amox+ocho', headers=headers)
+    assert [row['id'] for row in response.json['data']] == [1]
+    assert client.get('/api/v1/prescription/search?q=doce', headers=headers).json['data'] == []
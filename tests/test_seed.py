@@ -0,0 +1,44 @@
+import random
+
+from src.commands.seed import sample
+from src.database import db
+from src.models.patient import Patient
+from src.models.prescription import Prescription
+
+
+def _seed(app, *args):
+    result = app.test_cli_runner().invoke(args=['seed', '--distribution', 'fixed', '--random-seed', '1', *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_seed_can_run_twice_over_the_same_database(app):
+    output = _seed(app, '--patients', '5', '--prescriptions', '3', '--chunk-size', '4')
+    assert 'Inserted 5 patients and 15 prescriptions' in output
+    _seed(app, '--patients', '2', '--prescriptions', '3')
+
+    with app.app_context():
+        assert db.session.query(Patient).count() == 7
+        assert db.session.query(Prescription).count() == 21
+        # The numbers continue after the last patient
+        assert sorted(username for username, in db.session.query(Patient.username))[-1] == 'seed7'
+
+
+def test_seeded_patients_can_log_in_and_search(app, client):
+    _seed(app, '--patients', '2', '--prescriptions', '4', '--password', 'seed-secret')
+    response = client.post('/api/v1/auth/login', json={'email':'seed1@seed.test', 'password':'seed-secret'})
+    assert response.status_code == 200
+    headers = {'Authorization': f'Bearer {response.json["user"]["access"]}'}
+
+    first = client.get('/api/v1/prescription/?limit=1&fields=title', headers=headers).json['data'][0]
+    found = client.get(f'/api/v1/prescription/search?q={first["title"]}&limit=10', headers=headers).json['data']
+    assert first['id'] in [row['id'] for row in found]
+
+
+def test_sample_distributions():
+    rng = random.Random(1)
+    assert sample(rng, 'fixed', 7) == 7
+    assert all(0 <= sample(rng, 'uniform', 5) <= 10 for _ in range(100))
+    values = [sample(rng, 'exponential', 10) for _ in range(2000)]
+    assert 8 < sum(values) / len(values) < 12
+    assert sample(rng, 'exponential', 0) == 0
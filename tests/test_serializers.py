@@ -0,0 +1,41 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from src.utils.json_provider import OrjsonProvider, make_json_provider
+from src.utils.serializers import InvalidFields, prescription_serializer
+
+URL = '/api/v1/prescription/'
+
+
+def test_sparse_fields_skip_the_unasked_columns(client, headers, statements):
+    client.post(URL, json={'title':'ibuprofeno', 'body':'cada ocho horas'}, headers=headers)
+    statements.clear()
+    response = client.get(f'{URL}?limit=5&fields=title', headers=headers)
+
+    assert response.json['data'] == [{'id':1, 'title':'ibuprofeno'}]
+    page = [statement for statement in statements if 'FROM prescription' in statement]
+    assert len(page) == 1 and 'prescription.body' not in page[0]
+
+
+def test_parse_fields_keeps_the_order_and_the_id():
+    assert prescription_serializer.parse_fields('body, title') == ('id', 'title', 'body')
+    assert prescription_serializer.parse_fields('') == prescription_serializer.fields
+    with pytest.raises(InvalidFields):
+        prescription_serializer.parse_fields('title,password')
+
+
+def test_unknown_field_is_rejected(client, headers):
+    assert client.get(f'{URL}?fields=password', headers=headers).status_code == 400
+
+
+def test_orjson_gives_the_same_json_as_the_default_provider(app):
+    if not isinstance(app.json, OrjsonProvider):
+        pytest.skip('orjson is not installed')
+    app.config['JSON_PROVIDER'] = 'default'
+    default = make_json_provider(app)
+    payload = {'title':'Amoxicilina 500 mg, vía oral', 'created_at':datetime(2024, 1, 31, 8, 30), 'ids':[1, 2], 'none':None}
+
+    assert json.loads(app.json.dumps(payload)) == json.loads(default.dumps(payload))
+    assert app.json.dumps(payload) == default.dumps(payload, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from src.database import db, register_sqlite_functions
+from src.migrations.runner import upgrade
+from src.models.types import compress_text
+
+
+@pytest.fixture
+def config(config):
+    return {**config, 'PRESCRIPTION_BODY_COMPRESS_MIN_BYTES':256}
+
+
+def test_compressed_bodies_are_found_by_the_search(app, client, headers):
+    body = 'tomar una tableta cada ocho horas ' * 40
+    created = client.post('/api/v1/prescription/', json={'title':'ibuprofeno', 'body':body}, headers=headers)
+
+    with app.app_context():
+        stored = db.session.execute(text('SELECT body FROM prescription WHERE id = :id'), {'id':created.json['id']}).scalar()
+        assert len(stored) < len(body)
+        db.session.execute(text("INSERT INTO prescription_fts(prescription_fts) VALUES ('integrity-check')"))
+
+    response = client.get('/api/v1/prescription/search?q=tableta', headers=headers)
+    assert [row['id'] for row in response.json['data']] == [created.json['id']]
+    assert client.get(f'/api/v1/prescription/{created.json["id"]}', headers=headers).json['body'] == body
+
+
+def test_edited_and_deleted_compressed_bodies_leave_the_index(app, client, headers):
+    created = client.post('/api/v1/prescription/', json={'title':'a', 'body':'jarabe ' * 100}, headers=headers)
+    url = f'/api/v1/prescription/{created.json["id"]}'
+
+    client.put(url, json={'title':'a', 'body':'crema ' * 100}, headers=headers)
+    assert client.get('/api/v1/prescription/search?q=jarabe', headers=headers).json['data'] == []
+    assert len(client.get('/api/v1/prescription/search?q=crema', headers=headers).json['data']) == 1
+
+    client.delete(url, headers=headers)
+    assert client.get('/api/v1/prescription/search?q=crema', headers=headers).json['data'] == []
+    with app.app_context():
+        db.session.execute(text("INSERT INTO prescription_fts(prescription_fts) VALUES ('integrity-check')"))
+
+
+def test_migration_indexes_the_bodies_compressed_before_it(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    event.listen(engine, 'connect', register_sqlite_functions)
+    upgrade(engine, target=7)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO patient (id, username, email, password) VALUES (1, 'a', 'a@example.com', 'x')"))
+        connection.execute(text("INSERT INTO prescription (id, title, body, user_id) VALUES (1, 'a', :body, 1)"),
+                           {'body':compress_text('jarabe para la tos ' * 50, 1)})
+
+    upgrade(engine, target=8)
+    with engine.begin() as connection:
+        assert connection.execute(text("SELECT rowid FROM prescription_fts WHERE prescription_fts MATCH 'jarabe'")).scalars().all() == [1]
+        connection.execute(text("INSERT INTO prescription_fts(prescription_fts) VALUES ('integrity-check')"))
+    engine.dispose()